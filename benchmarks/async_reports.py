@@ -0,0 +1,133 @@
+# benchmarks/async_reports.py
+"""Report latency: the sync view's query path against the ASGI profile's async path.
+
+Every statement gets a fixed network delay (``--latency-ms``) added on the
+client side. This models a database that is far away even when the
+benchmark runs on a local SQLite file. The cache is bypassed and each report
+is computed from scratch. The script prints p50/p95 for both paths next to
+the slowest single query and the sum of all queries. The async p50 should
+stay close to the slowest single query.
+
+    python -m benchmarks.async_reports --rows 100000 --latency-ms 20
+    BENCH_DATABASE_URL=postgres://... python -m benchmarks.async_reports --latency-ms 0
+"""
+import argparse
+import json
+import statistics
+import time
+from contextlib import contextmanager
+from unittest import mock
+
+from benchmarks.common import load_expenses, load_reference_data, setup_django, truncate_expenses
+
+PARAMS = {'year': '2020'}
+
+
+@contextmanager
+def added_latency(seconds):
+    from django.db.backends.utils import CursorWrapper
+
+    execute = CursorWrapper._execute
+
+    def slow_execute(self, *args, **kwargs):
+        time.sleep(seconds)
+        return execute(self, *args, **kwargs)
+
+    with mock.patch.object(CursorWrapper, '_execute', slow_execute):
+        yield
+
+
+def samples(fn, repeat):
+    fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def summarise(timings):
+    timings = sorted(timings)
+    return {
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+    }
+
+
+def single_queries():
+    from books import facets
+    from books.reports import ReportQuery
+
+    query = ReportQuery(year=int(PARAMS['year']))
+    return {
+        'series': lambda: list(query.series_queryset()),
+        'tickets': lambda: list(query.tickets_queryset()),
+        'categories': lambda: list(query.categories_queryset()),
+        'facets (month, year)': facets._month_and_year_options,
+        'facets (category)': facets._category_options,
+    }
+
+
+def run(rows, repeat, latency_ms):
+    from asgiref.sync import async_to_sync
+    from django.test import RequestFactory
+    from books.rollups import rebuild_monthly_rollups
+    from books.views import _areport_context, _report_context
+
+    truncate_expenses()
+    load_expenses(rows)
+    rebuild_monthly_rollups()
+    request = RequestFactory().get('/reports/', PARAMS)
+
+    with added_latency(latency_ms / 1000):
+        queries = {name: summarise(samples(fn, repeat)) for name, fn in single_queries().items()}
+        sync = summarise(samples(lambda: _report_context(request), repeat))
+        concurrent = summarise(samples(lambda: async_to_sync(_areport_context)(request), repeat))
+
+    return {
+        'rows': rows,
+        'latency_ms': latency_ms,
+        'queries': queries,
+        'slowest_query_p50_ms': max(q['p50_ms'] for q in queries.values()),
+        'sum_of_queries_p50_ms': round(sum(q['p50_ms'] for q in queries.values()), 2),
+        'sync': sync,
+        'async': concurrent,
+    }
+
+
+def print_report(result):
+    print(f"\n=== {result['rows']:,} expenses, +{result['latency_ms']} ms per query ===")
+    for name, timing in result['queries'].items():
+        print(f"{name:<24}{timing['p50_ms']:>10.2f} ms")
+    print(f"{'slowest single query':<24}{result['slowest_query_p50_ms']:>10.2f} ms")
+    print(f"{'sum of queries':<24}{result['sum_of_queries_p50_ms']:>10.2f} ms")
+    for name in ('sync', 'async'):
+        print(f"{name + ' report':<24}{result[name]['p50_ms']:>10.2f} ms p50 {result[name]['p95_ms']:>10.2f} ms p95")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000])
+    parser.add_argument('--repeat', type=int, default=21)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    url = setup_django()
+    print(f"Database: {url.split('@')[-1]}")
+    load_reference_data()
+
+    results = []
+    for rows in args.rows:
+        result = run(rows, args.repeat, args.latency_ms)
+        print_report(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
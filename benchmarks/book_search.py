@@ -0,0 +1,141 @@
+# benchmarks/book_search.py
+"""Full-text book search against the ILIKE scans it replaces, at 100k and 1M books.
+
+Books are generated server-side from a fixed vocabulary, so every run
+searches the same catalogue. At each size three ways of searching are timed
+(median ms, first 20 results):
+
+* ``admin_ilike``: the admin's old ``search_fields = ('title',)``, i.e.
+  ``title ILIKE '%q%'`` in the default ``-published_date`` order.
+* ``ilike_all_fields``: the same scan over title, subtitle, author,
+  publisher and category (the non-FTS fallback in ``books.search``).
+* ``fts``: ``search_books``, which uses ``tsvector`` + GIN on PostgreSQL
+  and FTS5 on SQLite.
+
+The time to build the search index for the whole catalogue is also reported.
+
+    python -m benchmarks.book_search --books 100000 1000000
+    BENCH_DATABASE_URL=postgres://... python -m benchmarks.book_search --books 100000 1000000
+"""
+import argparse
+import json
+import time
+
+from benchmarks.common import analyze, setup_django, time_call
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ran', 'te', 'vo', 'shi', 'dur', 'ben', 'po', 'qua', 'zel']
+VOCABULARY = [
+    SYLLABLES[i % 12] + SYLLABLES[(i // 12) % 12] + SYLLABLES[(i // 144) % 12] for i in range(400)
+]
+AUTHORS = 2000
+PUBLISHERS = 50
+CATEGORIES = 20
+QUERIES = {
+    'one_word': VOCABULARY[5],
+    'two_words': f"{VOCABULARY[5]} {VOCABULARY[40]}",
+    'author_and_title': f"{VOCABULARY[3]} {VOCABULARY[12]}",
+}
+
+
+def load_reference_data():
+    from books.models import Author, Category, Publisher
+
+    Author.objects.bulk_create(
+        [Author(name=f"{VOCABULARY[i % 400]} {VOCABULARY[(i * 7) % 400]}") for i in range(AUTHORS)],
+        batch_size=1000,
+    )
+    Publisher.objects.bulk_create([Publisher(name=f"{VOCABULARY[i * 3]} Press") for i in range(PUBLISHERS)])
+    Category.objects.bulk_create([Category(name=f"{VOCABULARY[i * 11]} Studies") for i in range(CATEGORIES)])
+
+
+def load_books(total):
+    """Grow the catalogue to ``total`` books with one INSERT ... SELECT."""
+    from django.db import connection, transaction
+    from books.models import Author, Book, Category, Publisher
+
+    start = Book.objects.count()
+    if start >= total:
+        return
+
+    def first_id(model):
+        return model.objects.order_by('id').values_list('id', flat=True).first()
+
+    author0, publisher0, category0 = first_id(Author), first_id(Publisher), first_id(Category)
+    word = "(SELECT word FROM bench_words WHERE i = ({expr}) % 400)"
+    title = " || ' ' || ".join(word.format(expr=f"g * {k}") for k in (7, 13, 31))
+    subtitle = " || ' ' || ".join(word.format(expr=f"g * {k}") for k in (17, 19))
+    columns = f"""
+        {title}, {subtitle}, {author0} + (g * 7919) % {AUTHORS},
+        {publisher0} + (g * 13) % {PUBLISHERS}, {category0} + (g * 31) % {CATEGORIES}, 0
+    """
+    insert = "INSERT INTO books_book (title, subtitle, author_id, publisher_id, category_id, distribution_expense)"
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("CREATE TEMPORARY TABLE bench_words (i integer PRIMARY KEY, word text)")
+        cursor.executemany("INSERT INTO bench_words (i, word) VALUES (%s, %s)", list(enumerate(VOCABULARY)))
+        if connection.vendor == 'postgresql':
+            cursor.execute(f"{insert} SELECT {columns} FROM generate_series({start + 1}, {total}) AS g")
+        else:
+            cursor.execute(f"""
+                WITH RECURSIVE seq(g) AS (SELECT {start + 1} UNION ALL SELECT g + 1 FROM seq WHERE g < {total})
+                {insert} SELECT {columns} FROM seq
+            """)
+        cursor.execute("DROP TABLE bench_words")
+    analyze()
+
+
+def run(total, repeat):
+    from books.models import Book
+    from books.search import ilike_search, reindex_books, search_backend, search_books
+
+    load_books(total)
+    started = time.perf_counter()
+    reindex_books()
+    index_seconds = time.perf_counter() - started
+    analyze()
+
+    timings = {}
+    for name, text in QUERIES.items():
+        timings[name] = {
+            'admin_ilike': time_call(lambda: list(Book.objects.filter(title__icontains=text.split()[0])[:20]), repeat),
+            'ilike_all_fields': time_call(lambda: ilike_search(text, 20), repeat),
+            'fts': time_call(lambda: search_books(text, 20), repeat),
+            'fts_results': len(search_books(text, 20)),
+        }
+    return {
+        'books': total,
+        'backend': search_backend() or 'ilike',
+        'index_build_s': round(index_seconds, 2),
+        'queries': timings,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--books', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    url = setup_django()
+    print(f"Database: {url.split('@')[-1]}")
+    load_reference_data()
+
+    results = []
+    for total in sorted(args.books):
+        result = run(total, args.repeat)
+        print(f"\n{total:,} books ({result['backend']}), index built in {result['index_build_s']:.2f}s")
+        print(f"{'query':<18}{'admin ILIKE':>14}{'ILIKE 5 fields':>16}{'FTS':>10}{'speed-up':>10}")
+        for name, timing in result['queries'].items():
+            speedup = timing['ilike_all_fields'] / timing['fts'] if timing['fts'] else float('inf')
+            print(f"{name:<18}{timing['admin_ilike']:>12.1f}ms{timing['ilike_all_fields']:>14.1f}ms"
+                  f"{timing['fts']:>8.1f}ms{speedup:>9.0f}x")
+        results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# benchmarks/bulk_expenses.py
+"""Sustained throughput of the bulk expense API (``/api/expenses/bulk/``).
+
+Posts ``--requests`` NDJSON bodies of ``--rows`` expenses each through the
+real view, authenticated as a staff user, and reports rows per second
+over the whole run. Body encoding happens before the clock starts.
+
+Card feeds arrive dated within the last few days, so rows are spread over
+``--days`` days (default 7); ``--days 3650`` spreads them over ten years,
+which touches a new monthly rollup row for almost every expense.
+
+    python -m benchmarks.bulk_expenses --rows 10000 --requests 10
+    python -m benchmarks.bulk_expenses --days 3650
+"""
+import argparse
+import json
+import time
+from datetime import timedelta
+
+from benchmarks.common import BENCH_START_DATE, load_reference_data, setup_django
+
+
+def ndjson_body(rows, first, days):
+    from django.contrib.auth.models import User
+    from books.models import Book, ExpenseType
+
+    def ids(model):
+        return list(model.objects.order_by('id').values_list('id', flat=True))
+
+    users, books, types = ids(User), ids(Book), ids(ExpenseType)
+    lines = []
+    for g in range(first, first + rows):
+        lines.append(json.dumps({
+            'external_id': f"bench-{g}",
+            'date': (BENCH_START_DATE + timedelta(days=(g * 15485863) % days)).isoformat(),
+            'user_id': users[(g * 31) % len(users)],
+            'book_id': books[(g * 7919) % len(books)],
+            'expense_type_id': types[(g * 13) % len(types)],
+            'amount': f"{((g * 104729) % 100000) / 100 + 1:.2f}",
+        }))
+    return ("\n".join(lines) + "\n").encode()
+
+
+def run(rows, requests, days):
+    from django.contrib.auth.models import User
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from books.models import Expense
+    from books.views import expense_bulk_create_view
+
+    staff = User.objects.create(username=f"bench-staff-{time.time_ns()}", is_staff=True)
+    factory = APIRequestFactory()
+    first = Expense.objects.count() + 1
+    bodies = [ndjson_body(rows, first + i * rows, days) for i in range(requests)]
+
+    started = time.perf_counter()
+    for body in bodies:
+        request = factory.post('/api/expenses/bulk/', body, content_type='application/x-ndjson')
+        force_authenticate(request, user=staff)
+        response = expense_bulk_create_view(request)
+        assert response.status_code == 201, response.data
+    seconds = time.perf_counter() - started
+    total = rows * requests
+    return {'rows_per_request': rows, 'requests': requests, 'days': days, 'seconds': round(seconds, 3),
+            'rows_per_s': round(total / seconds)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000, help='Expenses per request')
+    parser.add_argument('--requests', type=int, default=10)
+    parser.add_argument('--days', type=int, default=7, help='Spread expense dates over this many days')
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    url = setup_django()
+    print(f"Database: {url.split('@')[-1]}")
+    load_reference_data()
+
+    result = run(args.rows, args.requests, args.days)
+    print(f"{result['requests']} × {result['rows_per_request']:,} rows in {result['seconds']:.2f}s — "
+          f"{result['rows_per_s']:,} rows/s")
+
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump(result, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+# benchmarks/end_to_end.py
+"""End-to-end timings of the main views and ``import_books`` on seeded data.
+
+A scratch database is filled by ``myproject.seed_expenses`` at the chosen
+scale. Each scenario then runs in-process through Django's test client, so
+the full middleware stack is included, and bodies are streamed to the end.
+The report and summary exports run twice: ``cold`` clears the report cache
+before each call, and ``cached`` serves hits. The dashboard is loaded by
+the busiest user. ``import_books`` imports a freshly generated catalogue
+file of ``books / 10`` rows on every call.
+
+For every scenario the results hold median, p95 and minimum milliseconds,
+plus the query count and body size of one call. Write them out with
+``--json``. A later run with ``--compare`` against that file reports every
+scenario whose median grew by more than ``--tolerance``, and exits with
+status 1 if there are any.
+
+    python -m benchmarks.end_to_end --scale 10k --json baseline.json
+    python -m benchmarks.end_to_end --scale 10k --compare baseline.json
+    BENCH_DATABASE_URL=postgres://... python -m benchmarks.end_to_end --scale 1m --skip export_xlsx_rows
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.common import analyze, setup_django
+
+TICKET_SORT_MAX = 100_000
+
+
+def measure(fn, repeat):
+    """Warm up once, then time ``repeat`` calls of ``fn``."""
+    fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'median_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+        'min_ms': round(timings[0], 2),
+    }
+
+
+def count_queries(fn):
+    """Call ``fn`` once; return its result and how many SQL statements it ran."""
+    from django.db import connection
+
+    executed = []
+
+    def counter(execute, sql, params, many, context):
+        executed.append(sql)
+        return execute(sql, params, many, context)
+
+    # Not CaptureQueriesContext: the test client's request_started signal resets the query log.
+    with connection.execute_wrapper(counter):
+        return fn(), len(executed)
+
+
+def consume(response):
+    """Read the whole body, as a server would; remember its size on the response."""
+    body = response.streaming_content if response.streaming else [response.content]
+    response.body_bytes = sum(len(chunk) for chunk in body)
+    return response
+
+
+def write_catalogue(path, count, offset):
+    from myproject.seed_expenses import CATEGORIES, PUBLISHER_NAMES, TITLE_WORDS
+
+    with open(path, 'w', newline='', encoding='utf-8') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(['title', 'subtitle', 'authors', 'publisher', 'published_date', 'category',
+                         'distribution_expense'])
+        for g in range(offset, offset + count):
+            writer.writerow([
+                f"{TITLE_WORDS[g % 25]} {TITLE_WORDS[(g * 7) % 25]} {g}", 'An Introduction',
+                f"Imported Author {g % 997}", PUBLISHER_NAMES[g % len(PUBLISHER_NAMES)],
+                f"{1 + g % 12:02d}/{1 + g % 28:02d}/{1990 + g % 35}", CATEGORIES[g % len(CATEGORIES)],
+                f"{1 + g % 2000 / 100:.2f}",
+            ])
+
+
+def scenarios(sizes, workdir):
+    """``{name: fn}``; each ``fn`` makes one call and returns the response, or ``None`` for commands."""
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.db.models import Count
+    from django.test import Client
+    from books.models import Ticket
+    from books.report_cache import report_cache
+
+    client = Client(SERVER_NAME='localhost')
+    busiest = User.objects.annotate(expenses=Count('expense')).order_by('-expenses').first()
+    user_client = Client(SERVER_NAME='localhost')
+    user_client.force_login(busiest)
+
+    tickets = json.dumps([
+        {'id': pk, 'priority': priority, 'timestamp': created.isoformat()}
+        for pk, priority, created in Ticket.objects.values_list('id', 'priority', 'created_at')[:TICKET_SORT_MAX]
+    ])
+
+    def get(path, params=None, cold=False, http=client):
+        def call():
+            if cold:
+                report_cache().clear()
+            return consume(http.get(path, params or {}))
+        return call
+
+    catalogue_rows = max(100, sizes['books'] // 10)
+    imports = iter(range(10**9))
+
+    def import_books():
+        path = os.path.join(workdir, 'catalogue.csv')
+        write_catalogue(path, catalogue_rows, next(imports) * catalogue_rows)
+        call_command('import_books', path, verbosity=0, stdout=io.StringIO())
+
+    return {
+        'report_cold': get('/reports/', {'year': '2025'}, cold=True),
+        'report_cached': get('/reports/', {'year': '2025'}),
+        'export_csv_cold': get('/reports/export/', cold=True),
+        'export_csv_cached': get('/reports/export/'),
+        'export_csv_rows': get('/reports/export/', {'mode': 'rows', 'year': '2025'}),
+        'export_xlsx_cold': get('/reports/export/xlsx/', cold=True),
+        'export_xlsx_rows': get('/reports/export/xlsx/', {'mode': 'rows', 'year': '2025'}),
+        'dashboard': get('/dashboard/', http=user_client),
+        'ticket_sort': lambda: consume(client.post('/sort-tickets/', tickets, content_type='application/json')),
+        'import_books': import_books,
+    }
+
+
+def run(scale, seed, repeat, skip):
+    from django.db import connection
+    from myproject.seed_expenses import SCALES, seed as seed_data
+
+    print(f"Seeding {scale} ...")
+    sizes = seed_data(SCALES[scale], seed, log=lambda message: None)
+    analyze()
+    print(f"  {sizes['expenses']:,} expenses, {sizes['tickets']:,} tickets in {sizes['seconds']:.1f}s")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, fn in scenarios(sizes, workdir).items():
+            if name in skip:
+                continue
+            response, queries = count_queries(fn)
+            result = measure(fn, repeat)
+            result['queries'] = queries
+            if response is not None:
+                result['status'] = response.status_code
+                result['bytes'] = response.body_bytes
+            results[name] = result
+            print(f"  {name:<20}{result['median_ms']:>10.1f} ms median{result['p95_ms']:>10.1f} ms p95"
+                  f"{result['queries']:>6} queries")
+
+    return {
+        'scale': scale,
+        'seed': seed,
+        'sizes': sizes,
+        'database': connection.vendor,
+        'python': platform.python_version(),
+        'repeat': repeat,
+        'scenarios': results,
+    }
+
+
+def compare(current, baseline, tolerance):
+    """Print median changes against ``baseline``; return the names of scenarios that regressed."""
+    if (baseline.get('scale'), baseline.get('database')) != (current['scale'], current['database']):
+        print(f"⚠️ Baseline is {baseline.get('scale')} on {baseline.get('database')}; comparing anyway.")
+    regressed = []
+    print(f"\n{'scenario':<20}{'baseline':>12}{'now':>12}{'change':>10}")
+    for name, result in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        change = result['median_ms'] / before['median_ms'] - 1 if before['median_ms'] else 0
+        flag = ''
+        if change > tolerance:
+            regressed.append(name)
+            flag = '  ❌ regression'
+        print(f"{name:<20}{before['median_ms']:>10.1f}ms{result['median_ms']:>10.1f}ms{change:>+10.0%}{flag}")
+    return regressed
+
+
+def main():
+    from myproject.seed_expenses import DEFAULT_SEED, SCALES
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=SCALES, default='10k')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--skip', nargs='*', default=[], help='Scenario names to leave out')
+    parser.add_argument('--json', help='Write the results to this file')
+    parser.add_argument('--compare', help='A previous --json file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed growth of a median before it counts as a regression (default 25%%)')
+    args = parser.parse_args()
+
+    # Keep the per-request JSON log lines out of the report.
+    os.environ.setdefault('REQUEST_METRICS_SAMPLE_RATE', '0')
+    url = setup_django()
+    print(f"Database: {url.split('@')[-1]}")
+
+    result = run(args.scale, args.seed, args.repeat, set(args.skip))
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump(result, handle, indent=2)
+
+    if args.compare:
+        with open(args.compare) as handle:
+            regressed = compare(result, json.load(handle), args.tolerance)
+        if regressed:
+            print(f"\n❌ {len(regressed)} scenario(s) regressed by more than {args.tolerance:.0%}.")
+            sys.exit(1)
+        print("\n✅ No regressions.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+# benchmarks/expense_filters.py
+"""Before/after benchmark for the expense filter path.
+
+"Before" is the original ``date__month``/``date__year`` filtering with only
+the foreign-key indexes; "after" is ``books.views._filter_expenses`` with
+the half-open date ranges and the composite indexes from ``Expense.Meta``.
+
+    python -m benchmarks.expense_filters --rows 1000000 10000000
+    BENCH_DATABASE_URL=postgres://... python -m benchmarks.expense_filters --rows 1000000
+"""
+import argparse
+import json
+from datetime import datetime
+
+from benchmarks.common import (
+    analyze, load_expenses, load_reference_data, setup_django, time_call, truncate_expenses,
+)
+
+
+def legacy_filter(params):
+    from books.models import Expense
+
+    qs = Expense.objects.select_related('book__category')
+    if params.get('month'):
+        qs = qs.filter(date__month=datetime.strptime(params['month'], '%B').month)
+    if params.get('category'):
+        qs = qs.filter(book__category__name__iexact=params['category'])
+    if params.get('year'):
+        qs = qs.filter(date__year=int(params['year']))
+    return qs
+
+
+def current_filter(params):
+    from django.test import RequestFactory
+    from books.views import _filter_expenses
+
+    qs, *_ = _filter_expenses(RequestFactory().get('/reports/', params))
+    return qs
+
+
+def aggregate_monthly(qs):
+    from django.db.models import Sum
+    from django.db.models.functions import ExtractMonth, ExtractYear
+
+    return qs.annotate(
+        month=ExtractMonth('date'), year=ExtractYear('date')
+    ).values('month', 'year').annotate(total=Sum('amount')).order_by('year', 'month')
+
+
+def report_queries(build_filter):
+    cases = {
+        'year': {'year': '2020'},
+        'month+year': {'month': 'March', 'year': '2020'},
+        'month (all years)': {'month': 'March'},
+        'category+year': {'category': 'Category 3', 'year': '2020'},
+    }
+    return {name: aggregate_monthly(build_filter(params)) for name, params in cases.items()}
+
+
+def dashboard_query():
+    from django.contrib.auth.models import User
+    from books.models import Expense
+
+    user_id = User.objects.order_by('id').values_list('id', flat=True)[7]
+    return Expense.objects.filter(user_id=user_id).order_by('-date')[:10]
+
+
+def set_filter_indexes(enabled):
+    from django.db import connection
+    from books.models import Expense
+
+    with connection.schema_editor() as editor:
+        for index in Expense._meta.indexes:
+            if enabled:
+                editor.add_index(Expense, index)
+            else:
+                editor.remove_index(Expense, index)
+    analyze()
+
+
+def measure(queries, repeat):
+    results = {}
+    for name, qs in queries.items():
+        results[name] = {
+            'ms': round(time_call(lambda: list(qs.all()), repeat), 2),
+            'plan': qs.explain(),
+        }
+    return results
+
+
+def run(rows, repeat):
+    truncate_expenses()
+    load_expenses(rows)
+
+    set_filter_indexes(False)
+    before = measure({**report_queries(legacy_filter), 'dashboard': dashboard_query()}, repeat)
+
+    set_filter_indexes(True)
+    after = measure({**report_queries(current_filter), 'dashboard': dashboard_query()}, repeat)
+
+    return {'rows': rows, 'before': before, 'after': after}
+
+
+def print_report(result):
+    print(f"\n=== {result['rows']:,} expenses ===")
+    print(f"{'query':<20}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for name, before in result['before'].items():
+        after = result['after'][name]
+        speedup = before['ms'] / after['ms'] if after['ms'] else float('inf')
+        print(f"{name:<20}{before['ms']:>12.2f}{after['ms']:>12.2f}{speedup:>9.1f}x")
+    for name, before in result['before'].items():
+        print(f"\n--- {name} ---\nbefore:\n{before['plan']}\nafter:\n{result['after'][name]['plan']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000, 10_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    url = setup_django()
+    print(f"Database: {url.split('@')[-1]}")
+    load_reference_data()
+
+    results = []
+    for rows in args.rows:
+        result = run(rows, args.repeat)
+        print_report(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# benchmarks/exports.py
+"""Throughput and peak-memory benchmark for the export views.
+
+Each export is driven through the real view with ``RequestFactory`` and
+its body is consumed chunk by chunk, as a WSGI server would. Each export
+runs in a forked child; peak memory is how far that child's max RSS grew
+above what it inherited.
+
+    python -m benchmarks.exports --rows 10000 100000 1000000
+"""
+import argparse
+import json
+import multiprocessing
+import resource
+import time
+
+from benchmarks.common import load_expenses, load_reference_data, setup_django, truncate_expenses
+
+
+def consume(response, started):
+    """Drain a response; return (bytes, seconds from ``started`` to the first non-empty chunk)."""
+    first_byte = None
+    size = 0
+    body = response.streaming_content if response.streaming else [response.content]
+    for chunk in body:
+        if chunk and first_byte is None:
+            first_byte = time.perf_counter() - started
+        size += len(chunk)
+    return size, first_byte
+
+
+def _measure_in_child(view, params, pipe):
+    from django.test import RequestFactory
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    response = view(RequestFactory().get('/reports/export/', params))
+    size, first_byte = consume(response, started)
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    pipe.send({
+        'seconds': round(elapsed, 3),
+        'first_byte_ms': round(first_byte * 1000, 2) if first_byte is not None else None,
+        'bytes': size,
+        'peak_mib': round((peak - baseline) / 1024, 2),
+    })
+
+
+def measure_export(view, params):
+    """Run one export in a forked child so its peak RSS growth can be measured in isolation."""
+    from django.db import connections
+
+    connections.close_all()
+    parent_end, child_end = multiprocessing.Pipe()
+    child = multiprocessing.get_context('fork').Process(target=_measure_in_child, args=(view, params, child_end))
+    child.start()
+    result = parent_end.recv()
+    child.join()
+    return result
+
+
+def exports():
+    from books import views
+
+    return {
+        'csv rows': (views.export_report_csv, {'mode': 'rows'}),
+        'xlsx rows': (views.export_report_xlsx, {'mode': 'rows'}),
+    }
+
+
+def run(rows):
+    truncate_expenses()
+    load_expenses(rows)
+
+    results = {}
+    for name, (view, params) in exports().items():
+        result = measure_export(view, params)
+        result['rows_per_s'] = round(rows / result['seconds']) if result['seconds'] else None
+        results[name] = result
+    return {'rows': rows, 'exports': results}
+
+
+def print_report(result):
+    print(f"\n=== {result['rows']:,} expenses ===")
+    print(f"{'export':<16}{'seconds':>10}{'first byte ms':>15}{'rows/s':>12}{'MiB out':>10}{'peak MiB':>10}")
+    for name, r in result['exports'].items():
+        print(
+            f"{name:<16}{r['seconds']:>10.2f}{r['first_byte_ms'] or 0:>15.1f}"
+            f"{r['rows_per_s'] or 0:>12,}{r['bytes'] / 2**20:>10.1f}{r['peak_mib']:>10.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 1_000_000])
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    url = setup_django()
+    print(f"Database: {url.split('@')[-1]}")
+    load_reference_data()
+
+    results = []
+    for rows in args.rows:
+        result = run(rows)
+        print_report(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# benchmarks/ingest.py
+"""Throughput benchmark for ``books.ingest.ingest_expenses``.
+
+Writes an N-row expense CSV that references the benchmark users, books and
+expense types by name, loads it into an empty table, then loads it again so
+every row takes the upsert path. On PostgreSQL the COPY path is compared
+with the bulk_create fallback (``--orm``).
+
+    python -m benchmarks.ingest --rows 100000 1000000
+"""
+import argparse
+import csv
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+
+from benchmarks.common import BENCH_DAYS, BENCH_START_DATE, load_reference_data, setup_django, truncate_expenses
+
+
+def write_expense_csv(rows):
+    """Write ``rows`` deterministic expense rows to a temporary CSV file and return its path."""
+    from django.contrib.auth.models import User
+    from books.models import Book, ExpenseType
+
+    users = list(User.objects.order_by('id').values_list('username', flat=True))
+    books = list(Book.objects.order_by('id').values_list('title', flat=True))
+    types = list(ExpenseType.objects.order_by('id').values_list('name', flat=True))
+
+    handle = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, newline='')
+    with handle:
+        writer = csv.writer(handle)
+        writer.writerow(['external_id', 'date', 'user', 'book', 'expense_type', 'amount'])
+        for g in range(1, rows + 1):
+            writer.writerow([
+                f"bench-{g}",
+                BENCH_START_DATE + timedelta(days=(g * 15485863) % BENCH_DAYS),
+                users[(g * 31) % len(users)],
+                books[(g * 7919) % len(books)],
+                types[(g * 13) % len(types)],
+                f"{((g * 104729) % 100000) / 100 + 1:.2f}",
+            ])
+    return handle.name
+
+
+def timed_ingest(path, rows, force_orm):
+    from books.ingest import ingest_expenses
+
+    started = time.perf_counter()
+    ingest_expenses(path, force_orm=force_orm)
+    seconds = time.perf_counter() - started
+    return {'seconds': round(seconds, 3), 'rows_per_s': round(rows / seconds) if seconds else None}
+
+
+def run(rows, paths):
+    path = write_expense_csv(rows)
+    try:
+        results = {}
+        for name, force_orm in paths:
+            truncate_expenses()
+            results[f"{name} insert"] = timed_ingest(path, rows, force_orm)
+            results[f"{name} upsert"] = timed_ingest(path, rows, force_orm)
+        return {'rows': rows, 'ingest': results}
+    finally:
+        os.remove(path)
+
+
+def print_report(result):
+    print(f"\n=== {result['rows']:,} rows ===")
+    print(f"{'path':<22}{'seconds':>10}{'rows/s':>12}")
+    for name, r in result['ingest'].items():
+        print(f"{name:<22}{r['seconds']:>10.2f}{r['rows_per_s'] or 0:>12,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000])
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    url = setup_django()
+    print(f"Database: {url.split('@')[-1]}")
+    load_reference_data()
+
+    from books.ingest import uses_copy
+
+    paths = [('COPY', False), ('bulk_create', True)] if uses_copy() else [('bulk_create', True)]
+    results = []
+    for rows in args.rows:
+        result = run(rows, paths)
+        print_report(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# benchmarks/ticket_claims.py
+"""Claims per second for ``claim_next_ticket`` with several concurrent workers.
+
+Each run loads ``--tickets`` open tickets. Every worker thread then claims
+tickets on its own connection until the queue is empty. The script reports
+claims per second and checks that no ticket was handed out twice. On
+PostgreSQL this exercises ``FOR UPDATE SKIP LOCKED``; on SQLite it exercises
+the compare-and-swap fallback.
+
+    python -m benchmarks.ticket_claims --tickets 10000 --threads 1 4 16
+    BENCH_DATABASE_URL=postgres://... python -m benchmarks.ticket_claims --threads 1 8 32
+"""
+import argparse
+import json
+import threading
+import time
+from collections import Counter
+
+from benchmarks.common import setup_django
+
+
+def load_tickets(count):
+    from books.models import Ticket
+
+    Ticket.objects.all().delete()
+    Ticket.objects.bulk_create(
+        [Ticket(subject=f"Bench ticket {i}", priority=1 + i % 4) for i in range(count)], batch_size=5000
+    )
+
+
+def run(tickets, threads, ordering):
+    from django.db import connections
+    from books.ticket_queue import claim_next_ticket
+
+    load_tickets(tickets)
+    claimed, lock = [], threading.Lock()
+    failures = []
+
+    def worker():
+        mine = []
+        try:
+            while (ticket := claim_next_ticket(ordering=ordering)) is not None:
+                mine.append(ticket.pk)
+        except Exception as exc:  # reported below; the run is still timed
+            failures.append(repr(exc))
+        finally:
+            connections.close_all()
+            with lock:
+                claimed.extend(mine)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    duplicates = sum(count - 1 for count in Counter(claimed).values() if count > 1)
+    return {
+        'tickets': tickets,
+        'threads': threads,
+        'ordering': ordering,
+        'claimed': len(claimed),
+        'duplicates': duplicates,
+        'failures': failures,
+        'seconds': round(elapsed, 3),
+        'claims_per_s': round(len(claimed) / elapsed) if elapsed else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickets', type=int, default=10_000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--order', choices=['oldest', 'priority'], default='oldest')
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    url = setup_django()
+    print(f"Database: {url.split('@')[-1]}")
+    print(f"{'threads':>8}{'claimed':>10}{'dupes':>8}{'seconds':>10}{'claims/s':>12}")
+    results = []
+    for threads in args.threads:
+        result = run(args.tickets, threads, args.order)
+        print(f"{threads:>8}{result['claimed']:>10,}{result['duplicates']:>8}{result['seconds']:>10.2f}{result['claims_per_s']:>12,}")
+        for failure in result['failures']:
+            print(f"    worker failed: {failure}")
+        results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
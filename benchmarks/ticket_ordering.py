@@ -0,0 +1,119 @@
+# benchmarks/ticket_ordering.py
+"""Throughput and peak memory of ``/sort-tickets/`` from 1k to 1M tickets.
+
+For each size the JSON body is posted through the real view: parse,
+validate, order and render. This runs for a full sort, a ``?limit=100``
+top-k and, for comparison, the old path that validated every item with
+``TicketSerializer`` and then called ``sorted()``. Each run happens in a
+forked child, and peak memory is how far that child's max RSS grew above
+what it inherited.
+
+    python -m benchmarks.ticket_ordering --tickets 1000 10000 100000 1000000
+    python -m benchmarks.ticket_ordering --skip-serializer --tickets 1000000
+"""
+import argparse
+import json
+import multiprocessing
+import resource
+import time
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.common import setup_django
+
+
+def payload(count):
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return json.dumps([
+        {
+            'id': g,
+            'priority': (g * 7919) % 5,
+            'timestamp': (start + timedelta(seconds=(g * 15485863) % 31_536_000)).isoformat(),
+        }
+        for g in range(1, count + 1)
+    ]).encode()
+
+
+def serializer_view(request):
+    """The previous implementation, kept here as the baseline."""
+    from rest_framework.response import Response
+    from books.serializers import TicketSerializer
+
+    serializer = TicketSerializer(data=request.data, many=True)
+    serializer.is_valid(raise_exception=True)
+    ordered = sorted(serializer.validated_data, key=lambda x: (x['priority'], x['timestamp'], x['id']))
+    return Response({'sorted_ticket_ids': [x['id'] for x in ordered]})
+
+
+def _measure_in_child(variant, body, query, pipe):
+    from rest_framework.decorators import api_view
+    from rest_framework.test import APIRequestFactory
+    from books.views import ticket_sort_view
+
+    view = api_view(['POST'])(serializer_view) if variant == 'serializer' else ticket_sort_view
+    request = APIRequestFactory().post('/sort-tickets/' + query, body, content_type='application/json')
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    response = view(request)
+    response.render()
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    assert response.status_code == 200, response.data
+    pipe.send({'seconds': round(elapsed, 3), 'peak_mib': round((peak - baseline) / 1024, 2)})
+
+
+def measure(variant, body, query=''):
+    parent_end, child_end = multiprocessing.Pipe()
+    child = multiprocessing.get_context('fork').Process(
+        target=_measure_in_child, args=(variant, body, query, child_end)
+    )
+    child.start()
+    result = parent_end.recv()
+    child.join()
+    return result
+
+
+def run(count, skip_serializer):
+    body = payload(count)
+    variants = {'engine': ('engine', ''), 'engine top-100': ('engine', '?limit=100')}
+    if not skip_serializer:
+        variants['serializer'] = ('serializer', '')
+
+    result = {'tickets': count, 'body_mib': round(len(body) / 2 ** 20, 2)}
+    for name, (variant, query) in variants.items():
+        timing = measure(variant, body, query)
+        timing['tickets_per_s'] = round(count / timing['seconds']) if timing['seconds'] else None
+        result[name] = timing
+    return result
+
+
+def print_report(result):
+    print(f"\n=== {result['tickets']:,} tickets ({result['body_mib']} MiB body) ===")
+    print(f"{'path':<18}{'seconds':>10}{'tickets/s':>14}{'peak MiB':>12}")
+    for name in ('engine', 'engine top-100', 'serializer'):
+        if name in result:
+            timing = result[name]
+            print(f"{name:<18}{timing['seconds']:>10.3f}{timing['tickets_per_s']:>14,}{timing['peak_mib']:>12.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickets', type=int, nargs='+', default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument('--skip-serializer', action='store_true', help='Skip the slow serializer baseline')
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    setup_django()
+    results = []
+    for count in args.tickets:
+        result = run(count, args.skip_serializer)
+        print_report(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
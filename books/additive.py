@@ -0,0 +1,120 @@
+# books/additive.py
+"""Delta updates for tables of additive ``(total, count)`` rows.
+
+``MonthlyExpenseRollup`` and ``UserSpendingSummary`` both hold running
+totals. Each row is keyed by a tuple of columns and moves only by deltas,
+``total = total + x``, so concurrent writers never overwrite each other.
+Rows are additive: if a race leaves two rows for one key, their sum is
+still right.
+"""
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+from . import sharding
+
+
+def update_row(model, key_fields, key, total, count):
+    """Add ``total`` and ``count`` to the row for ``key``, creating it if needed."""
+    lookup = dict(zip(key_fields, key))
+    rows = model.objects.filter(**lookup)
+
+    with transaction.atomic():
+        pk = rows.values_list('pk', flat=True).first()
+        if pk is None:
+            if count < 0:
+                # Nothing stored to take the rows back from (e.g. the owner was deleted first).
+                return
+            try:
+                with transaction.atomic():
+                    model.objects.create(**lookup, total=total, count=count)
+                return
+            except IntegrityError:
+                # Another writer created the row first; fall through and update it.
+                pk = rows.values_list('pk', flat=True).first()
+
+        model.objects.filter(pk=pk).update(total=F('total') + total, count=F('count') + count)
+        if count < 0:
+            model.objects.filter(pk=pk, count__lte=0).delete()
+
+
+def apply_deltas(model, key_fields, lookup_fields, deltas, batch_size=500):
+    """Apply many ``{key: (total, count)}`` deltas with a few set-based queries.
+
+    Existing rows are found with one query per batch of keys, filtered on
+    ``lookup_fields`` (a non-nullable prefix of the key), and moved with
+    one ``executemany`` UPDATE. Missing rows are bulk-created. If another
+    writer creates one of those rows first, the batch falls back to one
+    row at a time.
+    """
+    deltas = {key: value for key, value in deltas.items() if value[0] or value[1]}
+    keys = list(deltas)
+    positions = [key_fields.index(name) for name in lookup_fields]
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        with transaction.atomic():
+            existing = {}
+            rows = model.objects.filter(**{
+                f"{name}__in": {key[position] for key in batch}
+                for name, position in zip(lookup_fields, positions)
+            }).values_list('pk', *key_fields)
+            for pk, *key in rows:
+                existing.setdefault(tuple(key), pk)
+
+            missing = [key for key in batch if key not in existing and deltas[key][1] >= 0]
+            if missing:
+                try:
+                    with transaction.atomic():
+                        model.objects.bulk_create([
+                            model(**dict(zip(key_fields, key)), total=deltas[key][0], count=deltas[key][1])
+                            for key in missing
+                        ])
+                except IntegrityError:
+                    for key in missing:
+                        update_row(model, key_fields, key, *deltas[key])
+
+            updates = [(deltas[key][0], deltas[key][1], existing[key]) for key in batch if key in existing]
+            if updates:
+                # One prepared UPDATE run per row; compiling a CASE over hundreds of
+                # rows through the ORM costs more than the writes themselves.
+                table = connection.ops.quote_name(model._meta.db_table)
+                with connection.cursor() as cursor:
+                    cursor.executemany(
+                        f"UPDATE {table} SET total = total + %s, count = count + %s WHERE id = %s", updates
+                    )
+                model.objects.filter(pk__in=[pk for _, _, pk in updates], count__lte=0).delete()
+
+
+def rebuild_rows(model, groups, columns):
+    """Replace every row of ``model`` with the aggregate ``groups`` in one ``INSERT ... SELECT``.
+
+    ``columns`` maps each name ``groups`` selects to the column it fills.
+    The rows never pass through Python, so rebuilding from tens of millions
+    of expenses costs one statement rather than millions of model instances.
+    Returns the number of rows written.
+
+    With sharded expenses the groups come from several databases, so each
+    shard's aggregate is merged in Python and the rows are bulk-inserted.
+    """
+    if sharding.is_sharded() and groups.model in sharding.SHARDED_MODELS:
+        rows = sharding.aggregate_rows(groups, ('total', 'count'))
+        with transaction.atomic():
+            model.objects.all().delete()
+            model.objects.bulk_create(
+                (model(**{column: row[name] for name, column in columns.items()}) for row in rows),
+                batch_size=1000,
+            )
+        return len(rows)
+
+    quote = connection.ops.quote_name
+    sql, params = groups.query.sql_with_params()
+    # Select by alias from a derived table, so the column order does not depend on how Django orders the SELECT.
+    source = ', '.join(quote(name) for name in columns)
+    target = ', '.join(quote(column) for column in columns.values())
+    with transaction.atomic():
+        model.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote(model._meta.db_table)} ({target}) SELECT {source} FROM ({sql}) AS groups",
+                params,
+            )
+            return cursor.rowcount
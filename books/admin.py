@@ -1,8 +1,13 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils.html import format_html
 
-from .models import Author, Category, Publisher, Book, Expense, Ticket
+from .autocomplete import filter_title_prefix
+from .models import Author, Category, Publisher, Book, Expense, ExportJob, Ticket
+from .pagination import EstimatedCountPaginator
+from .search import matching_books
 
 # 🔹 Custom User Admin (removes password field when editing)
 class CustomUserAdmin(UserAdmin):
@@ -33,23 +38,84 @@ class PublisherAdmin(admin.ModelAdmin):
     list_display = ('name', 'location')
     search_fields = ('name', 'location')
 
+# 🔹 Large changelists
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist settings for tables that grow into the millions of rows."""
+    paginator = EstimatedCountPaginator
+    # Skip the second, unfiltered COUNT(*) behind "N results (M total)".
+    show_full_result_count = False
+
 # 🔹 Book Admin
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
-    list_display = ('title', 'publisher', 'published_date')  # ✅ Removed 'author' and 'category' if not in model
-    list_filter = ('publisher', 'published_date')            # ✅ Removed 'category' if not in model
+class BookAdmin(LargeTableAdmin):
+    list_display = ('title', 'author', 'category', 'publisher', 'published_date', 'expenses_link')
+    list_select_related = ('author', 'category', 'publisher')
+    # Categories are a short list; publishers and authors are not, so they are searched instead.
+    list_filter = ('category', 'published_date')
     search_fields = ('title',)
+    autocomplete_fields = ('author', 'category', 'publisher')
+
+    @admin.display(description="Expenses")
+    def expenses_link(self, obj):
+        url = reverse('admin:books_expense_changelist')
+        return format_html('<a href="{}?{}={}">View expenses</a>', url, BookFilter.parameter_name, obj.pk)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        if request.path == reverse('admin:autocomplete'):
+            # Pickers match what the user is typing: a title prefix, read off the title index.
+            return filter_title_prefix(queryset, search_term), False
+        # Use the full-text index instead of an ILIKE '%term%' scan over every title.
+        return queryset.filter(pk__in=matching_books(search_term).values('pk')), False
 
 # 🔹 Expense Admin
+class BookFilter(admin.SimpleListFilter):
+    """Filter by one book (``?book=<id>``) without listing every book in the sidebar."""
+    title = "book"
+    parameter_name = 'book'
+
+    def lookups(self, request, model_admin):
+        # Only the selected book is offered; pick one from the Book changelist's "View expenses" link.
+        value = self.value()
+        if value and value.isdigit():
+            return Book.objects.filter(pk=value).values_list('pk', 'title')
+        return ()
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value and value.isdigit():
+            return queryset.filter(book_id=value)
+        return queryset
+
 @admin.register(Expense)
-class ExpenseAdmin(admin.ModelAdmin):
-    list_display = ('user', 'amount', 'date', 'book')  # ✅ Removed 'category'
-    list_filter = ('date', 'book')                     # ✅ Removed 'category'
+class ExpenseAdmin(LargeTableAdmin):
+    list_display = ('user', 'amount', 'date', 'book', 'expense_type')
+    list_select_related = ('user', 'book', 'expense_type')
+    # No date_hierarchy: its year/month links need a DISTINCT over every expense date.
+    list_filter = ('date', 'expense_type', ('book__category', admin.RelatedFieldListFilter), BookFilter)
     search_fields = ('book__title',)
-    date_hierarchy = 'date'
+    autocomplete_fields = ('user', 'book')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Find the books through the search index, then their expenses through the book_id index.
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(book__in=matching_books(search_term).values('pk')), False
+
 # 🔹 Ticket Admin
 @admin.register(Ticket)
-class TicketAdmin(admin.ModelAdmin):
-    list_display = ['id', 'subject', 'user', 'status', 'created_at']
-    list_filter = ['status', 'created_at']
-    date_hierarchy = 'created_at'
+class TicketAdmin(LargeTableAdmin):
+    list_display = ['id', 'subject', 'user', 'status', 'priority', 'assigned_to', 'created_at']
+    list_select_related = ['user', 'assigned_to']
+    # No date_hierarchy, for the same reason as ExpenseAdmin.
+    list_filter = ['status', 'priority', 'created_at']
+    autocomplete_fields = ['user', 'assigned_to']
+
+# 🔹 Export Job Admin
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'user', 'status', 'rows_written', 'rows_total', 'attempts', 'worker', 'created_at']
+    list_select_related = ['user']
+    list_filter = ['status', 'kind']
+    readonly_fields = ['heartbeat_at', 'started_at', 'finished_at']
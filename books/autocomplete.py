@@ -0,0 +1,55 @@
+# books/autocomplete.py
+"""Case-insensitive prefix search over book titles for the book picker.
+
+Matches are read off the ``(lower(title) COLLATE "C", id)`` index as a
+range:
+
+    WHERE lower(title) COLLATE "C" >= 'busi' AND lower(title) COLLATE "C" < 'busj'
+      AND lower(title) COLLATE "C" LIKE 'busi%'
+    ORDER BY lower(title) COLLATE "C", id LIMIT n
+
+The range bounds let both PostgreSQL and SQLite walk the index from the
+first match and stop after ``n`` rows, whatever the catalogue size. The
+comparisons are in code point order (``books.models.ByteOrder``), the only
+order in which such a range holds exactly the titles with the prefix; the
+database's own collation may ignore punctuation and spaces. Titles are
+therefore listed in code point order too.
+"""
+import sys
+
+from django.db.models.functions import Lower
+
+from .models import Book, ByteOrder
+
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+
+def _prefix_upper_bound(prefix):
+    """A string greater than every string starting with ``prefix``; ``None`` if there is none."""
+    # The last code point cannot be raised past U+10FFFF; bound on the shorter prefix instead.
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    following = ord(prefix[-1]) + 1
+    # Lone surrogates cannot be encoded for the database; U+E000 is the next code point after them.
+    if 0xD800 <= following <= 0xDFFF:
+        following = 0xE000
+    return prefix[:-1] + chr(following)
+
+
+def filter_title_prefix(books, prefix):
+    """Narrow a ``Book`` queryset to titles starting with ``prefix``, in index order."""
+    prefix = prefix.strip().lower()
+    if not prefix:
+        return books.none()
+    books = books.annotate(title_key=ByteOrder(Lower('title'))).filter(title_key__gte=prefix, title_key__startswith=prefix)
+    upper_bound = _prefix_upper_bound(prefix)
+    if upper_bound is not None:
+        books = books.filter(title_key__lt=upper_bound)
+    return books.order_by('title_key', 'id')
+
+
+def autocomplete_books(prefix, limit=AUTOCOMPLETE_LIMIT):
+    """Return up to ``limit`` ``(id, title)`` pairs whose title starts with ``prefix``."""
+    return list(filter_title_prefix(Book.objects.all(), prefix).values_list('id', 'title')[:limit])
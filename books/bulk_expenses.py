@@ -0,0 +1,267 @@
+# books/bulk_expenses.py
+"""Batched validation and insertion for the bulk expense API.
+
+Rows are checked a chunk at a time: every ``book_id``, ``user_id`` and
+``external_id`` in the chunk is resolved with one ``IN`` query, instead of a
+lookup per row. Valid rows are written with multi-row INSERTs and the
+monthly rollup gets one delta per (month, category, expense type) in the
+chunk. The spending summaries get one per (user, month, category).
+Invalid rows are reported by index and do not stop the rest of the chunk.
+An ``external_id`` another request inserts between the lookup and the
+insert is reported the same way: the chunk is rolled back, validated
+again and retried without it.
+With sharded expenses each user's rows are inserted on that user's shard.
+"""
+from collections import defaultdict
+from contextlib import ExitStack
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+from django.utils import timezone
+
+from . import rollups, spending
+from .models import Book, Expense, ExpenseType
+from .sharding import shard_for_user, shard_querysets
+from .report_cache import bump_data_version
+
+# Rows validated and inserted per transaction.
+BULK_EXPENSE_CHUNK_SIZE = 5000
+
+_amount_field = Expense._meta.get_field('amount')
+AMOUNT_DECIMAL_PLACES = _amount_field.decimal_places
+MAX_AMOUNT = Decimal(10) ** (_amount_field.max_digits - _amount_field.decimal_places)
+EXTERNAL_ID_MAX_LENGTH = Expense._meta.get_field('external_id').max_length
+
+
+# --------------------------------------------------
+# 🔍 Field parsers (raise ValueError with the message for the client)
+# --------------------------------------------------
+
+def _parse_amount(value):
+    if value is None:
+        raise ValueError("This field is required.")
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError("A valid number is required.")
+    try:
+        # str() keeps a float such as 12.3 at 12.3 instead of its binary expansion.
+        amount = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError("A valid number is required.")
+    if not amount.is_finite():
+        raise ValueError("A valid number is required.")
+    if amount.as_tuple().exponent < -AMOUNT_DECIMAL_PLACES:
+        raise ValueError(f"Ensure that there are no more than {AMOUNT_DECIMAL_PLACES} decimal places.")
+    if abs(amount) >= MAX_AMOUNT:
+        raise ValueError(f"Ensure that the amount is less than {MAX_AMOUNT}.")
+    return amount
+
+
+def _parse_date(value, today):
+    if value is None:
+        return today
+    if not isinstance(value, str):
+        raise ValueError("Date has wrong format. Use YYYY-MM-DD.")
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError("Date has wrong format. Use YYYY-MM-DD.")
+
+
+def _parse_id(value):
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+        raise ValueError("A positive integer id is required.")
+    return value
+
+
+def _parse_external_id(value):
+    if value is None or value == '':
+        return None
+    if not isinstance(value, str):
+        raise ValueError("Not a valid string.")
+    if len(value) > EXTERNAL_ID_MAX_LENGTH:
+        raise ValueError(f"Ensure this field has no more than {EXTERNAL_ID_MAX_LENGTH} characters.")
+    return value
+
+
+# --------------------------------------------------
+# 📦 Chunk validation and insert
+# --------------------------------------------------
+
+INSERT_COLUMNS = ['user', 'book', 'expense_type', 'amount', 'date', 'external_id', 'created_at', 'updated_at']
+
+
+def insert_expense_rows(rows, using=DEFAULT_DB_ALIAS):
+    """Insert ``(user_id, book_id, expense_type_id, amount, date, external_id)`` tuples.
+
+    Values must already be adapted for the database. This is the multi-row
+    INSERT ``bulk_create`` would issue, minus its per-field preparation,
+    which costs more per row than the insert itself on SQLite.
+    """
+    connection = connections[using]
+    fields = [Expense._meta.get_field(name) for name in INSERT_COLUMNS]
+    table = connection.ops.quote_name(Expense._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    max_params = connection.features.max_query_params or 10_000
+    per_statement = max(1, max_params // len(fields))
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), per_statement):
+            batch = rows[start:start + per_statement]
+            placeholders = ', '.join([f"({', '.join(['%s'] * len(fields))})"] * len(batch))
+            params = [value for row in batch for value in (*row, now, now)]
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) VALUES {placeholders}", params
+            )
+
+
+class BulkExpenseImporter:
+    """Validate and insert expense rows for one request.
+
+    ``user`` owns rows that do not name a ``user_id``; only staff may name
+    another user. ``external_id`` values must be new, both in the database
+    and within the request.
+    """
+
+    def __init__(self, user, chunk_size=BULK_EXPENSE_CHUNK_SIZE):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.expense_type_ids = set(ExpenseType.objects.values_list('id', flat=True))
+        self.seen_external_ids = set()
+        self.today = timezone.localdate()
+        self.shards = {}
+
+    def shard_for(self, user_id):
+        if user_id not in self.shards:
+            self.shards[user_id] = shard_for_user(user_id, assign=True)
+        return self.shards[user_id]
+
+    def run(self, rows):
+        created = 0
+        errors = []
+        for offset in range(0, len(rows), self.chunk_size):
+            chunk_created, chunk_errors = self.import_chunk(rows[offset:offset + self.chunk_size], offset)
+            created += chunk_created
+            errors.extend(chunk_errors)
+        return {'received': len(rows), 'created': created, 'errors': errors}
+
+    def parse_row(self, row):
+        if not isinstance(row, dict):
+            return None, {'non_field_errors': ["Expected an object."]}
+
+        parsed, errors = {}, {}
+        for field, parse in (
+            ('amount', _parse_amount),
+            ('book_id', _parse_id),
+            ('expense_type_id', _parse_id),
+            ('user_id', _parse_id),
+            ('external_id', _parse_external_id),
+        ):
+            try:
+                parsed[field] = parse(row.get(field))
+            except ValueError as exc:
+                errors[field] = [str(exc)]
+        try:
+            parsed['date'] = _parse_date(row.get('date'), self.today)
+        except ValueError as exc:
+            errors['date'] = [str(exc)]
+
+        user_id = parsed.get('user_id')
+        if user_id is None:
+            parsed['user_id'] = self.user.pk
+        elif user_id != self.user.pk and not self.user.is_staff:
+            errors['user_id'] = ["You may only record expenses for yourself."]
+        return parsed, errors
+
+    def import_chunk(self, rows, offset):
+        parsed_rows = [self.parse_row(row) for row in rows]
+        while True:
+            expenses, errors, deltas, spending_deltas, external_ids = self.validate_chunk(parsed_rows, offset)
+            try:
+                created = self.insert_chunk(expenses, deltas, spending_deltas)
+            except IntegrityError:
+                # Another request wrote one of these external_ids after the lookup. Validating again turns each
+                # such row into a per-row error; anything else is not the client's to fix.
+                if not self.taken_external_ids(external_ids):
+                    raise
+                continue
+            self.seen_external_ids.update(external_ids)
+            return created, errors
+
+    def taken_external_ids(self, external_ids):
+        taken = set()
+        for expenses in shard_querysets(Expense.objects.filter(external_id__in=external_ids)):
+            taken.update(expenses.values_list('external_id', flat=True))
+        return taken
+
+    def validate_chunk(self, parsed_rows, offset):
+        max_digits, decimal_places = _amount_field.max_digits, _amount_field.decimal_places
+
+        # 🔗 One IN query per referenced table for the whole chunk
+        wanted = defaultdict(set)
+        for parsed, _ in parsed_rows:
+            if parsed is None:
+                continue
+            for field in ('book_id', 'user_id', 'external_id'):
+                if parsed.get(field) is not None:
+                    wanted[field].add(parsed[field])
+        book_categories = dict(Book.objects.filter(pk__in=wanted['book_id']).values_list('pk', 'category_id'))
+        user_ids = set(User.objects.filter(pk__in=wanted['user_id']).values_list('pk', flat=True))
+        taken_external_ids = self.taken_external_ids(wanted['external_id']) | self.seen_external_ids
+
+        expenses, errors, external_ids = defaultdict(list), [], set()
+        shard_ops = {}
+        deltas = defaultdict(lambda: [Decimal('0'), 0])
+        spending_deltas = defaultdict(lambda: [Decimal('0'), 0])
+        for index, (parsed, row_errors) in enumerate(parsed_rows, start=offset):
+            # Copied so that validating the chunk again after a lost race starts from the parse errors.
+            row_errors = dict(row_errors)
+            if parsed is not None:
+                book_id, expense_type_id = parsed.get('book_id'), parsed.get('expense_type_id')
+                external_id = parsed.get('external_id')
+                if book_id is not None and book_id not in book_categories:
+                    row_errors['book_id'] = [f"Invalid pk \"{book_id}\" - object does not exist."]
+                if expense_type_id is not None and expense_type_id not in self.expense_type_ids:
+                    row_errors['expense_type_id'] = [f"Invalid pk \"{expense_type_id}\" - object does not exist."]
+                if 'user_id' not in row_errors and parsed['user_id'] not in user_ids:
+                    row_errors['user_id'] = [f"Invalid pk \"{parsed['user_id']}\" - object does not exist."]
+                if external_id is not None and (external_id in taken_external_ids or external_id in external_ids):
+                    row_errors['external_id'] = ["An expense with this external_id already exists."]
+
+            if row_errors:
+                errors.append({'index': index, 'errors': row_errors})
+                continue
+
+            if external_id is not None:
+                external_ids.add(external_id)
+            alias = self.shard_for(parsed['user_id'])
+            ops = shard_ops.get(alias) or shard_ops.setdefault(alias, connections[alias].ops)
+            expenses[alias].append((
+                parsed['user_id'], book_id, expense_type_id,
+                ops.adapt_decimalfield_value(parsed['amount'], max_digits, decimal_places),
+                ops.adapt_datefield_value(parsed['date']), external_id,
+            ))
+            year, month, category_id = parsed['date'].year, parsed['date'].month, book_categories.get(book_id)
+            for delta in (deltas[(year, month, category_id, expense_type_id)],
+                          spending_deltas[(parsed['user_id'], year, month, category_id)]):
+                delta[0] += parsed['amount']
+                delta[1] += 1
+        return expenses, errors, deltas, spending_deltas, external_ids
+
+    def insert_chunk(self, expenses, deltas, spending_deltas):
+        created = sum(len(rows) for rows in expenses.values())
+        if created:
+            # The signals never see these rows, so the chunk's rollup and spending deltas are applied alongside them.
+            # Every shard's transaction stays open until all have inserted, so a conflict on one rolls back them all.
+            with transaction.atomic(), ExitStack() as shard_transactions:
+                for alias, shard_rows in expenses.items():
+                    shard_transactions.enter_context(transaction.atomic(using=alias))
+                    insert_expense_rows(shard_rows, using=alias)
+                rollups.apply_rollup_deltas(deltas)
+                spending.apply_spending_deltas(spending_deltas)
+                bump_data_version()
+        return created
@@ -0,0 +1,76 @@
+# books/expense_history.py
+"""Keyset (seek) pagination over one user's expenses, newest first.
+
+Pages are ordered by ``(date, id)`` descending. A cursor encodes the last
+row of the previous page, and the next page starts strictly after it:
+
+    WHERE user_id = %s AND date <= %s AND NOT (date = %s AND id >= %s)
+    ORDER BY date DESC, id DESC LIMIT n
+
+With the ``(user_id, date DESC, id DESC)`` index, every page is a range
+scan that starts at the cursor. There is no OFFSET to skip, so page 1,000
+costs the same as page 1. Rows added or deleted between requests do not
+shift later pages.
+"""
+import base64
+import binascii
+from datetime import date
+
+from django.db.models import Q
+
+from .models import Expense
+from .sharding import shard_for_user
+
+EXPENSE_HISTORY_PAGE_SIZE = 20
+EXPENSE_HISTORY_MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(expense_date, expense_id):
+    raw = f"{expense_date.isoformat()}|{expense_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        day, expense_id = raw.split('|')
+        return date.fromisoformat(day), int(expense_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor("Invalid cursor.")
+
+
+def expense_history_page(user, cursor=None, limit=EXPENSE_HISTORY_PAGE_SIZE):
+    """Return ``(expenses, next_cursor)``; ``next_cursor`` is ``None`` on the last page."""
+    qs = (
+        Expense.objects.using(shard_for_user(user.pk))
+        .select_related('book__category', 'expense_type')
+        .filter(user=user)
+        .order_by('-date', '-id')
+    )
+    if cursor:
+        last_date, last_id = decode_cursor(cursor)
+        # The date__lte bound gives the index a range start; the exclude handles ties on the cursor's date.
+        qs = qs.filter(date__lte=last_date).exclude(Q(date=last_date) & Q(id__gte=last_id))
+
+    # One extra row tells us whether another page exists without a COUNT.
+    expenses = list(qs[:limit + 1])
+    if len(expenses) <= limit:
+        return expenses, None
+    expenses = expenses[:limit]
+    return expenses, encode_cursor(expenses[-1].date, expenses[-1].pk)
+
+
+def serialize_expense(expense):
+    book = expense.book
+    return {
+        'id': expense.pk,
+        'date': expense.date.isoformat(),
+        'amount': str(expense.amount),
+        'book': book.title if book else None,
+        'category': book.category.name if book and book.category else None,
+        'expense_type': expense.expense_type.name if expense.expense_type else None,
+    }
@@ -0,0 +1,260 @@
+# books/export_jobs.py
+"""Row-level exports written by background workers, queued in the database.
+
+A large CSV or XLSX export used to hold a web worker for as long as it took
+to write, and long ones hit the request timeout. With ``EXPORT_JOBS`` on,
+the export URLs call ``enqueue_export`` and return at once.
+``run_export_worker`` processes then write the files.
+
+* Queue. ``ExportJob`` rows are the queue, so there is no broker to run.
+  ``claim_next_job`` moves the oldest ``queued`` job to ``running``. On
+  PostgreSQL the candidate is locked ``FOR UPDATE SKIP LOCKED``, so
+  concurrent workers pass over each other's rows instead of waiting on
+  them. The claiming UPDATE also only matches while the job is still
+  ``queued``, which keeps SQLite (serialised by its writer lock) and other
+  backends safe too. ``books.ticket_queue`` claims tickets the same way.
+* Progress. Every ``PROGRESS_EVERY_ROWS`` rows the worker records the rows
+  written so far. That write is also its heartbeat. A worker that stops
+  sending heartbeats for ``EXPORT_JOB_STALE_SECONDS`` has probably died.
+  ``requeue_stale_jobs`` hands its job to the next worker, and fails the
+  job after ``EXPORT_JOB_MAX_ATTEMPTS`` tries. Every write by a worker
+  checks that the job is still its own claim, so a slow worker that lost
+  its job stops without touching the new claim.
+* Files. Each attempt writes ``<id>-<attempt>.<kind>.part`` in
+  ``EXPORT_JOB_DIR`` and renames it when complete. Half-written files are
+  never served. ``purge_expired_jobs`` deletes jobs and their files
+  ``EXPORT_JOB_RETAIN_HOURS`` after they finish.
+
+Workers read the expenses from ``default`` (and the shards), not from the
+replica. Job rows are always read and written on ``default``.
+"""
+import os
+import random
+import socket
+import time
+from contextlib import suppress
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.db.models import F
+from django.http import HttpRequest, QueryDict
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import ExportJob
+
+# Rows between progress updates (and heartbeats).
+PROGRESS_EVERY_ROWS = 5000
+
+# Attempts before giving up under heavy contention.
+CLAIM_RETRIES = 100
+
+DOWNLOAD_NAMES = {'csv': 'expense_rows.csv', 'xlsx': 'expense_rows.xlsx'}
+ACTIVE_STATUSES = ('queued', 'running')
+FINISHED_STATUSES = ('done', 'failed')
+
+
+class ExportClaimContention(Exception):
+    """Every retry lost its race or hit a lock; the worker may try again."""
+
+
+class ExportJobLost(Exception):
+    """The job was requeued or failed while this worker was still writing it."""
+
+
+def _jobs():
+    # Never the replica: a job is polled right after it is queued.
+    return ExportJob.objects.using(DEFAULT_DB_ALIAS)
+
+
+def default_worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def export_path(file_name):
+    return os.path.join(settings.EXPORT_JOB_DIR, file_name)
+
+
+# --------------------------------------------------
+# 📥 Queueing
+# --------------------------------------------------
+
+def enqueue_export(kind, params, user=None):
+    """Queue a ``kind`` export of the rows matching ``params`` (a ``QueryDict``).
+
+    A user asking again for an export that is still queued or running gets
+    the existing job back, so repeated clicks do not pile up work.
+    """
+    params = {key: values for key, values in sorted(params.lists()) if key != 'mode'}
+    owner = user if user is not None and user.is_authenticated else None
+    if owner is not None:
+        existing = _jobs().filter(user=owner, kind=kind, params=params, status__in=ACTIVE_STATUSES).first()
+        if existing is not None:
+            return existing
+    return _jobs().create(kind=kind, params=params, user=owner)
+
+
+def serialize_job(job):
+    payload = {
+        'id': str(job.pk),
+        'kind': job.kind,
+        'status': job.status,
+        'rows_written': job.rows_written,
+        'rows_total': job.rows_total,
+        'error': job.error or None,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'status_url': reverse('export-job-status', args=[job.pk]),
+    }
+    if job.status == 'done':
+        payload['download_url'] = reverse('export-job-download', args=[job.pk])
+    return payload
+
+
+# --------------------------------------------------
+# 👷 Claiming
+# --------------------------------------------------
+
+def claim_next_job(worker):
+    """Move the oldest queued job to ``running`` for ``worker``; ``None`` when the queue is empty."""
+    connection = connections[DEFAULT_DB_ALIAS]
+    for attempt in range(CLAIM_RETRIES):
+        try:
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                candidates = _jobs().filter(status='queued').order_by('created_at', 'id')
+                if connection.features.has_select_for_update_skip_locked:
+                    candidates = candidates.select_for_update(skip_locked=True)
+                job = candidates.first()
+                if job is None:
+                    return None
+                now = timezone.now()
+                values = {
+                    'status': 'running', 'worker': worker, 'started_at': now, 'heartbeat_at': now,
+                    'rows_written': 0, 'error': '',
+                }
+                claimed = _jobs().filter(pk=job.pk, status='queued', attempts=job.attempts).update(
+                    attempts=job.attempts + 1, **values,
+                )
+            # Built from the row read above: reading it again could hit the lock and lose the claim.
+            if claimed:
+                for name, value in values.items():
+                    setattr(job, name, value)
+                job.attempts += 1
+                return job
+        except OperationalError as exc:
+            # SQLite reports writer contention as "database is locked" / "database table is locked".
+            if 'locked' not in str(exc):
+                raise
+            time.sleep(random.uniform(0, 0.001 * min(attempt + 1, 20)))
+    raise ExportClaimContention(f"No export job claimed after {CLAIM_RETRIES} attempts.")
+
+
+def _owned(job):
+    """``job``'s row, as long as it is still this worker's claim."""
+    return _jobs().filter(pk=job.pk, status='running', worker=job.worker, attempts=job.attempts)
+
+
+def _update_owned(job, **values):
+    if not _owned(job).update(**values):
+        raise ExportJobLost(f"Export job {job.pk} is no longer claimed by {job.worker}.")
+    for name, value in values.items():
+        setattr(job, name, value)
+
+
+def report_progress(job, rows_written):
+    """Record ``rows_written``; this is also the worker's heartbeat."""
+    _update_owned(job, rows_written=rows_written, heartbeat_at=timezone.now())
+
+
+def release_job(job):
+    """Put a job this worker is giving up (e.g. on shutdown) back in the queue, without using up an attempt."""
+    return bool(_owned(job).update(status='queued', worker='', attempts=F('attempts') - 1, heartbeat_at=None))
+
+
+# --------------------------------------------------
+# 📤 Writing
+# --------------------------------------------------
+
+def job_request(job):
+    """A stand-in request carrying the job's filters, for the report helpers that read ``request.GET``."""
+    request = HttpRequest()
+    request.GET = QueryDict(mutable=True)
+    for key, values in job.params.items():
+        request.GET.setlist(key, values)
+    return request
+
+
+def run_job(job):
+    """Write a claimed job's file and mark it ``done``, or ``failed`` with the error; returns the job.
+
+    Raises ``ExportJobLost`` (after removing its own partial file) if the
+    job stops being this worker's claim while it writes.
+    """
+    # Imported here because the views import this module to queue jobs.
+    from .views import count_expense_rows, write_expense_rows_csv, write_expense_rows_xlsx
+
+    request = job_request(job)
+    file_name = f"{job.pk}-{job.attempts}.{job.kind}"
+    partial = export_path(file_name + '.part')
+    written = 0
+
+    def track(rows):
+        nonlocal written
+        for written, row in enumerate(rows, start=1):
+            if written % PROGRESS_EVERY_ROWS == 0:
+                report_progress(job, written)
+            yield row
+
+    try:
+        _update_owned(job, rows_total=count_expense_rows(request), heartbeat_at=timezone.now())
+        os.makedirs(settings.EXPORT_JOB_DIR, exist_ok=True)
+        if job.kind == 'csv':
+            with open(partial, 'w', newline='', encoding='utf-8') as output:
+                write_expense_rows_csv(request, output, track)
+        else:
+            with open(partial, 'wb') as output:
+                write_expense_rows_xlsx(request, output, track)
+        os.replace(partial, export_path(file_name))
+        try:
+            _update_owned(job, status='done', file_name=file_name, rows_written=written,
+                          finished_at=timezone.now())
+        except ExportJobLost:
+            os.remove(export_path(file_name))
+            raise
+    except ExportJobLost:
+        raise
+    except Exception as exc:
+        _update_owned(job, status='failed', error=f"{type(exc).__name__}: {exc}", finished_at=timezone.now())
+    finally:
+        with suppress(FileNotFoundError):
+            os.remove(partial)
+    return job
+
+
+# --------------------------------------------------
+# 🧹 Housekeeping
+# --------------------------------------------------
+
+def requeue_stale_jobs():
+    """Requeue running jobs whose worker went quiet, failing those out of attempts; returns ``(requeued, failed)``."""
+    now = timezone.now()
+    stale = _jobs().filter(status='running', heartbeat_at__lt=now - timedelta(seconds=settings.EXPORT_JOB_STALE_SECONDS))
+    failed = stale.filter(attempts__gte=settings.EXPORT_JOB_MAX_ATTEMPTS).update(
+        status='failed', finished_at=now,
+        error=f"Gave up after {settings.EXPORT_JOB_MAX_ATTEMPTS} attempts; the worker stopped responding.",
+    )
+    requeued = stale.filter(attempts__lt=settings.EXPORT_JOB_MAX_ATTEMPTS).update(status='queued', worker='')
+    return requeued, failed
+
+
+def purge_expired_jobs():
+    """Delete jobs that finished more than ``EXPORT_JOB_RETAIN_HOURS`` ago, with their files; returns how many."""
+    cutoff = timezone.now() - timedelta(hours=settings.EXPORT_JOB_RETAIN_HOURS)
+    expired = list(_jobs().filter(status__in=FINISHED_STATUSES, finished_at__lt=cutoff).values_list('pk', 'file_name'))
+    for _, file_name in expired:
+        if file_name:
+            with suppress(FileNotFoundError):
+                os.remove(export_path(file_name))
+    _jobs().filter(pk__in=[pk for pk, _ in expired]).delete()
+    return len(expired)
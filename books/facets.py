@@ -0,0 +1,135 @@
+# books/facets.py
+"""Maintenance and reads for ``ExpenseFacet``.
+
+Facet counts are driven by the rollup deltas in ``books.rollups``: an
+expense that moves ``count`` into a (year, month, category, type) rollup
+key moves the same ``count`` into its month, year and category facets.
+"""
+from calendar import month_name
+from collections import defaultdict
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q, Sum
+
+from .models import Category, ExpenseFacet, MonthlyExpenseRollup
+from .query_pool import gather_queries
+
+
+# --------------------------------------------------
+# ➕ Incremental updates
+# --------------------------------------------------
+
+def facet_deltas(rollup_deltas):
+    """Turn ``{rollup_key: (total, count)}`` into ``{(kind, value): count}``."""
+    deltas = defaultdict(int)
+    for (year, month, category_id, _), (_, count) in rollup_deltas.items():
+        if not count:
+            continue
+        deltas[(ExpenseFacet.MONTH, month)] += count
+        deltas[(ExpenseFacet.YEAR, year)] += count
+        if category_id is not None:
+            deltas[(ExpenseFacet.CATEGORY, category_id)] += count
+    return deltas
+
+
+def _apply_facet_delta(kind, value, count):
+    rows = ExpenseFacet.objects.filter(kind=kind, value=value)
+    if rows.update(count=F('count') + count):
+        return
+    try:
+        with transaction.atomic():
+            ExpenseFacet.objects.create(kind=kind, value=value, count=count)
+    except IntegrityError:
+        # Another writer created the row first.
+        rows.update(count=F('count') + count)
+
+
+def apply_facet_deltas(deltas):
+    """Add ``{(kind, value): count}`` to the facet rows, creating missing ones."""
+    deltas = {key: count for key, count in deltas.items() if count}
+    if not deltas:
+        return
+
+    values_by_kind = defaultdict(set)
+    for kind, value in deltas:
+        values_by_kind[kind].add(value)
+    lookup = Q()
+    for kind, values in values_by_kind.items():
+        lookup |= Q(kind=kind, value__in=values)
+
+    with transaction.atomic():
+        existing = {
+            (kind, value): pk
+            for pk, kind, value in ExpenseFacet.objects.filter(lookup).values_list('pk', 'kind', 'value')
+        }
+
+        missing = [key for key in deltas if key not in existing]
+        if missing:
+            try:
+                with transaction.atomic():
+                    ExpenseFacet.objects.bulk_create(
+                        [ExpenseFacet(kind=kind, value=value, count=deltas[(kind, value)]) for kind, value in missing]
+                    )
+            except IntegrityError:
+                for kind, value in missing:
+                    _apply_facet_delta(kind, value, deltas[(kind, value)])
+
+        updates = [(deltas[key], pk) for key, pk in existing.items()]
+        if updates:
+            table = connection.ops.quote_name(ExpenseFacet._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.executemany(f"UPDATE {table} SET count = count + %s WHERE id = %s", updates)
+
+
+# --------------------------------------------------
+# 🔁 Full rebuild
+# --------------------------------------------------
+
+def rebuild_expense_facets():
+    """Recompute every facet from the rollup table. Returns the number of rows written."""
+    groups = [
+        (ExpenseFacet.MONTH, MonthlyExpenseRollup.objects.values_list('month')),
+        (ExpenseFacet.YEAR, MonthlyExpenseRollup.objects.values_list('year')),
+        (ExpenseFacet.CATEGORY, MonthlyExpenseRollup.objects.filter(category__isnull=False).values_list('category_id')),
+    ]
+    facets = [
+        ExpenseFacet(kind=kind, value=value, count=count)
+        for kind, rows in groups
+        for value, count in rows.annotate(expenses=Sum('count')).order_by()
+        if count
+    ]
+
+    with transaction.atomic():
+        ExpenseFacet.objects.all().delete()
+        ExpenseFacet.objects.bulk_create(facets)
+    return len(facets)
+
+
+# --------------------------------------------------
+# 🔽 Dropdown options
+# --------------------------------------------------
+
+def _month_and_year_options():
+    values = defaultdict(list)
+    rows = ExpenseFacet.objects.filter(kind__in=[ExpenseFacet.MONTH, ExpenseFacet.YEAR], count__gt=0)
+    for kind, value in rows.values_list('kind', 'value'):
+        values[kind].append(value)
+    months = sorted(month_name[value] for value in values[ExpenseFacet.MONTH] if 1 <= value <= 12)
+    return months, sorted(values[ExpenseFacet.YEAR])
+
+
+def _category_options():
+    category_ids = ExpenseFacet.objects.filter(kind=ExpenseFacet.CATEGORY, count__gt=0).values('value')
+    return sorted(Category.objects.filter(pk__in=category_ids).values_list('name', flat=True))
+
+
+def dropdown_options():
+    """Month names, category names and years that currently have expenses."""
+    months, years = _month_and_year_options()
+    return months, _category_options(), years
+
+
+async def adropdown_options():
+    """``dropdown_options()`` with its two reads running concurrently."""
+    (months, years), categories = await gather_queries(_month_and_year_options, _category_options)
+    return months, categories, years
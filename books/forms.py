@@ -1,6 +1,7 @@
 # books/forms.py
 from django import forms
-from .models import Expense
+from django.urls import reverse
+from .models import Book, Expense
 from .models import Ticket  # Make sure Ticket model exists
 
 class TicketForm(forms.ModelForm):
@@ -8,12 +9,27 @@ class TicketForm(forms.ModelForm):
         model = Ticket
         fields = ['subject', 'description']  # Adjust based on your model fields
 
+class BookAutocompleteWidget(forms.Widget):
+    """A search box backed by the book autocomplete API.
+
+    Only the selected book is rendered, so the page does not grow with the catalogue.
+    """
+    template_name = 'books/widgets/book_autocomplete.html'
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        title = ''
+        if value and str(value).isdigit():
+            title = Book.objects.filter(pk=value).values_list('title', flat=True).first() or ''
+        context['widget'].update({'title': title, 'url': reverse('book-autocomplete')})
+        return context
+
 class ExpenseForm(forms.ModelForm):
     class Meta:
         model = Expense
         fields = ['book', 'expense_type', 'amount']
         widgets = {
-            'book': forms.Select(attrs={'class': 'form-control'}),
+            'book': BookAutocompleteWidget(attrs={'class': 'form-control', 'placeholder': 'Search books…'}),
             'expense_type': forms.Select(attrs={'class': 'form-control'}),
             'amount': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Enter amount'}),
         }
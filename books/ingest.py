@@ -0,0 +1,477 @@
+# books/ingest.py
+"""Bulk CSV ingestion for ``books_expense`` and ``books_book``.
+
+On PostgreSQL the file is streamed with ``COPY ... FROM STDIN`` into an
+unlogged staging table and merged with one set-based
+``INSERT ... ON CONFLICT (external_id)``. Foreign keys are resolved by
+joining the staging rows against the reference tables. A partitioned
+``books_expense`` (see ``books.partitions``) has no unique index on
+``external_id``, so there the merge updates the rows found through the
+``books_expense_external_id`` side table and inserts the rest. Other
+backends (SQLite in development) fall back to batched ``bulk_create``, as
+does a sharded setup (see ``books.sharding``): expenses go to each user's
+shard and books through ``import_books``, which copies them to the shards.
+
+Expense files use the row-export layout (``Date, User, Book, Category,
+Expense Type, Amount``) plus an optional ``external_id`` column. Users and
+books are matched by username and title; unknown ones are left empty and
+unknown expense types are created. Book files use the ``books_data.csv``
+layout plus an optional ``external_id`` column; without one, the ``id``
+column (the ISBN) is the key that re-imports update.
+"""
+import csv
+import io
+import uuid
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Max, Q
+from django.db.models.expressions import RawSQL
+
+from . import partitions, rollups, search, sharding, spending
+from .management.commands.import_books import Command as ImportBooksCommand
+from .models import Book, Expense, ExpenseType
+from .report_cache import bump_data_version
+
+EXPENSE_COLUMNS = ['external_id', 'date', 'user', 'book', 'category', 'expense_type', 'amount']
+BOOK_COLUMNS = [
+    'external_id', 'id', 'title', 'subtitle', 'authors', 'publisher', 'published_date', 'category',
+    'distribution_expense',
+]
+EXPENSE_UPSERT_FIELDS = ['user', 'book', 'expense_type', 'amount', 'date']
+
+
+class IngestError(ValueError):
+    pass
+
+
+def _normalise_header(header, known, required):
+    columns = [name.strip().lower().replace(' ', '_') for name in header]
+    missing = [name for name in required if name not in columns]
+    if missing:
+        raise IngestError(f"CSV is missing required column(s): {', '.join(missing)}")
+    return [name if name in known else f"ignored_{i}" for i, name in enumerate(columns)]
+
+
+def _read_header(csv_path):
+    with open(csv_path, newline='', encoding='utf-8') as file:
+        return next(csv.reader(file), [])
+
+
+def uses_copy():
+    return connection.vendor == 'postgresql'
+
+
+# --------------------------------------------------
+# 🐘 PostgreSQL: COPY into staging, then merge
+# --------------------------------------------------
+
+def _copy_to_staging(cursor, csv_path, columns):
+    """Create an unlogged staging table shaped like the CSV and COPY the file into it."""
+    table = f"ingest_staging_{uuid.uuid4().hex[:12]}"
+    column_sql = ', '.join(f'"{name}" text' for name in columns)
+    cursor.execute(f'CREATE UNLOGGED TABLE "{table}" (line bigserial, {column_sql})')
+
+    copy_columns = ', '.join(f'"{name}"' for name in columns)
+    with open(csv_path, newline='', encoding='utf-8') as file:
+        cursor.copy_expert(f'COPY "{table}" ({copy_columns}) FROM STDIN WITH (FORMAT csv, HEADER true)', file)
+    cursor.execute(f'SELECT count(*) FROM "{table}"')
+    return table, cursor.fetchone()[0]
+
+
+def _apply_rollup_groups(groups, sign):
+    """Fold per-(user, month, category, type) groups into rollup and spending deltas."""
+    rollup_deltas = defaultdict(lambda: [Decimal('0'), 0])
+    spending_deltas = defaultdict(lambda: [Decimal('0'), 0])
+    for user_id, year, month, category_id, expense_type_id, total, count in groups:
+        deltas = [rollup_deltas[(year, month, category_id, expense_type_id)]]
+        if user_id is not None:
+            deltas.append(spending_deltas[(user_id, year, month, category_id)])
+        for delta in deltas:
+            delta[0] += sign * total
+            delta[1] += sign * count
+    rollups.apply_rollup_deltas(rollup_deltas)
+    spending.apply_spending_deltas(spending_deltas)
+
+
+def _column(columns, name):
+    """SQL for a trimmed staging column, or NULL when the CSV does not have it."""
+    return f"NULLIF(btrim(s.\"{name}\"), '')" if name in columns else 'NULL'
+
+
+def _calendar_date(value, pattern, year, month, day):
+    """SQL for the date in text ``value``, or NULL unless it matches ``pattern`` and is a real calendar date.
+
+    ``year``/``month``/``day`` are SQL for the parts of ``value``. A plain
+    cast raises on dates like 2025-02-30 and aborts the whole ingest; CASE
+    evaluates its branches in order, so ``make_date`` only sees valid parts.
+    """
+    return f"""
+        CASE WHEN {value} ~ '{pattern}' THEN
+            CASE WHEN ({month})::int BETWEEN 1 AND 12 AND ({year})::int >= 1 THEN
+                CASE WHEN ({day})::int BETWEEN 1 AND extract(
+                    day FROM make_date(({year})::int, ({month})::int, 1) + interval '1 month - 1 day'
+                ) THEN make_date(({year})::int, ({month})::int, ({day})::int) END
+            END
+        END
+    """
+
+
+def _copy_ingest_expenses(csv_path, columns):
+    rollup_group_sql = """
+        SELECT x.user_id, extract(year FROM x.date)::int, extract(month FROM x.date)::int, b.category_id,
+               x.expense_type_id, sum(x.amount), count(*)
+        FROM {source} x LEFT JOIN books_book b ON b.id = x.book_id
+        GROUP BY 1, 2, 3, 4, 5
+    """
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        table, staged = _copy_to_staging(cursor, csv_path, columns)
+        iso_date = _calendar_date(
+            'rows.date', r'^\d{4}-\d{2}-\d{2}$',
+            'substr(rows.date, 1, 4)', 'substr(rows.date, 6, 2)', 'substr(rows.date, 9, 2)',
+        )
+
+        # Parsed, validated and de-duplicated rows: the last line for an external_id wins.
+        cursor.execute(f"""
+            CREATE TEMPORARY TABLE "{table}_parsed" ON COMMIT DROP AS
+            SELECT DISTINCT ON (coalesce(external_id, 'line:' || line))
+                   external_id, username, book, expense_type, amount::numeric(10, 2), parsed.date
+            FROM (
+                SELECT line,
+                       left({_column(columns, 'external_id')}, 64) AS external_id,
+                       {_column(columns, 'user')} AS username,
+                       {_column(columns, 'book')} AS book,
+                       left({_column(columns, 'expense_type')}, 100) AS expense_type,
+                       {_column(columns, 'amount')} AS amount,
+                       {_column(columns, 'date')} AS date
+                FROM "{table}" s
+            ) AS rows
+            CROSS JOIN LATERAL (
+                SELECT {iso_date} AS date
+            ) AS parsed
+            WHERE parsed.date IS NOT NULL
+              AND amount ~ '^-?\\d{{1,8}}(\\.\\d{{1,2}})?$'
+            ORDER BY coalesce(external_id, 'line:' || line), line DESC
+        """)
+
+        cursor.execute(f"""
+            INSERT INTO books_expensetype (name)
+            SELECT DISTINCT expense_type FROM "{table}_parsed" WHERE expense_type IS NOT NULL
+            ON CONFLICT (name) DO NOTHING
+        """)
+
+        # Rows about to be replaced give back their old contribution to the rollup and summaries first.
+        cursor.execute(rollup_group_sql.format(source=f"""
+            (SELECT e.* FROM books_expense e JOIN "{table}_parsed" p ON p.external_id = e.external_id)
+        """))
+        _apply_rollup_groups(cursor.fetchall(), -1)
+
+        source_sql = f"""
+            SELECT p.external_id, u.id AS user_id, b.id AS book_id, t.id AS expense_type_id, p.amount, p.date
+            FROM "{table}_parsed" p
+            LEFT JOIN auth_user u ON u.username = p.username
+            LEFT JOIN (SELECT DISTINCT ON (title) id, title FROM books_book ORDER BY title, id) b
+                   ON b.title = p.book
+            LEFT JOIN books_expensetype t ON t.name = p.expense_type
+        """
+        if partitions.is_partitioned():
+            # No unique index on external_id to conflict on: match through the side table instead.
+            merge_sql = f"""
+                WITH source AS ({source_sql}),
+                updated AS (
+                    UPDATE books_expense e SET
+                        user_id = s.user_id,
+                        book_id = s.book_id,
+                        expense_type_id = s.expense_type_id,
+                        amount = s.amount,
+                        date = s.date,
+                        updated_at = now()
+                    FROM source s JOIN {partitions.EXTERNAL_ID_TABLE} k ON k.external_id = s.external_id
+                    WHERE e.id = k.expense_id
+                    RETURNING e.user_id, e.book_id, e.expense_type_id, e.amount, e.date
+                ),
+                inserted AS (
+                    INSERT INTO books_expense
+                        (external_id, user_id, book_id, expense_type_id, amount, date, created_at, updated_at)
+                    SELECT s.external_id, s.user_id, s.book_id, s.expense_type_id, s.amount, s.date, now(), now()
+                    FROM source s
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM {partitions.EXTERNAL_ID_TABLE} k WHERE k.external_id = s.external_id
+                    )
+                    RETURNING user_id, book_id, expense_type_id, amount, date
+                ),
+                merged AS (SELECT * FROM updated UNION ALL SELECT * FROM inserted)
+            """
+        else:
+            merge_sql = f"""
+                WITH merged AS (
+                    INSERT INTO books_expense
+                        (external_id, user_id, book_id, expense_type_id, amount, date, created_at, updated_at)
+                    SELECT s.external_id, s.user_id, s.book_id, s.expense_type_id, s.amount, s.date, now(), now()
+                    FROM ({source_sql}) s
+                    ON CONFLICT (external_id) DO UPDATE SET
+                        user_id = EXCLUDED.user_id,
+                        book_id = EXCLUDED.book_id,
+                        expense_type_id = EXCLUDED.expense_type_id,
+                        amount = EXCLUDED.amount,
+                        date = EXCLUDED.date,
+                        updated_at = now()
+                    RETURNING user_id, book_id, expense_type_id, amount, date
+                )
+            """
+        cursor.execute(merge_sql + rollup_group_sql.format(source='merged'))
+        groups = cursor.fetchall()
+        _apply_rollup_groups(groups, 1)
+
+        cursor.execute(f'DROP TABLE "{table}"')
+
+    written = sum(group[6] for group in groups)
+    return {'rows': staged, 'written': written, 'skipped': staged - written}
+
+
+def _copy_ingest_books(csv_path, columns):
+    with transaction.atomic(), connection.cursor() as cursor:
+        table, staged = _copy_to_staging(cursor, csv_path, columns)
+        last_book_id = Book.objects.aggregate(last=Max('id'))['last'] or 0
+        us_date = _calendar_date(
+            'published_date', r'^\d{1,2}/\d{1,2}/\d{4}$', "split_part(published_date, '/', 3)",
+            "split_part(published_date, '/', 1)", "split_part(published_date, '/', 2)",
+        )
+
+        cursor.execute(f"""
+            CREATE TEMPORARY TABLE "{table}_parsed" ON COMMIT DROP AS
+            SELECT DISTINCT ON (coalesce(external_id, 'line:' || line))
+                   external_id, title, subtitle, author, category, publisher,
+                   {us_date} AS published_date,
+                   CASE WHEN distribution_expense ~ '^-?\\d{{1,8}}(\\.\\d{{1,2}})?$'
+                        THEN distribution_expense::numeric(10, 2) ELSE 0 END AS distribution_expense
+            FROM (
+                SELECT line,
+                       -- books_data.csv has no external_id; its id column (the ISBN) is the source key.
+                       left(coalesce({_column(columns, 'external_id')}, {_column(columns, 'id')}), 64) AS external_id,
+                       left({_column(columns, 'title')}, 200) AS title,
+                       coalesce(left({_column(columns, 'subtitle')}, 255), '') AS subtitle,
+                       -- Co-authors are listed as "A, B"; Book has a single author, so keep the first.
+                       left(NULLIF(btrim(split_part({_column(columns, 'authors')}, ',', 1)), ''), 100) AS author,
+                       left({_column(columns, 'category')}, 50) AS category,
+                       left({_column(columns, 'publisher')}, 100) AS publisher,
+                       {_column(columns, 'published_date')} AS published_date,
+                       {_column(columns, 'distribution_expense')} AS distribution_expense
+                FROM "{table}" s
+            ) AS rows
+            WHERE title IS NOT NULL AND author IS NOT NULL
+            ORDER BY coalesce(external_id, 'line:' || line), line DESC
+        """)
+
+        cursor.execute(f"""
+            INSERT INTO books_author (name, bio)
+            SELECT DISTINCT p.author, '' FROM "{table}_parsed" p
+            WHERE NOT EXISTS (SELECT 1 FROM books_author a WHERE a.name = p.author)
+        """)
+        cursor.execute(f"""
+            INSERT INTO books_category (name, description)
+            SELECT DISTINCT category, '' FROM "{table}_parsed" WHERE category IS NOT NULL
+            ON CONFLICT (name) DO NOTHING
+        """)
+        cursor.execute(f"""
+            INSERT INTO books_publisher (name, location)
+            SELECT DISTINCT p.publisher, '' FROM "{table}_parsed" p
+            WHERE p.publisher IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM books_publisher x WHERE x.name = p.publisher)
+        """)
+
+        # Categories of the books about to be replaced, to find the ones the merge recategorises.
+        cursor.execute(f"""
+            CREATE TEMPORARY TABLE "{table}_previous" ON COMMIT DROP AS
+            SELECT b.id, b.category_id FROM books_book b
+            JOIN "{table}_parsed" p ON p.external_id = b.external_id
+        """)
+
+        cursor.execute(f"""
+            WITH merged AS (
+                INSERT INTO books_book
+                    (external_id, title, subtitle, author_id, category_id, publisher_id,
+                     published_date, distribution_expense)
+                SELECT p.external_id, p.title, p.subtitle, a.id, c.id, pub.id,
+                       p.published_date, p.distribution_expense
+                FROM "{table}_parsed" p
+                JOIN (SELECT DISTINCT ON (name) id, name FROM books_author ORDER BY name, id) a
+                  ON a.name = p.author
+                LEFT JOIN books_category c ON c.name = p.category
+                LEFT JOIN (SELECT DISTINCT ON (name) id, name FROM books_publisher ORDER BY name, id) pub
+                       ON pub.name = p.publisher
+                ON CONFLICT (external_id) DO UPDATE SET
+                    title = EXCLUDED.title,
+                    subtitle = EXCLUDED.subtitle,
+                    author_id = EXCLUDED.author_id,
+                    category_id = EXCLUDED.category_id,
+                    publisher_id = EXCLUDED.publisher_id,
+                    published_date = EXCLUDED.published_date,
+                    distribution_expense = EXCLUDED.distribution_expense
+                RETURNING 1
+            )
+            SELECT count(*) FROM merged
+        """)
+        written = cursor.fetchone()[0]
+
+        # New books, plus any replaced through their external_id, need fresh search documents.
+        replaced = RawSQL(f'SELECT external_id FROM "{table}_parsed" WHERE external_id IS NOT NULL', [])
+        search.reindex_books(Book.objects.filter(Q(id__gt=last_book_id) | Q(external_id__in=replaced)))
+
+        cursor.execute(f'DROP TABLE "{table}"')
+
+        cursor.execute(f"""
+            SELECT b.id, prev.category_id, b.category_id FROM "{table}_previous" prev
+            JOIN books_book b ON b.id = prev.id
+            WHERE b.category_id IS DISTINCT FROM prev.category_id
+        """)
+        if rollups.move_recategorised_books(cursor.fetchall()):
+            bump_data_version()
+
+    return {'rows': staged, 'written': written, 'skipped': staged - written}
+
+
+# --------------------------------------------------
+# 🪶 Fallback: batched bulk_create
+# --------------------------------------------------
+
+def _parse_expense_row(row):
+    try:
+        expense_date = date.fromisoformat((row.get('date') or '').strip())
+        amount = Decimal((row.get('amount') or '').strip())
+    except (ValueError, InvalidOperation):
+        return None
+    # Same limits as the COPY path: numeric(10, 2), never rounded on the way in.
+    if not amount.is_finite() or amount.as_tuple().exponent < -2 or abs(amount) >= 10 ** 8:
+        return None
+    return {
+        'external_id': (row.get('external_id') or '').strip()[:64] or None,
+        'user': (row.get('user') or '').strip(),
+        'book': (row.get('book') or '').strip(),
+        'expense_type': (row.get('expense_type') or '').strip()[:100],
+        'amount': amount,
+        'date': expense_date,
+    }
+
+
+def _bulk_ingest_expenses(csv_path, columns, batch_size):
+    users = dict(User.objects.values_list('username', 'id'))
+    books, book_categories = {}, {}
+    for pk, title, category_id in Book.objects.order_by('pk').values_list('pk', 'title', 'category_id'):
+        books.setdefault(title, pk)
+        book_categories[pk] = category_id
+    expense_types = dict(ExpenseType.objects.values_list('name', 'id'))
+    shards = {}
+    # {(user, year, month, category, type): [total, count]}, applied once the file is in.
+    groups = defaultdict(lambda: [Decimal('0'), 0])
+
+    def add_to_groups(user_id, expense_date, category_id, expense_type_id, amount, sign):
+        group = groups[(user_id, expense_date.year, expense_date.month, category_id, expense_type_id)]
+        group[0] += sign * amount
+        group[1] += sign
+
+    def flush(batch):
+        missing = sorted({row['expense_type'] for row in batch if row['expense_type']} - expense_types.keys())
+        if missing:
+            ExpenseType.objects.bulk_create([ExpenseType(name=name) for name in missing], ignore_conflicts=True)
+            created = dict(ExpenseType.objects.filter(name__in=missing).values_list('name', 'id'))
+            expense_types.update(created)
+            sharding.replicate(ExpenseType, created.values())
+
+        expenses = {}
+        for row in batch:
+            expense = Expense(
+                external_id=row['external_id'],
+                user_id=users.get(row['user']),
+                book_id=books.get(row['book']),
+                expense_type_id=expense_types.get(row['expense_type']),
+                amount=row['amount'],
+                date=row['date'],
+            )
+            expenses[row['external_id'] or id(expense)] = expense
+
+        by_shard = defaultdict(list)
+        for expense in expenses.values():
+            if expense.user_id not in shards:
+                shards[expense.user_id] = sharding.shard_for_user(expense.user_id, assign=True)
+            by_shard[shards[expense.user_id]].append(expense)
+        for alias, shard_expenses in by_shard.items():
+            # Rows about to be replaced give back their old contribution first.
+            external_ids = [expense.external_id for expense in shard_expenses if expense.external_id]
+            replaced = Expense.objects.using(alias).filter(external_id__in=external_ids).values_list(
+                'user_id', 'date', 'book__category_id', 'expense_type_id', 'amount',
+            )
+            for *key, amount in replaced:
+                add_to_groups(*key, amount, -1)
+            for expense in shard_expenses:
+                add_to_groups(
+                    expense.user_id, expense.date, book_categories.get(expense.book_id), expense.expense_type_id,
+                    expense.amount, 1,
+                )
+            Expense.objects.using(alias).bulk_create(
+                shard_expenses, batch_size=batch_size, update_conflicts=True,
+                unique_fields=['external_id'], update_fields=EXPENSE_UPSERT_FIELDS,
+            )
+        return len(expenses)
+
+    staged = written = 0
+    with open(csv_path, newline='', encoding='utf-8') as file, transaction.atomic():
+        reader = csv.reader(file)
+        next(reader)
+        batch = []
+        for values in reader:
+            staged += 1
+            row = _parse_expense_row(dict(zip(columns, values)))
+            if row is None:
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                written += flush(batch)
+                batch = []
+        if batch:
+            written += flush(batch)
+
+        # bulk_create bypasses the signal handlers, so the rollup and summaries move by the collected deltas.
+        _apply_rollup_groups(
+            [(*key, total, count) for key, (total, count) in groups.items() if total or count], 1,
+        )
+
+    return {'rows': staged, 'written': written, 'skipped': staged - written}
+
+
+def _bulk_ingest_books(csv_path, columns, batch_size):
+    command = ImportBooksCommand(stdout=io.StringIO(), stderr=io.StringIO())
+    call_command(command, csv_path, batch_size=batch_size)
+    rows = command.imported + command.skipped
+    return {'rows': rows, 'written': command.imported, 'skipped': command.skipped}
+
+
+# --------------------------------------------------
+# 🚪 Entry points
+# --------------------------------------------------
+
+def ingest_expenses(csv_path, batch_size=5000, force_orm=False):
+    columns = _normalise_header(_read_header(csv_path), EXPENSE_COLUMNS, ['date', 'amount'])
+    # bulk_create's ON CONFLICT (external_id) needs the unique index that partitioning removes.
+    if uses_copy() and not sharding.is_sharded() and (not force_orm or partitions.is_partitioned()):
+        result = _copy_ingest_expenses(csv_path, columns)
+    else:
+        result = _bulk_ingest_expenses(csv_path, columns, batch_size)
+    bump_data_version()
+    return result
+
+
+def ingest_books(csv_path, batch_size=5000, force_orm=False):
+    columns = _normalise_header(_read_header(csv_path), BOOK_COLUMNS, ['title', 'authors'])
+    # import_books also copies the catalogue to the shards.
+    if uses_copy() and not force_orm and not sharding.is_sharded():
+        result = _copy_ingest_books(csv_path, columns)
+    else:
+        result = _bulk_ingest_books(csv_path, columns, batch_size)
+    bump_data_version()
+    return result
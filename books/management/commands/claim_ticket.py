@@ -0,0 +1,37 @@
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from books.ticket_queue import CLAIM_ORDERINGS, DEFAULT_CLAIM_ORDERING, TicketClaimContention, claim_next_ticket
+
+class Command(BaseCommand):
+    help = "Claim the next open ticket(s), moving them to in_progress. Safe to run from several workers at once."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--order', choices=list(CLAIM_ORDERINGS), default=DEFAULT_CLAIM_ORDERING,
+                            help='oldest: by created_at; priority: most urgent first, then oldest')
+        parser.add_argument('--agent', help='Username to assign the claimed tickets to')
+        parser.add_argument('--count', type=int, default=1, help='Number of tickets to claim (default: 1)')
+
+    def handle(self, *args, **options):
+        agent = None
+        if options['agent']:
+            try:
+                agent = User.objects.get(username=options['agent'])
+            except User.DoesNotExist:
+                raise CommandError(f"No user named '{options['agent']}'.")
+
+        started = time.perf_counter()
+        claimed = 0
+        for _ in range(options['count']):
+            try:
+                ticket = claim_next_ticket(agent=agent, ordering=options['order'])
+            except TicketClaimContention as exc:
+                raise CommandError(str(exc))
+            if ticket is None:
+                self.stdout.write("📭 No open tickets left.")
+                break
+            claimed += 1
+            self.stdout.write(f"🎫 #{ticket.pk} {ticket.subject or ''} (priority {ticket.priority})")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"✅ Claimed {claimed} ticket(s) in {elapsed:.2f}s."))
@@ -0,0 +1,37 @@
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from books.ingest import IngestError, ingest_books, ingest_expenses, uses_copy
+from books.partitions import is_partitioned
+
+class Command(BaseCommand):
+    help = "Bulk-load expenses or books from a CSV file (COPY + upsert on PostgreSQL, bulk_create elsewhere)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['expenses', 'books'], help='What the CSV file contains')
+        parser.add_argument('csv_path', type=str, help='Path to the CSV file')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk_create on the fallback path')
+        parser.add_argument('--orm', action='store_true', help='Use the bulk_create path even on PostgreSQL')
+
+    def handle(self, *args, **options):
+        csv_path = options['csv_path']
+        if not os.path.isfile(csv_path):
+            raise CommandError(f"File not found: {csv_path}")
+
+        ingest = ingest_expenses if options['kind'] == 'expenses' else ingest_books
+        # A partitioned books_expense has no unique index for bulk_create to upsert on.
+        force_orm = options['orm'] and not (ingest is ingest_expenses and is_partitioned())
+        path = 'COPY' if uses_copy() and not force_orm else 'bulk_create'
+
+        started = time.perf_counter()
+        try:
+            result = ingest(csv_path, batch_size=options['batch_size'], force_orm=force_orm)
+        except IngestError as exc:
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - started
+
+        rate = result['rows'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {options['kind'].title()} via {path}: {result['written']} written, "
+            f"{result['skipped']} skipped of {result['rows']} rows in {elapsed:.2f}s — {rate:,.0f} rows/s."
+        ))
@@ -0,0 +1,47 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from books.partitions import (
+    ARCHIVE_SCHEMA, PartitioningError, convert_expense_table, detach_partitions, ensure_partitions,
+)
+
+class Command(BaseCommand):
+    help = "Create upcoming monthly partitions of books_expense and detach expired ones (PostgreSQL)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help='Convert books_expense into a partitioned table first, if it is not one yet')
+        parser.add_argument('--ahead', type=int, default=settings.EXPENSE_PARTITION_MONTHS_AHEAD,
+                            help='Months past the current one to create partitions for')
+        parser.add_argument('--retain-months', type=int, default=settings.EXPENSE_PARTITION_RETAIN_MONTHS,
+                            help='Detach partitions older than this many whole months (0 keeps everything)')
+        parser.add_argument('--drop', action='store_true',
+                            help=f'Drop detached partitions instead of moving them to the {ARCHIVE_SCHEMA} schema')
+
+    def handle(self, *args, **options):
+        if options['ahead'] < 0 or options['retain_months'] < 0:
+            raise CommandError("--ahead and --retain-months cannot be negative.")
+
+        started = time.perf_counter()
+        try:
+            if options['convert']:
+                converted = convert_expense_table(months_ahead=options['ahead'])
+                if converted:
+                    self.stdout.write(f"🔄 Converted books_expense into {converted} partitions.")
+            created = ensure_partitions(months_ahead=options['ahead'])
+            detached = []
+            if options['retain_months']:
+                detached = detach_partitions(options['retain_months'], drop=options['drop'])
+        except PartitioningError as exc:
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - started
+
+        for name in created:
+            self.stdout.write(f"➕ Created {name}")
+        destination = "dropped" if options['drop'] else f"moved to {ARCHIVE_SCHEMA}"
+        for name in detached:
+            self.stdout.write(f"📦 Detached {name} ({destination})")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {len(created)} partition(s) created, {len(detached)} detached in {elapsed:.2f}s."
+        ))
@@ -0,0 +1,69 @@
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from books.models import UserShard
+from books.sharding import is_sharded, move_user, plan_rebalance, replicate_reference_data, shard_aliases, shard_loads
+
+class Command(BaseCommand):
+    help = "Copy reference data to the expense shards and move users between shards to even them out"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tolerance', type=float, default=0.1,
+                            help='Stop once every shard is within this fraction of the mean (default 0.1)')
+        parser.add_argument('--max-moves', type=int, help='Move at most this many users')
+        parser.add_argument('--user', action='append', dest='users', metavar='USERNAME',
+                            help='Move this user to --to instead of planning moves (repeatable)')
+        parser.add_argument('--to', help='Target shard for --user')
+        parser.add_argument('--skip-reference', action='store_true',
+                            help='Do not recopy users, books and the other reference tables first')
+        parser.add_argument('--dry-run', action='store_true', help='Print the planned moves without moving anyone')
+
+    def handle(self, *args, **options):
+        if not is_sharded():
+            raise CommandError("Sharding is off: EXPENSE_SHARDS lists a single database.")
+        aliases = shard_aliases()
+        if bool(options['users']) != bool(options['to']):
+            raise CommandError("--user and --to go together.")
+        if options['to'] and options['to'] not in aliases:
+            raise CommandError(f"Unknown shard {options['to']!r}; choose from {', '.join(aliases)}.")
+
+        started = time.perf_counter()
+        if not options['skip_reference'] and not options['dry_run']:
+            copied = replicate_reference_data()
+            self.stdout.write(f"📚 Copied {sum(copied.values())} reference rows to {len(aliases) - 1} shard(s).")
+
+        loads = shard_loads()
+        placements = dict(UserShard.objects.using(DEFAULT_DB_ALIAS).values_list('user_id', 'shard'))
+        if options['users']:
+            found = dict(User.objects.filter(username__in=options['users']).values_list('username', 'pk'))
+            unknown = [name for name in options['users'] if name not in found]
+            if unknown:
+                raise CommandError(f"No user named {', '.join(repr(name) for name in unknown)}.")
+            moves = [
+                (user_id, alias, options['to'], users[user_id])
+                for user_id in found.values()
+                for alias, users in loads.items()
+                if user_id in users and alias != options['to']
+            ]
+            # Users without rows yet just get the placement.
+            for user_id in found.values():
+                if not any(user_id in users for users in loads.values()) and not options['dry_run']:
+                    UserShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+                        user_id=user_id, defaults={'shard': options['to']},
+                    )
+        else:
+            moves = plan_rebalance(loads, placements, options['tolerance'], options['max_moves'])
+
+        moved = 0
+        for user_id, source, target, rows in moves:
+            self.stdout.write(f"🚚 user {user_id}: {rows} rows {source} → {target}")
+            if not options['dry_run']:
+                moved += move_user(user_id, source, target)
+        elapsed = time.perf_counter() - started
+
+        current = loads if options['dry_run'] else shard_loads()
+        for alias in aliases:
+            self.stdout.write(f"   {alias}: {sum(current[alias].values())} rows")
+        action = "planned" if options['dry_run'] else f"done, {moved} rows moved,"
+        self.stdout.write(self.style.SUCCESS(f"✅ {len(moves)} move(s) {action} in {elapsed:.2f}s."))
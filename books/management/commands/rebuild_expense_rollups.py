@@ -0,0 +1,12 @@
+import time
+from django.core.management.base import BaseCommand
+from books.rollups import rebuild_monthly_rollups
+
+class Command(BaseCommand):
+    help = "Rebuild the monthly expense rollup table from books_expense"
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = rebuild_monthly_rollups()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"✅ Rebuilt {rows} rollup rows in {elapsed:.2f}s."))
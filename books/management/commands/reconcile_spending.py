@@ -0,0 +1,34 @@
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from books.spending import reconcile_spending_summaries
+
+class Command(BaseCommand):
+    help = "Compare the per-user spending summaries with books_expense and repair any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='users', metavar='USERNAME',
+                            help='Only reconcile this user (repeatable)')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without repairing it')
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['users']:
+            found = dict(User.objects.filter(username__in=options['users']).values_list('username', 'pk'))
+            unknown = [name for name in options['users'] if name not in found]
+            if unknown:
+                raise CommandError(f"No user named {', '.join(repr(name) for name in unknown)}.")
+            user_ids = list(found.values())
+
+        started = time.perf_counter()
+        drift = reconcile_spending_summaries(user_ids=user_ids, repair=not options['dry_run'])
+        elapsed = time.perf_counter() - started
+
+        for (user_id, year, month, category_id), (stored_total, stored_count), (total, count) in drift:
+            self.stdout.write(
+                f"⚠️ user {user_id} {year}-{month:02d} category {category_id}: "
+                f"stored ₦{stored_total} ({stored_count}) → actual ₦{total} ({count})"
+            )
+
+        action = "found" if options['dry_run'] else "repaired"
+        self.stdout.write(self.style.SUCCESS(f"✅ {len(drift)} drifted summary key(s) {action} in {elapsed:.2f}s."))
@@ -0,0 +1,85 @@
+import signal
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from books.export_jobs import (
+    ExportClaimContention, ExportJobLost, claim_next_job, default_worker_name, purge_expired_jobs, release_job,
+    requeue_stale_jobs, run_job,
+)
+
+# Seconds between requeueing stale jobs and purging expired ones.
+HOUSEKEEPING_SECONDS = 60
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+class Command(BaseCommand):
+    help = "Write queued background exports to EXPORT_JOB_DIR. Safe to run from several workers at once."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty instead of waiting')
+        parser.add_argument('--max-jobs', type=int, help='Exit after this many jobs')
+        parser.add_argument('--poll-seconds', type=float, default=2.0,
+                            help='Wait between checks of an empty queue (default: 2)')
+        parser.add_argument('--name', help='Worker name recorded on claimed jobs (default: host:pid)')
+
+    def handle(self, *args, **options):
+        worker = options['name'] or default_worker_name()
+        # Deploys stop workers with SIGTERM; hand the current job back instead of leaving it to go stale.
+        previous_handler = signal.signal(signal.SIGTERM, _interrupt)
+        self.stdout.write(f"👷 {worker} writing exports to {settings.EXPORT_JOB_DIR}")
+
+        started = time.perf_counter()
+        done = failed = 0
+        housekeeping_at = None
+        job = None
+        try:
+            while options['max_jobs'] is None or done + failed < options['max_jobs']:
+                if housekeeping_at is None or time.monotonic() - housekeeping_at >= HOUSEKEEPING_SECONDS:
+                    requeued, given_up = requeue_stale_jobs()
+                    purged = purge_expired_jobs()
+                    if requeued or given_up or purged:
+                        self.stdout.write(f"🧹 {requeued} stale job(s) requeued, {given_up} failed, {purged} purged.")
+                    housekeeping_at = time.monotonic()
+
+                try:
+                    job = claim_next_job(worker)
+                except ExportClaimContention as exc:
+                    self.stdout.write(f"⏳ {exc}")
+                    job = None
+                if job is None:
+                    if options['once']:
+                        break
+                    # Drop connections past CONN_MAX_AGE or broken by a database restart while idle.
+                    close_old_connections()
+                    time.sleep(options['poll_seconds'])
+                    continue
+
+                self.stdout.write(f"📤 {job.kind} export {job.pk} (attempt {job.attempts})")
+                job_started = time.perf_counter()
+                try:
+                    run_job(job)
+                except ExportJobLost as exc:
+                    self.stdout.write(f"   ⚠️ {exc}")
+                    job = None
+                    continue
+                if job.status == 'done':
+                    done += 1
+                    self.stdout.write(f"   {job.rows_written} rows → {job.file_name} "
+                                      f"in {time.perf_counter() - job_started:.2f}s")
+                else:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(f"   ❌ {job.error}"))
+                job = None
+        except KeyboardInterrupt:
+            if job is not None and release_job(job):
+                self.stdout.write(f"↩️ Returned export {job.pk} to the queue.")
+            self.stdout.write("🛑 Stopped.")
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"✅ Wrote {done} export(s), {failed} failed, in {elapsed:.2f}s."))
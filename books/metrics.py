@@ -0,0 +1,127 @@
+# books/metrics.py
+"""Prometheus metrics, scraped from ``/metrics``.
+
+Each gunicorn worker is a separate process with its own counters. If
+``PROMETHEUS_MULTIPROC_DIR`` is set before the workers start, prometheus_client
+writes every process's values to memory-mapped files in that directory, and
+a scrape sums them across all workers, including those that have exited.
+``gunicorn.conf.py`` gives each server start an empty directory and marks
+exited workers dead. Without the variable (runserver, tests) the values live
+in the process.
+
+Series:
+
+* ``http_requests_total{view, method, status}`` and
+  ``http_request_duration_seconds{view}``. ``view`` is the URL name, e.g.
+  ``report`` or ``sort-tickets``; requests that match no URL are ``unmatched``.
+* ``db_queries_per_request{view}`` and ``db_time_per_request_seconds{view}``.
+* ``export_rows_total{format}``: expense rows written by row-level exports.
+* ``report_cache_lookups_total{kind, outcome}``, and
+  ``report_cache_hit_ratio{kind}``, which is computed from those counters
+  at scrape time.
+"""
+import os
+from collections import defaultdict
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+
+# Anything else would let clients mint new label values.
+HTTP_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+REQUESTS = Counter('http_requests', 'Requests served.', ['view', 'method', 'status'])
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Time to serve a request, to the end of streamed bodies.', ['view'],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_QUERIES = Histogram(
+    'db_queries_per_request', 'SQL queries run by one request.', ['view'], buckets=QUERY_COUNT_BUCKETS,
+)
+REQUEST_SQL_SECONDS = Histogram(
+    'db_time_per_request_seconds', 'Time one request spent in SQL.', ['view'], buckets=LATENCY_BUCKETS,
+)
+EXPORT_ROWS = Counter('export_rows', 'Expense rows written by row-level exports.', ['format'])
+CACHE_LOOKUPS = Counter('report_cache_lookups', 'Report cache lookups.', ['kind', 'outcome'])
+
+
+# --------------------------------------------------
+# ✍️ Recording
+# --------------------------------------------------
+
+def observe_request(view, method, status, seconds, queries, sql_seconds):
+    view = view or 'unmatched'
+    REQUESTS.labels(view, method if method in HTTP_METHODS else 'other', str(status)).inc()
+    REQUEST_SECONDS.labels(view).observe(seconds)
+    REQUEST_QUERIES.labels(view).observe(queries)
+    REQUEST_SQL_SECONDS.labels(view).observe(sql_seconds)
+
+
+def record_export_rows(export_format, rows):
+    EXPORT_ROWS.labels(export_format).inc(rows)
+
+
+def record_cache_lookup(kind, hit):
+    CACHE_LOOKUPS.labels(kind, 'hit' if hit else 'miss').inc()
+
+
+# --------------------------------------------------
+# 📤 Exposition
+# --------------------------------------------------
+
+def _cache_lookups(source):
+    """``{kind: {'hit': n, 'miss': n}}`` from the ``report_cache_lookups_total`` samples of ``source``."""
+    lookups = defaultdict(lambda: {'hit': 0.0, 'miss': 0.0})
+    for family in source.collect():
+        for sample in family.samples:
+            if sample.name == 'report_cache_lookups_total':
+                lookups[sample.labels['kind']][sample.labels['outcome']] += sample.value
+    return lookups
+
+
+def _multiprocess_collector():
+    """Every worker's values, when they are written to ``PROMETHEUS_MULTIPROC_DIR``; else ``None``."""
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        return None
+    registry = CollectorRegistry()
+    return registry, multiprocess.MultiProcessCollector(registry)
+
+
+def cache_lookup_counts():
+    """Report cache hits and misses per kind, summed across workers like a scrape."""
+    workers = _multiprocess_collector()
+    return dict(_cache_lookups(workers[1] if workers else CACHE_LOOKUPS))
+
+
+class CacheHitRatioCollector:
+    """``report_cache_hit_ratio{kind}`` over every lookup counted by ``source``."""
+
+    def __init__(self, source):
+        self.source = source
+
+    def collect(self):
+        lookups = _cache_lookups(self.source)
+        ratio = GaugeMetricFamily('report_cache_hit_ratio', 'Share of report cache lookups that hit.', labels=['kind'])
+        for kind, counts in sorted(lookups.items()):
+            total = counts['hit'] + counts['miss']
+            if total:
+                ratio.add_metric([kind], counts['hit'] / total)
+        yield ratio
+
+
+REGISTRY.register(CacheHitRatioCollector(CACHE_LOOKUPS))
+
+
+def render_metrics():
+    """Return ``(body, content_type)`` in the Prometheus text format."""
+    registry = REGISTRY
+    workers = _multiprocess_collector()
+    if workers:
+        # Read every worker's files on each scrape; this process's own values are among them.
+        registry, collector = workers
+        registry.register(CacheHitRatioCollector(collector))
+    return generate_latest(registry), CONTENT_TYPE_LATEST
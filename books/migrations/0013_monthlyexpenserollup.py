@@ -0,0 +1,62 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+
+def backfill_rollups(apps, schema_editor):
+    Expense = apps.get_model('books', 'Expense')
+    MonthlyExpenseRollup = apps.get_model('books', 'MonthlyExpenseRollup')
+    groups = (
+        Expense.objects
+        .annotate(year=ExtractYear('date'), month=ExtractMonth('date'))
+        .values('year', 'month', 'book__category_id', 'expense_type_id')
+        .annotate(total=Sum('amount'), count=Count('id'))
+        .order_by()
+    )
+    MonthlyExpenseRollup.objects.bulk_create(
+        [
+            MonthlyExpenseRollup(
+                year=row['year'],
+                month=row['month'],
+                category_id=row['book__category_id'],
+                expense_type_id=row['expense_type_id'],
+                total=row['total'],
+                count=row['count'],
+            )
+            for row in groups
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0012_alter_expense_created_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyExpenseRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='books.category')),
+                ('expense_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='books.expensetype')),
+            ],
+            options={
+                'verbose_name': 'Monthly Expense Rollup',
+                'verbose_name_plural': 'Monthly Expense Rollups',
+                'db_table': 'books_monthlyexpenserollup',
+                'ordering': ['year', 'month'],
+                'constraints': [models.UniqueConstraint(fields=('year', 'month', 'category', 'expense_type'), name='unique_monthly_expense_rollup')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0014_expense_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='external_id',
+            field=models.CharField(blank=True, help_text='Identifier from the source catalogue, used to upsert on re-import', max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='external_id',
+            field=models.CharField(blank=True, help_text='Identifier from the source ledger, used to upsert on re-import', max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:30
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_facets(apps, schema_editor):
+    MonthlyExpenseRollup = apps.get_model('books', 'MonthlyExpenseRollup')
+    ExpenseFacet = apps.get_model('books', 'ExpenseFacet')
+    groups = [
+        ('month', MonthlyExpenseRollup.objects.values_list('month')),
+        ('year', MonthlyExpenseRollup.objects.values_list('year')),
+        ('category', MonthlyExpenseRollup.objects.filter(category__isnull=False).values_list('category_id')),
+    ]
+    ExpenseFacet.objects.bulk_create([
+        ExpenseFacet(kind=kind, value=value, count=count)
+        for kind, rows in groups
+        for value, count in rows.annotate(expenses=Sum('count')).order_by()
+        if count
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0016_dataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('month', 'Month'), ('year', 'Year'), ('category', 'Category')], max_length=10)),
+                ('value', models.BigIntegerField(help_text='Month number, year, or category id')),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Expense Facet',
+                'verbose_name_plural': 'Expense Facets',
+                'db_table': 'books_expensefacet',
+                'ordering': ['kind', 'value'],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'value'), name='unique_expense_facet')],
+            },
+        ),
+        migrations.RunPython(backfill_facets, migrations.RunPython.noop),
+    ]
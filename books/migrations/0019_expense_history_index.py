@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0018_ticket_claiming'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['user', '-date', '-id'], name='expense_user_date_id_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='expense',
+            name='expense_user_date_idx',
+        ),
+    ]
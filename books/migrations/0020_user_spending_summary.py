@@ -0,0 +1,60 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+
+def backfill_spending_summaries(apps, schema_editor):
+    Expense = apps.get_model('books', 'Expense')
+    UserSpendingSummary = apps.get_model('books', 'UserSpendingSummary')
+    groups = (
+        Expense.objects.filter(user__isnull=False)
+        .annotate(year=ExtractYear('date'), month=ExtractMonth('date'))
+        .values('user_id', 'year', 'month', 'book__category_id')
+        .annotate(total=Sum('amount'), count=Count('id'))
+        .order_by()
+    )
+    UserSpendingSummary.objects.bulk_create(
+        (
+            UserSpendingSummary(
+                user_id=row['user_id'], year=row['year'], month=row['month'],
+                category_id=row['book__category_id'], total=row['total'], count=row['count'],
+            )
+            for row in groups.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0019_expense_history_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSpendingSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='books.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spending_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'User Spending Summary',
+                'verbose_name_plural': 'User Spending Summaries',
+                'db_table': 'books_userspendingsummary',
+                'ordering': ['user', 'year', 'month'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'year', 'month', 'category'), name='unique_user_spending_summary')],
+            },
+        ),
+        migrations.RunPython(backfill_spending_summaries, migrations.RunPython.noop),
+    ]
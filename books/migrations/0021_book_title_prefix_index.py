@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:55
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0020_user_spending_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(django.db.models.functions.text.Lower('title'), models.F('id'), name='book_title_prefix_idx'),
+        ),
+    ]
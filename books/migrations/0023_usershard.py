@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('books', '0022_partition_expenses'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserShard',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='expense_shard', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('shard', models.CharField(help_text='Database alias from EXPENSE_SHARDS', max_length=64)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'User Shard',
+                'verbose_name_plural': 'User Shards',
+                'db_table': 'books_usershard',
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:55
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0023_usershard'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('csv', 'CSV'), ('xlsx', 'XLSX')], max_length=10)),
+                ('params', models.JSONField(blank=True, default=dict, help_text='Report filters, as query string lists')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('rows_written', models.PositiveBigIntegerField(default=0)),
+                ('rows_total', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('file_name', models.CharField(blank=True, max_length=255)),
+                ('error', models.TextField(blank=True)),
+                ('worker', models.CharField(blank=True, max_length=255)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Export Job',
+                'verbose_name_plural': 'Export Jobs',
+                'db_table': 'books_exportjob',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(condition=models.Q(('status', 'queued')), fields=['status', 'created_at'], name='exportjob_queued_idx'), models.Index(condition=models.Q(('status', 'running')), fields=['status', 'heartbeat_at'], name='exportjob_running_idx')],
+            },
+        ),
+    ]
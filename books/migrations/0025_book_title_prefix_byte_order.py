@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:10
+
+import books.models
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0024_exportjob'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='book',
+            name='book_title_prefix_idx',
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(books.models.ByteOrder(django.db.models.functions.text.Lower('title')), models.F('id'), name='book_title_prefix_idx'),
+        ),
+    ]
@@ -1,4 +1,7 @@
+import uuid
+
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
 from django.utils import timezone
 
@@ -17,6 +20,32 @@ def safe_create_expense(data):
     )
     return expense
 
+# 🔤 Byte-order text comparison
+class ByteOrder(models.Func):
+    """``expression COLLATE "C"``: compare text by code point, whatever the database's collation.
+
+    Prefix ranges (``>= 'abc' AND < 'abd'``) only match "starts with" in
+    this order; a linguistic collation such as en_US ignores punctuation
+    and spaces on its first pass. SQLite already compares this way (its
+    default ``BINARY`` collation) and has no collation named "C".
+    """
+    # Not Collate: index expressions only accept that class itself as a wrapper.
+    template = '(%(expressions)s COLLATE "C")'
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return compiler.compile(self.get_source_expressions()[0])
+
+# 🧩 Querysets for rows stored on the user's shard
+class UserShardedQuerySet(models.QuerySet):
+    """``create()`` without ``using()`` lets the routers place the row by its user (see ``books.sharding``)."""
+
+    def create(self, **kwargs):
+        if self._db is not None or self._hints:
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
 # 📚 Author Model
 class Author(models.Model):
     name = models.CharField(max_length=100, help_text="Full name of the author")
@@ -84,12 +113,18 @@ class Book(models.Model):
     publisher = models.ForeignKey(Publisher, on_delete=models.SET_NULL, null=True, related_name='books')
     published_date = models.DateField(blank=True, null=True)
     distribution_expense = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    external_id = models.CharField(max_length=64, unique=True, null=True, blank=True,
+                                   help_text="Identifier from the source catalogue, used to upsert on re-import")
 
     class Meta:
         verbose_name = "Book"
         verbose_name_plural = "Books"
         ordering = ['-published_date']
         db_table = "books_book"
+        indexes = [
+            # Prefix search for the book picker (see books.autocomplete).
+            models.Index(ByteOrder(Lower('title')), 'id', name='book_title_prefix_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -121,14 +156,26 @@ class Expense(models.Model):
     expense_type = models.ForeignKey(ExpenseType, on_delete=models.SET_NULL, null=True, blank=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     date = models.DateField(default=timezone.now)
+    external_id = models.CharField(max_length=64, unique=True, null=True, blank=True,
+                                   help_text="Identifier from the source ledger, used to upsert on re-import")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = UserShardedQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Expense"
         verbose_name_plural = "Expenses"
         ordering = ['-date']
         db_table = "books_expense"
+        indexes = [
+            # Half-open date ranges from the report filters.
+            models.Index(fields=['date'], name='expense_date_idx'),
+            # Dashboard and expense history: one user's expenses in keyset order.
+            models.Index(fields=['user', '-date', '-id'], name='expense_user_date_id_idx'),
+            # Category filters reach expenses through book_id, then narrow by date.
+            models.Index(fields=['book', 'date'], name='expense_book_date_idx'),
+        ]
 
     def __str__(self):
         book_title = self.book.title if self.book else "Unlinked"
@@ -140,6 +187,135 @@ class Expense(models.Model):
         return f"<Expense: ₦{self.amount} on {self.date}>"
 
 
+# 🔢 Data Version Model
+class DataVersion(models.Model):
+    """A counter bumped after every committed write to a data set.
+
+    The report cache puts the ``reports`` version into its keys, so a write
+    makes every cached report stale at once without deleting anything.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    version = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Data Version"
+        verbose_name_plural = "Data Versions"
+        db_table = "books_dataversion"
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+    def __repr__(self):
+        return f"<DataVersion: {self.name} v{self.version}>"
+
+
+# 📈 Monthly Expense Rollup Model
+class MonthlyExpenseRollup(models.Model):
+    """Running expense totals per (year, month, category, expense type).
+
+    Kept in sync by the signal handlers in ``books.signals`` so that the
+    reports never have to aggregate ``books_expense`` directly. Rows are
+    additive: summing every row for a key always gives the right total.
+    """
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    expense_type = models.ForeignKey(ExpenseType, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Monthly Expense Rollup"
+        verbose_name_plural = "Monthly Expense Rollups"
+        ordering = ['year', 'month']
+        db_table = "books_monthlyexpenserollup"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['year', 'month', 'category', 'expense_type'],
+                name='unique_monthly_expense_rollup',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.year}-{self.month:02d}: ₦{self.total} ({self.count} expenses)"
+
+    def __repr__(self):
+        return f"<MonthlyExpenseRollup: {self.year}-{self.month:02d} ₦{self.total}>"
+
+
+# 👛 User Spending Summary Model
+class UserSpendingSummary(models.Model):
+    """Running expense totals per (user, year, month, category).
+
+    The dashboard's lifetime, month-to-date, year-to-date and per-category
+    figures are sums over one user's rows here. They never aggregate
+    ``books_expense``. Kept in sync by the same deltas as
+    ``MonthlyExpenseRollup`` (see ``books.spending``). Rows are additive.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='spending_summaries')
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "User Spending Summary"
+        verbose_name_plural = "User Spending Summaries"
+        ordering = ['user', 'year', 'month']
+        db_table = "books_userspendingsummary"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'year', 'month', 'category'],
+                name='unique_user_spending_summary',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.year}-{self.month:02d}: ₦{self.total} ({self.count} expenses)"
+
+    def __repr__(self):
+        return f"<UserSpendingSummary: {self.user_id} {self.year}-{self.month:02d} ₦{self.total}>"
+
+
+# 🏷️ Expense Facet Model
+class ExpenseFacet(models.Model):
+    """How many expenses fall in each month, year and category.
+
+    One row per distinct value, so the report dropdowns read a few dozen
+    rows however large ``books_expense`` grows. Counts move with the same
+    deltas as ``MonthlyExpenseRollup`` (see ``books.facets``); rows whose
+    count drops to zero are kept but hidden from the dropdowns.
+    """
+    MONTH = 'month'
+    YEAR = 'year'
+    CATEGORY = 'category'
+    KIND_CHOICES = [
+        (MONTH, 'Month'),
+        (YEAR, 'Year'),
+        (CATEGORY, 'Category'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    value = models.BigIntegerField(help_text="Month number, year, or category id")
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Expense Facet"
+        verbose_name_plural = "Expense Facets"
+        ordering = ['kind', 'value']
+        db_table = "books_expensefacet"
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'value'], name='unique_expense_facet'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.value}: {self.count}"
+
+    def __repr__(self):
+        return f"<ExpenseFacet: {self.kind}={self.value} ({self.count})>"
+
+
 # 🎟️ Ticket Model
 class Ticket(models.Model):
     STATUS_CHOICES = [
@@ -148,18 +324,40 @@ class Ticket(models.Model):
         ('resolved', 'Resolved'),
     ]
 
+    # Lower numbers are more urgent, matching the /sort-tickets/ priority ordering.
+    PRIORITY_CHOICES = [
+        (1, 'Urgent'),
+        (2, 'High'),
+        (3, 'Normal'),
+        (4, 'Low'),
+    ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     subject = models.CharField(max_length=200, null=True, blank=True)
     description = models.TextField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
+    priority = models.PositiveSmallIntegerField(choices=PRIORITY_CHOICES, default=3)
+    assigned_to = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='claimed_tickets')
+    claimed_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = UserShardedQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Ticket"
         verbose_name_plural = "Tickets"
         ordering = ['-created_at']
         db_table = "books_ticket"
+        indexes = [
+            # Claiming: oldest open ticket first. Only open tickets are indexed.
+            models.Index(fields=['status', 'created_at'], name='ticket_open_created_idx',
+                         condition=models.Q(status='open')),
+            # Claiming: most urgent open ticket first.
+            models.Index(fields=['status', 'priority', 'created_at'], name='ticket_open_priority_idx',
+                         condition=models.Q(status='open')),
+        ]
 
     def __str__(self):
         username = self.user.username if self.user else "Anonymous"
@@ -167,3 +365,84 @@ class Ticket(models.Model):
 
     def __repr__(self):
         return f"<Ticket: {self.subject} – {self.status}>"
+
+
+# 🧩 User Shard Model
+class UserShard(models.Model):
+    """Which database holds a user's expenses and tickets when sharding is on.
+
+    Stored on ``default`` and written on the user's first expense or ticket
+    (see ``books.sharding``). ``rebalance_shards`` updates it when it moves
+    a user; otherwise a placement never changes.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='expense_shard')
+    shard = models.CharField(max_length=64, help_text="Database alias from EXPENSE_SHARDS")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "User Shard"
+        verbose_name_plural = "User Shards"
+        db_table = "books_usershard"
+
+    def __str__(self):
+        return f"{self.user_id} → {self.shard}"
+
+    def __repr__(self):
+        return f"<UserShard: {self.user_id} on {self.shard}>"
+
+
+# 📤 Export Job Model
+class ExportJob(models.Model):
+    """A row-level export written in the background by ``run_export_worker``.
+
+    The table is the queue: ``queued`` jobs are claimed by workers (see
+    ``books.export_jobs``), which keep ``heartbeat_at`` fresh while they
+    write and finish as ``done`` with a file under ``EXPORT_JOB_DIR``, or
+    ``failed``. The random id doubles as the download link.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    KIND_CHOICES = [
+        ('csv', 'CSV'),
+        ('xlsx', 'XLSX'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='export_jobs')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    params = models.JSONField(default=dict, blank=True, help_text="Report filters, as query string lists")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    rows_written = models.PositiveBigIntegerField(default=0)
+    rows_total = models.PositiveBigIntegerField(null=True, blank=True)
+    file_name = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=255, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Export Job"
+        verbose_name_plural = "Export Jobs"
+        ordering = ['-created_at']
+        db_table = "books_exportjob"
+        indexes = [
+            # Claiming: oldest queued job first. Only queued jobs are indexed.
+            models.Index(fields=['status', 'created_at'], name='exportjob_queued_idx',
+                         condition=models.Q(status='queued')),
+            # Requeueing jobs whose worker stopped sending heartbeats.
+            models.Index(fields=['status', 'heartbeat_at'], name='exportjob_running_idx',
+                         condition=models.Q(status='running')),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} export {self.pk} ({self.status})"
+
+    def __repr__(self):
+        return f"<ExportJob: {self.pk} – {self.kind} {self.status}>"
@@ -0,0 +1,54 @@
+# books/pagination.py
+"""A paginator that does not ``COUNT(*)`` a table with millions of rows.
+
+For an unfiltered queryset over a large table, ``count`` comes from the
+planner's row estimate: ``pg_class.reltuples`` on PostgreSQL, or
+``sqlite_stat1`` on SQLite once ``ANALYZE`` has run. Tables smaller than
+``exact_count_threshold``, and any table without statistics, are counted
+exactly.
+
+A filtered queryset is counted only up to ``filtered_count_limit`` rows.
+Past that the admin shows the limit, and the user narrows the filters
+instead of paging through hundreds of thousands of rows.
+"""
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def estimated_row_count(model, using='default'):
+    """The planner's estimate of ``model``'s row count, or ``None`` when there are no statistics."""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)", [table])
+            row = cursor.fetchone()
+            # reltuples is -1 until the table is first vacuumed or analysed.
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s", [table])
+            # The first number of each index's stat is the rows it covers; partial indexes cover fewer.
+            counts = [int(stat.split()[0]) for stat, in cursor.fetchall()]
+            return max(counts) if counts else None
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    exact_count_threshold = 100_000
+    filtered_count_limit = 100_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if queryset.query.is_sliced:
+            return super().count
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= self.exact_count_threshold:
+                return estimate
+            return queryset.count()
+        return queryset.order_by()[:self.filtered_count_limit].count()
@@ -0,0 +1,25 @@
+# books/parsers.py
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """Newline-delimited JSON: one object per line, blank lines ignored. Parses to a list."""
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        rows = []
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rows.append(json.loads(line.decode(encoding)))
+            except (UnicodeDecodeError, ValueError) as exc:
+                raise ParseError(f"NDJSON parse error on line {line_number}: {exc}")
+        return rows
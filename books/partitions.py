@@ -0,0 +1,293 @@
+# books/partitions.py
+"""Monthly range partitioning of ``books_expense`` on PostgreSQL.
+
+This is opt-in: ``manage.py partition_expenses --convert`` runs
+``convert_expense_table``. No migration does, so later changes here never
+change what an old migration did. The conversion:
+
+* rebuilds ``books_expense`` as ``PARTITION BY RANGE (date)``, with one
+  partition per month (``books_expense_y2025m01`` holds January 2025) and a
+  ``books_expense_default`` partition for dates outside them;
+* keeps the table name, the ``id`` sequence, the foreign keys and every
+  index under its old name. The primary key becomes ``(id, date)``, since a
+  unique index on a partitioned table has to include the partition key;
+* moves the global uniqueness of ``external_id`` to the
+  ``books_expense_external_id`` side table. Row triggers keep it in step with
+  inserts, deletes and updates, and ingestion upserts through it instead
+  of ``ON CONFLICT (external_id)``.
+
+Report, export and dashboard filters are half-open date ranges
+(``date >= '2025-01-01' AND date < '2026-01-01'``), so the planner prunes
+every partition outside the range before the query runs.
+
+``ensure_partitions`` creates the months ahead before rows arrive for them.
+Rows that landed in the default partition in the meantime are moved into the
+new partition. ``detach_partitions`` removes months past a retention
+window. Each one is moved to the ``expense_archive`` schema, or dropped, and
+the rollups are rebuilt without it.
+"""
+import re
+from datetime import date
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from .models import Expense
+
+TABLE = Expense._meta.db_table
+DEFAULT_PARTITION = f"{TABLE}_default"
+EXTERNAL_ID_TABLE = f"{TABLE}_external_id"
+ARCHIVE_SCHEMA = 'expense_archive'
+DEFAULT_MONTHS_AHEAD = 3
+
+_BOUNDS = re.compile(r"FROM \('(\d{4}-\d{2}-\d{2})'\) TO \('(\d{4}-\d{2}-\d{2})'\)")
+
+# Keeps books_expense_external_id equal to the non-null external_ids in books_expense.
+# A row moving to another partition fires DELETE then INSERT, which leaves the same pair.
+_EXTERNAL_ID_SQL = f"""
+    CREATE TABLE {EXTERNAL_ID_TABLE} (
+        external_id varchar(64) PRIMARY KEY,
+        expense_id bigint NOT NULL
+    );
+    INSERT INTO {EXTERNAL_ID_TABLE} (external_id, expense_id)
+    SELECT external_id, id FROM {TABLE} WHERE external_id IS NOT NULL;
+
+    CREATE FUNCTION {EXTERNAL_ID_TABLE}_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' AND OLD.external_id IS NOT DISTINCT FROM NEW.external_id THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.external_id IS NOT NULL THEN
+            DELETE FROM {EXTERNAL_ID_TABLE} WHERE external_id = OLD.external_id;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'INSERT') AND NEW.external_id IS NOT NULL THEN
+            INSERT INTO {EXTERNAL_ID_TABLE} (external_id, expense_id) VALUES (NEW.external_id, NEW.id);
+        END IF;
+        RETURN NULL;
+    END $$;
+    CREATE TRIGGER {EXTERNAL_ID_TABLE}_sync
+        AFTER INSERT OR DELETE OR UPDATE OF external_id ON {TABLE}
+        FOR EACH ROW EXECUTE FUNCTION {EXTERNAL_ID_TABLE}_sync();
+
+    CREATE FUNCTION {EXTERNAL_ID_TABLE}_truncate() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        TRUNCATE {EXTERNAL_ID_TABLE};
+        RETURN NULL;
+    END $$;
+    CREATE TRIGGER {EXTERNAL_ID_TABLE}_truncate
+        AFTER TRUNCATE ON {TABLE}
+        FOR EACH STATEMENT EXECUTE FUNCTION {EXTERNAL_ID_TABLE}_truncate();
+"""
+
+
+class PartitioningError(Exception):
+    pass
+
+
+def add_months(day, months):
+    """The first day of the month ``months`` after the month of ``day``."""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{TABLE}_y{month.year}m{month.month:02d}"
+
+
+def _require_postgresql(connection):
+    if connection.vendor != 'postgresql':
+        raise PartitioningError(f"Expense partitioning needs PostgreSQL, not {connection.vendor}.")
+
+
+def is_partitioned(using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))", [TABLE])
+        return cursor.fetchone()[0]
+
+
+def list_partitions(using=DEFAULT_DB_ALIAS):
+    """``[(name, first_day, end)]`` for the monthly partitions, oldest first; ``end`` is exclusive."""
+    with connections[using].cursor() as cursor:
+        cursor.execute("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+        """, [TABLE])
+        partitions = []
+        for name, bound in cursor.fetchall():
+            match = _BOUNDS.search(bound)
+            if match:
+                partitions.append((name, date.fromisoformat(match[1]), date.fromisoformat(match[2])))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+# --------------------------------------------------
+# 🔄 Conversion
+# --------------------------------------------------
+
+def _create_month(cursor, month):
+    cursor.execute(
+        f"CREATE TABLE {partition_name(month)} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)",
+        [month, add_months(month, 1)],
+    )
+
+
+def convert_expense_table(months_ahead=DEFAULT_MONTHS_AHEAD, today=None, using=DEFAULT_DB_ALIAS):
+    """Rebuild ``books_expense`` as a monthly partitioned table, in one transaction.
+
+    The table is locked against reads and writes while its rows are copied.
+    Partitions cover the month of the oldest expense through ``months_ahead``
+    months past ``today``. Returns the number of partitions created, or 0 if
+    the table is partitioned already.
+    """
+    connection = connections[using]
+    _require_postgresql(connection)
+    today = today or timezone.localdate()
+    staging = f"{TABLE}_partitioned"
+
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE")
+        if is_partitioned(using):
+            return 0
+        # Deferred foreign key checks from earlier writes in this transaction would block the DROP.
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+        # Index and foreign key definitions, recreated under the same names on the new table.
+        cursor.execute("""
+            SELECT pg_get_indexdef(x.indexrelid), x.indisunique
+            FROM pg_index x WHERE x.indrelid = to_regclass(%s) AND NOT x.indisprimary
+        """, [TABLE])
+        indexes = [
+            definition.replace('CREATE UNIQUE INDEX', 'CREATE INDEX', 1) if unique else definition
+            for definition, unique in cursor.fetchall()
+        ]
+        cursor.execute("""
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = to_regclass(%s) AND contype = 'f'
+        """, [TABLE])
+        foreign_keys = cursor.fetchall()
+
+        cursor.execute(
+            f"CREATE TABLE {staging} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING IDENTITY) PARTITION BY RANGE (date)"
+        )
+        cursor.execute(f"SELECT min(date) FROM {TABLE}")
+        oldest = cursor.fetchone()[0] or today
+        first, last = add_months(min(oldest, today), 0), add_months(today, months_ahead)
+        month, created = first, 0
+        while month <= last:
+            cursor.execute(
+                f"CREATE TABLE {partition_name(month)} PARTITION OF {staging} FOR VALUES FROM (%s) TO (%s)",
+                [month, add_months(month, 1)],
+            )
+            month, created = add_months(month, 1), created + 1
+        cursor.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {staging} DEFAULT")
+
+        cursor.execute(f"INSERT INTO {staging} OVERRIDING SYSTEM VALUE SELECT * FROM {TABLE}")
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [staging])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f"SELECT setval(%s, coalesce(max(id), 0) + 1, false) FROM {staging}", [sequence])
+
+        cursor.execute(f"DROP TABLE {TABLE}")
+        cursor.execute(f"ALTER TABLE {staging} RENAME TO {TABLE}")
+        cursor.execute(f"ALTER SEQUENCE {sequence} RENAME TO {TABLE}_id_seq")
+
+        # Built after the copy: one sorted build per partition beats maintaining them row by row.
+        cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, date)")
+        for definition in indexes:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT "{name}" {definition}')
+        cursor.execute(_EXTERNAL_ID_SQL)
+        cursor.execute(f"ANALYZE {TABLE}")
+
+    return created + 1
+
+
+# --------------------------------------------------
+# 🗓️ Maintenance
+# --------------------------------------------------
+
+def ensure_partitions(months_ahead=DEFAULT_MONTHS_AHEAD, today=None, using=DEFAULT_DB_ALIAS):
+    """Create any missing monthly partition from the month of ``today`` through ``months_ahead`` months on.
+
+    Rows for a new month that are already in the default partition are moved
+    into it. Returns the names of the partitions created.
+    """
+    connection = connections[using]
+    _require_postgresql(connection)
+    if not is_partitioned(using):
+        raise PartitioningError(f"{TABLE} is not partitioned; run partition_expenses --convert first.")
+    today = today or timezone.localdate()
+    existing = {first for _, first, _ in list_partitions(using)}
+
+    created = []
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        month = add_months(today, 0)
+        while month <= add_months(today, months_ahead):
+            if month not in existing:
+                _create_month_from_default(cursor, month)
+                created.append(partition_name(month))
+            month = add_months(month, 1)
+    return created
+
+
+def _create_month_from_default(cursor, month):
+    end = add_months(month, 1)
+    cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE date >= %s AND date < %s)", [month, end])
+    if not cursor.fetchone()[0]:
+        _create_month(cursor, month)
+        return
+
+    # A new partition may not overlap rows in the default one: move them out first.
+    # Deleting them drops their external_ids from the side table; they go back once attached.
+    name = partition_name(month)
+    cursor.execute(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)")
+    cursor.execute(
+        f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE date >= %s AND date < %s", [month, end],
+    )
+    cursor.execute(f"DELETE FROM {DEFAULT_PARTITION} WHERE date >= %s AND date < %s", [month, end])
+    cursor.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", [month, end])
+    cursor.execute(f"""
+        INSERT INTO {EXTERNAL_ID_TABLE} (external_id, expense_id)
+        SELECT external_id, id FROM {name} WHERE external_id IS NOT NULL
+    """)
+
+
+def detach_partitions(retain_months, drop=False, today=None, using=DEFAULT_DB_ALIAS):
+    """Detach the monthly partitions that end before the last ``retain_months`` whole months.
+
+    The current month is always kept. Detached partitions are moved to the
+    ``expense_archive`` schema, or dropped with ``drop=True``. The rollups,
+    facets and spending summaries are then rebuilt without their rows.
+    Returns the names of the partitions detached.
+    """
+    from .report_cache import bump_data_version
+    from .rollups import rebuild_monthly_rollups
+
+    connection = connections[using]
+    _require_postgresql(connection)
+    today = today or timezone.localdate()
+    cutoff = add_months(today, -retain_months)
+    old = [name for name, _, end in list_partitions(using) if end <= cutoff]
+    if not old:
+        return []
+
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        if not drop:
+            cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+        for name in old:
+            cursor.execute(f"""
+                DELETE FROM {EXTERNAL_ID_TABLE} k USING {name} e
+                WHERE k.external_id = e.external_id
+            """)
+            cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {name}")
+            if drop:
+                cursor.execute(f"DROP TABLE {name}")
+            else:
+                cursor.execute(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}")
+        rebuild_monthly_rollups()
+        bump_data_version(using)
+    return old
@@ -0,0 +1,62 @@
+# books/query_pool.py
+"""Run independent read queries at the same time from async views.
+
+Django's async ORM calls (``afirst``, ``aaggregate``, ``async for``) hand the
+query to one shared thread. Awaiting several of them together still sends
+the queries one after another on a single connection. ``gather_queries``
+uses a small dedicated thread pool instead. Each worker thread has its own
+connection, so N independent queries take about as long as the slowest one
+rather than the sum of all N.
+
+Worker connections follow ``CONN_MAX_AGE`` the same way request threads
+do. At most ``REPORT_QUERY_WORKERS`` extra connections are opened per
+process.
+"""
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.REPORT_QUERY_WORKERS, thread_name_prefix='report-query'
+            )
+        return _executor
+
+
+def _on_worker_connection(fn, using):
+    def run():
+        connection = connections[using]
+        connection.close_if_unusable_or_obsolete()
+        try:
+            return fn()
+        finally:
+            connection.close_if_unusable_or_obsolete()
+    return run
+
+
+async def gather_queries(*fns, using='default'):
+    """Call each of ``fns`` (sync, no arguments) on a pool thread and return their results in order.
+
+    The pool connections cannot see an uncommitted transaction on the
+    caller's connection. Only use this for reads of committed data.
+    """
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    # Each call runs in a copy of the caller's context, so per-request state (e.g. metrics) follows it.
+    return await asyncio.gather(
+        *(
+            loop.run_in_executor(executor, contextvars.copy_context().run, _on_worker_connection(fn, using))
+            for fn in fns
+        )
+    )
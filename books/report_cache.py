@@ -0,0 +1,128 @@
+# books/report_cache.py
+"""Versioned result cache for the report and export views.
+
+Cache keys combine the normalised report filters with the ``reports``
+data version. Every committed write to an expense or ticket bumps that
+version, so a write makes all earlier entries unreachable instead of
+deleting them one by one; they age out of the cache on their own.
+
+The version lives in the database, not the cache, so per-process caches
+such as the default local-memory backend still see writes made by other
+workers. It is bumped once per transaction, after the commit, so writers
+do not queue behind each other on the version row.
+
+Hit and miss counts come from the ``report_cache_lookups_total``
+Prometheus counters, so they cover every gunicorn worker, not just the
+one answering.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+from django.db.models import F
+
+from .metrics import cache_lookup_counts, record_cache_lookup
+from .models import DataVersion
+
+REPORT_DATA_VERSION = 'reports'
+
+
+# --------------------------------------------------
+# 🔢 Data version
+# --------------------------------------------------
+
+def get_data_version():
+    return (
+        DataVersion.objects.filter(name=REPORT_DATA_VERSION)
+        .values_list('version', flat=True)
+        .first()
+    ) or 0
+
+
+async def aget_data_version():
+    return (
+        await DataVersion.objects.filter(name=REPORT_DATA_VERSION)
+        .values_list('version', flat=True)
+        .afirst()
+    ) or 0
+
+
+def bump_data_version(using=DEFAULT_DB_ALIAS):
+    """Make every cached report stale once the current transaction on ``using`` commits.
+
+    The bump runs after the commit as a statement of its own, so the version
+    row is never locked for the length of a writer's transaction, and a
+    transaction that writes many rows bumps once. Bumping after the commit
+    is still safe: a reader that sees the new version also sees the new
+    data, so nothing old is cached under it. Outside a transaction the
+    version is bumped at once.
+    """
+    if any(func is _increment_data_version for _, func, _ in connections[using].run_on_commit):
+        return
+    transaction.on_commit(_increment_data_version, using=using)
+
+
+def _increment_data_version():
+    rows = DataVersion.objects.using(DEFAULT_DB_ALIAS).filter(name=REPORT_DATA_VERSION)
+    if rows.update(version=F('version') + 1):
+        return
+    try:
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            DataVersion.objects.using(DEFAULT_DB_ALIAS).create(name=REPORT_DATA_VERSION, version=1)
+    except IntegrityError:
+        # Another writer created the row first.
+        rows.update(version=F('version') + 1)
+
+
+# --------------------------------------------------
+# 🧠 Cache access
+# --------------------------------------------------
+
+def report_cache():
+    return caches[settings.REPORT_CACHE_ALIAS]
+
+
+def report_cache_key(kind, params, version):
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+    return f"books:report:{kind}:v{version}:{digest}"
+
+
+def cached_report(kind, params, compute):
+    """Return ``(value, hit)`` for ``kind`` and ``params``, calling ``compute()`` on a miss."""
+    cache = report_cache()
+    key = report_cache_key(kind, params, get_data_version())
+    value = cache.get(key)
+    hit = value is not None
+    if not hit:
+        value = compute()
+        cache.set(key, value)
+    record_cache_lookup(kind, hit)
+    return value, hit
+
+
+async def acached_report(kind, params, acompute):
+    """Async ``cached_report``: ``acompute()`` is awaited on a miss."""
+    cache = report_cache()
+    key = report_cache_key(kind, params, await aget_data_version())
+    value = await cache.aget(key)
+    hit = value is not None
+    if not hit:
+        value = await acompute()
+        await cache.aset(key, value)
+    record_cache_lookup(kind, hit)
+    return value, hit
+
+
+def cache_stats():
+    """Hit and miss counts, overall and per report kind, across every worker."""
+    stats = {'hits': 0, 'misses': 0, 'kinds': {}}
+    for kind, counts in sorted(cache_lookup_counts().items()):
+        hits, misses = int(counts['hit']), int(counts['miss'])
+        stats['kinds'][kind] = {'hits': hits, 'misses': misses}
+        stats['hits'] += hits
+        stats['misses'] += misses
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+    return stats
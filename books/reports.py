@@ -0,0 +1,263 @@
+# books/reports.py
+"""One-statement query behind the expense report and its summary exports.
+
+``ReportQuery`` builds three ORM querysets for the active filters: the
+monthly expense series, monthly ticket counts and per-category totals.
+It then compiles them into the CTEs of a single statement:
+
+    WITH series AS (...), tickets AS (...), categories AS (...)
+    SELECT series LEFT JOIN tickets
+    UNION ALL
+    SELECT categories
+
+Letting the ORM compile each part keeps the backend-specific date and
+time-zone extraction out of hand-written SQL.
+
+With sharded expenses (see ``books.sharding``) the expense and ticket
+parts run on every shard and the per-month totals are added up in Python;
+month-level series and categories still come from the rollup.
+"""
+import asyncio
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from functools import partial
+
+from django.db import connections, router
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils import timezone
+
+from . import sharding
+from .models import Expense, MonthlyExpenseRollup, Ticket
+from .query_pool import gather_queries
+
+CENTS = Decimal('0.01')
+
+
+def _as_decimal(value):
+    # SQLite hands back SUM() over a decimal column as a float or int.
+    if value is None:
+        return Decimal('0.00')
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return value.quantize(CENTS)
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class ReportResult:
+    """``series``: ``{'year', 'month', 'total', 'tickets'}`` per month, oldest first.
+    ``category_totals``: ``{'category__name', 'total'}``, largest first."""
+
+    def __init__(self, series, category_totals):
+        self.series = series
+        self.category_totals = category_totals
+
+
+class ReportQuery:
+    """Monthly expense totals, ticket counts and category totals for one set of filters.
+
+    ``month`` and ``year`` are numbers, ``category`` is matched
+    case-insensitively against the category name, and ``date_from`` /
+    ``date_to`` are inclusive dates. Month-level filters read the monthly
+    rollup. A ``date_from``/``date_to`` range can split a month, so it
+    aggregates the matching expense rows instead. Without ``using`` the
+    query reads from the database the routers pick for report reads.
+    """
+
+    def __init__(self, month=None, year=None, category='', date_from=None, date_to=None, using=None):
+        self.month = month
+        self.year = year
+        self.category = category
+        self.date_from = date_from
+        self.date_to = date_to
+        self.using = using or router.db_for_read(MonthlyExpenseRollup)
+
+    # --------------------------------------------------
+    # 🧱 Building blocks
+    # --------------------------------------------------
+
+    def _date_bounds(self):
+        """Half-open ``[start, end)`` date bounds implied by year, month and the range, or ``None``s."""
+        start = end = None
+        if self.year:
+            if self.month:
+                start = date(self.year, self.month, 1)
+                end = date(self.year + 1, 1, 1) if self.month == 12 else date(self.year, self.month + 1, 1)
+            else:
+                start, end = date(self.year, 1, 1), date(self.year + 1, 1, 1)
+        if self.date_from and (start is None or self.date_from > start):
+            start = self.date_from
+        if self.date_to and self.date_to < date.max:
+            to_end = self.date_to + timedelta(days=1)
+            if end is None or to_end < end:
+                end = to_end
+        return start, end
+
+    def _uses_rollup(self):
+        return not (self.date_from or self.date_to)
+
+    def _expense_source(self):
+        if self._uses_rollup():
+            qs = MonthlyExpenseRollup.objects.using(self.using)
+            if self.month:
+                qs = qs.filter(month=self.month)
+            if self.year:
+                qs = qs.filter(year=self.year)
+            if self.category:
+                qs = qs.filter(category__name__iexact=self.category)
+            return qs
+
+        qs = Expense.objects.using(self.using)
+        start, end = self._date_bounds()
+        if start:
+            qs = qs.filter(date__gte=start)
+        if end:
+            qs = qs.filter(date__lt=end)
+        if self.month and not self.year:
+            # Only reached with a from/to range, which already bounds the scan.
+            qs = qs.filter(date__month=self.month)
+        if self.category:
+            qs = qs.filter(book__category__name__iexact=self.category)
+        return qs
+
+    def series_queryset(self):
+        qs = self._expense_source()
+        if self._uses_rollup():
+            return qs.values('year', 'month').annotate(total=Sum('total')).order_by()
+        return (
+            qs.annotate(year=ExtractYear('date'), month=ExtractMonth('date'))
+            .values('year', 'month').annotate(total=Sum('amount')).order_by()
+        )
+
+    def tickets_queryset(self):
+        qs = Ticket.objects.using(self.using)
+        start, end = self._date_bounds()
+        if start:
+            qs = qs.filter(created_at__gte=_start_of_day(start))
+        if end:
+            qs = qs.filter(created_at__lt=_start_of_day(end))
+        if self.month and not self.year:
+            qs = qs.filter(created_at__month=self.month)
+        return (
+            qs.annotate(year=ExtractYear('created_at'), month=ExtractMonth('created_at'))
+            .values('year', 'month').annotate(tickets=Count('id')).order_by()
+        )
+
+    def categories_queryset(self):
+        qs = self._expense_source()
+        if self._uses_rollup():
+            return qs.values('category__name').annotate(total=Sum('total')).order_by()
+        return qs.values('book__category__name').annotate(total=Sum('amount')).order_by()
+
+    # --------------------------------------------------
+    # 🚀 Execution
+    # --------------------------------------------------
+
+    def as_sql(self):
+        connection = connections[self.using]
+        parts, params = [], []
+        for name, columns, qs in (
+            ('series', 'year, month, total', self.series_queryset()),
+            ('tickets', 'year, month, tickets', self.tickets_queryset()),
+            ('categories', 'name, total', self.categories_queryset()),
+        ):
+            sql, part_params = qs.query.get_compiler(connection=connection).as_sql()
+            parts.append(f"{name}({columns}) AS ({sql})")
+            params.extend(part_params)
+
+        sql = f"""
+            WITH {', '.join(parts)}
+            SELECT 'series', s.year, s.month, NULL, s.total, COALESCE(t.tickets, 0)
+            FROM series s LEFT JOIN tickets t ON t.year = s.year AND t.month = s.month
+            UNION ALL
+            SELECT 'category', NULL, NULL, c.name, c.total, NULL
+            FROM categories c
+        """
+        return sql, params
+
+    def _valid_year(self):
+        return self.year is None or 1 <= self.year < date.max.year
+
+    def _shard_parts(self, alias):
+        """The series, ticket and category rows this query needs from one shard."""
+        expenses = not self._uses_rollup()
+        return (
+            list(self.series_queryset().using(alias)) if expenses else [],
+            list(self.tickets_queryset().using(alias)),
+            list(self.categories_queryset().using(alias)) if expenses else [],
+        )
+
+    def _merge_shard_parts(self, parts):
+        """Add up per-shard ``_shard_parts`` into ``_result`` rows."""
+        series_parts, ticket_parts, category_parts = zip(*parts)
+        if self._uses_rollup():
+            series, categories = list(self.series_queryset()), list(self.categories_queryset())
+        else:
+            series = sharding.merge_sums(series_parts, ('total',))
+            categories = sharding.merge_sums(category_parts, ('total',))
+        tickets = {
+            (row['year'], row['month']): row['tickets'] for row in sharding.merge_sums(ticket_parts, ('tickets',))
+        }
+        rows = [
+            ('series', row['year'], row['month'], None, row['total'], tickets.get((row['year'], row['month']), 0))
+            for row in series
+        ]
+        rows += [('category', None, None, *row.values(), None) for row in categories]
+        return rows
+
+    def execute(self):
+        if not self._valid_year():
+            return ReportResult([], [])
+        if sharding.is_sharded():
+            parts = [self._shard_parts(alias) for alias in sharding.shard_aliases()]
+            return self._result(self._merge_shard_parts(parts))
+
+        sql, params = self.as_sql()
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        return self._result(rows)
+
+    async def aexecute(self):
+        """Like ``execute()``, but run the three parts as concurrent queries.
+
+        A single statement is the cheapest option for a sync view. An async
+        view can instead overlap the parts with each other and with the
+        dropdown reads.
+        """
+        if not self._valid_year():
+            return ReportResult([], [])
+        if sharding.is_sharded():
+            parts = await asyncio.gather(*(
+                gather_queries(partial(self._shard_parts, alias), using=alias) for alias in sharding.shard_aliases()
+            ))
+            # The rollup half, if any, is read from self.using while merging.
+            rows, = await gather_queries(lambda: self._merge_shard_parts([part for part, in parts]), using=self.using)
+            return self._result(rows)
+
+        series, tickets, categories = await gather_queries(
+            lambda: [tuple(row.values()) for row in self.series_queryset()],
+            lambda: {(row['year'], row['month']): row['tickets'] for row in self.tickets_queryset()},
+            lambda: [tuple(row.values()) for row in self.categories_queryset()],
+            using=self.using,
+        )
+        rows = [('series', year, month, None, total, tickets.get((year, month), 0)) for year, month, total in series]
+        rows += [('category', None, None, name, total, None) for name, total in categories]
+        return self._result(rows)
+
+    def _result(self, rows):
+        """Split ``(kind, year, month, name, total, tickets)`` rows into a ``ReportResult``."""
+        series, category_totals = [], []
+        for kind, year, month, name, total, tickets in rows:
+            if kind == 'series':
+                if year and month:
+                    series.append({'year': int(year), 'month': int(month), 'total': _as_decimal(total), 'tickets': tickets})
+            else:
+                category_totals.append({'category__name': name, 'total': _as_decimal(total)})
+
+        series.sort(key=lambda entry: (entry['year'], entry['month']))
+        category_totals.sort(key=lambda entry: entry['total'], reverse=True)
+        return ReportResult(series, category_totals)
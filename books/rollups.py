@@ -0,0 +1,160 @@
+# books/rollups.py
+"""Maintenance helpers for ``MonthlyExpenseRollup``.
+
+Every change to an expense is turned into a delta against the rollup row
+for its (year, month, category, expense type) key, so the reports can read
+a handful of pre-aggregated rows instead of scanning ``books_expense``.
+"""
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+from . import additive, facets, sharding, spending
+from .models import Book, Expense, MonthlyExpenseRollup
+
+ROLLUP_KEY_FIELDS = ('year', 'month', 'category_id', 'expense_type_id')
+
+
+# --------------------------------------------------
+# 🔑 Rollup keys
+# --------------------------------------------------
+
+def expense_snapshot(expense):
+    """Return ``(key, amount)`` for an in-memory expense instance."""
+    date = Expense._meta.get_field('date').to_python(expense.date)
+    amount = Expense._meta.get_field('amount').to_python(expense.amount)
+
+    category_id = None
+    if expense.book_id:
+        if Expense.book.is_cached(expense) and expense.book is not None:
+            category_id = expense.book.category_id
+        else:
+            category_id = (
+                Book.objects.filter(pk=expense.book_id)
+                .values_list('category_id', flat=True)
+                .first()
+            )
+
+    return (date.year, date.month, category_id, expense.expense_type_id), amount
+
+
+def stored_expense_snapshot(pk, using='default'):
+    """Return ``(key, amount)`` for the expense as it is currently stored, or ``None``."""
+    return stored_expense_state(pk, using)[0]
+
+
+def stored_expense_state(pk, using='default'):
+    """Return ``(snapshot, user_id)`` for the stored expense; ``(None, None)`` if it is gone."""
+    row = (
+        Expense.objects.using(using).filter(pk=pk)
+        .values('date', 'amount', 'expense_type_id', 'book__category_id', 'user_id')
+        .first()
+    )
+    if row is None:
+        return None, None
+    key = (row['date'].year, row['date'].month, row['book__category_id'], row['expense_type_id'])
+    return (key, row['amount']), row['user_id']
+
+
+# --------------------------------------------------
+# ➕ Incremental updates
+# --------------------------------------------------
+
+def apply_rollup_delta(key, total, count):
+    """Add ``total`` and ``count`` to the rollup row for ``key``, creating it if needed."""
+    with transaction.atomic():
+        _update_rollup_row(key, total, count)
+        facets.apply_facet_deltas(facets.facet_deltas({key: (total, count)}))
+
+
+def _update_rollup_row(key, total, count):
+    additive.update_row(MonthlyExpenseRollup, ROLLUP_KEY_FIELDS, key, total, count)
+
+
+def apply_rollup_deltas(deltas, batch_size=500):
+    """Apply many ``{key: (total, count)}`` deltas with a few set-based queries.
+
+    See ``additive.apply_deltas``; the facets move with the same deltas.
+    """
+    deltas = {key: value for key, value in deltas.items() if value[0] or value[1]}
+    facets.apply_facet_deltas(facets.facet_deltas(deltas))
+    additive.apply_deltas(MonthlyExpenseRollup, ROLLUP_KEY_FIELDS, ('year', 'month'), deltas, batch_size)
+
+
+def apply_expense_change(previous, current):
+    """Move an expense's contribution from the ``previous`` snapshot to ``current``.
+
+    Either side may be ``None`` for a create or a delete.
+    """
+    if previous == current:
+        return
+    if previous and current and previous[0] == current[0]:
+        apply_rollup_delta(current[0], current[1] - previous[1], 0)
+        return
+    if previous:
+        apply_rollup_delta(previous[0], -previous[1], -1)
+    if current:
+        apply_rollup_delta(current[0], current[1], 1)
+
+
+def move_book_rollups(book_id, from_category_id, to_category_id):
+    """Re-file a book's expenses, on every shard, under another category after it is recategorised."""
+    if from_category_id == to_category_id:
+        return
+
+    rows = (
+        Expense.objects.filter(book_id=book_id)
+        .annotate(year=ExtractYear('date'), month=ExtractMonth('date'))
+        .values('year', 'month', 'expense_type_id')
+        .annotate(total=Sum('amount'), count=Count('id'))
+        .order_by()
+    )
+    for row in sharding.aggregate_rows(rows, ('total', 'count')):
+        old_key = (row['year'], row['month'], from_category_id, row['expense_type_id'])
+        new_key = (row['year'], row['month'], to_category_id, row['expense_type_id'])
+        apply_rollup_delta(old_key, -row['total'], -row['count'])
+        apply_rollup_delta(new_key, row['total'], row['count'])
+
+
+def move_recategorised_books(changes):
+    """Re-file the expenses of every ``(book_id, from_category_id, to_category_id)`` whose category changed.
+
+    For bulk book loads, which skip the signals that do this per book. The
+    spending summaries move with the rollups. Returns how many books moved.
+    """
+    moved = 0
+    for book_id, from_category_id, to_category_id in changes:
+        if from_category_id == to_category_id:
+            continue
+        move_book_rollups(book_id, from_category_id, to_category_id)
+        spending.move_book_spending(book_id, from_category_id, to_category_id)
+        moved += 1
+    return moved
+
+
+# --------------------------------------------------
+# 🔁 Full rebuild
+# --------------------------------------------------
+
+def rebuild_monthly_rollups():
+    """Recompute every rollup row, the facets and the spending summaries from ``books_expense``.
+
+    Returns the number of rollup rows written.
+    """
+    groups = (
+        Expense.objects
+        .annotate(year=ExtractYear('date'), month=ExtractMonth('date'))
+        .values('year', 'month', 'book__category_id', 'expense_type_id')
+        .annotate(total=Sum('amount'), count=Count('id'))
+        .order_by()
+    )
+    columns = {
+        'year': 'year', 'month': 'month', 'book__category_id': 'category_id', 'expense_type_id': 'expense_type_id',
+        'total': 'total', 'count': 'count',
+    }
+
+    with transaction.atomic():
+        written = additive.rebuild_rows(MonthlyExpenseRollup, groups, columns)
+        facets.rebuild_expense_facets()
+        spending.rebuild_spending_summaries()
+    return written
@@ -0,0 +1,237 @@
+# books/search.py
+"""Ranked full-text search over the book catalogue.
+
+Each book has one search document in ``books_booksearch``. The document
+holds its title, subtitle, author, publisher and category:
+
+* PostgreSQL: a ``tsvector`` column with a GIN index. Titles are weighted
+  A, subtitle and author B, publisher and category C. Queries use
+  ``websearch_to_tsquery`` and are ranked with ``ts_rank_cd``.
+* SQLite: an FTS5 virtual table keyed by the book id. It is ranked with
+  ``bm25`` and column weights in the same proportions.
+
+Other backends, and SQLite builds without FTS5, fall back to an
+``icontains`` scan. That is the same ILIKE the admin used to run.
+
+The table is not a Django model. ``install_search_index`` creates it after
+every ``migrate`` (see ``books.signals``) and fills it the first time.
+Book writes go through ``reindex_books`` and ``remove_books``. So do
+renames of authors, publishers and categories, and the bulk importers.
+"""
+import re
+import sqlite3
+from functools import lru_cache
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Book
+
+SEARCH_TABLE = 'books_booksearch'
+SEARCH_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+# title, subtitle, author, publisher, category
+SQLITE_WEIGHTS = (10.0, 4.0, 4.0, 2.0, 2.0)
+
+_POSTGRES_DOCUMENT = """
+    setweight(to_tsvector('english', coalesce(b.title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(b.subtitle, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(a.name, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(p.name, '')), 'C') ||
+    setweight(to_tsvector('english', coalesce(c.name, '')), 'C')
+"""
+
+_SOURCE_JOINS = """
+    FROM books_book b
+    LEFT JOIN books_author a ON a.id = b.author_id
+    LEFT JOIN books_publisher p ON p.id = b.publisher_id
+    LEFT JOIN books_category c ON c.id = b.category_id
+"""
+
+
+@lru_cache(maxsize=None)
+def _sqlite_has_fts5():
+    with sqlite3.connect(':memory:') as probe:
+        return ('ENABLE_FTS5',) in probe.execute('PRAGMA compile_options').fetchall()
+
+
+def search_backend(using='default'):
+    """``'postgresql'``, ``'sqlite'`` (FTS5) or ``None`` when only the ILIKE scan is available."""
+    vendor = connections[using].vendor
+    if vendor == 'postgresql':
+        return 'postgresql'
+    if vendor == 'sqlite' and _sqlite_has_fts5():
+        return 'sqlite'
+    return None
+
+
+# --------------------------------------------------
+# 🏗️ Schema
+# --------------------------------------------------
+
+def install_search_index(using='default'):
+    """Create ``books_booksearch`` if it is missing and fill it; returns ``True`` if it was created."""
+    backend = search_backend(using)
+    connection = connections[using]
+    if backend is None or SEARCH_TABLE in connection.introspection.table_names():
+        return False
+
+    with connection.cursor() as cursor:
+        if backend == 'postgresql':
+            cursor.execute(f"CREATE TABLE {SEARCH_TABLE} (book_id bigint PRIMARY KEY, document tsvector NOT NULL)")
+            cursor.execute(f"CREATE INDEX {SEARCH_TABLE}_document_idx ON {SEARCH_TABLE} USING gin (document)")
+        else:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+                "title, subtitle, author, publisher, category, tokenize = 'porter unicode61')"
+            )
+            # Makes ``ORDER BY rank`` use the weighted bm25, which FTS5 can sort without a temp table.
+            weights = ', '.join(str(weight) for weight in SQLITE_WEIGHTS)
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rank) VALUES ('rank', %s)", [f"bm25({weights})"]
+            )
+    reindex_books(using=using)
+    return True
+
+
+# --------------------------------------------------
+# 🔄 Keeping documents in sync
+# --------------------------------------------------
+
+def _books_sql(books, using):
+    sql, params = books.using(using).values('pk').query.sql_with_params()
+    return f"b.id IN ({sql})", params
+
+
+def reindex_books(books=None, using='default'):
+    """Rebuild the documents for a ``Book`` queryset, or for every book when ``books`` is ``None``."""
+    backend = search_backend(using)
+    if backend is None:
+        return
+
+    where, params = ('1 = 1', []) if books is None else _books_sql(books, using)
+    with connections[using].cursor() as cursor:
+        if backend == 'postgresql':
+            if books is None:
+                cursor.execute(f"TRUNCATE {SEARCH_TABLE}")
+            cursor.execute(f"""
+                INSERT INTO {SEARCH_TABLE} (book_id, document)
+                SELECT b.id, {_POSTGRES_DOCUMENT} {_SOURCE_JOINS} WHERE {where}
+                ON CONFLICT (book_id) DO UPDATE SET document = EXCLUDED.document
+            """, params)
+        else:
+            if books is None:
+                cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+            cursor.execute(f"""
+                INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, title, subtitle, author, publisher, category)
+                SELECT b.id, b.title, b.subtitle, a.name, p.name, c.name {_SOURCE_JOINS} WHERE {where}
+            """, params)
+
+
+def remove_books(book_ids, using='default'):
+    backend = search_backend(using)
+    if backend is None or not book_ids:
+        return
+    key = 'book_id' if backend == 'postgresql' else 'rowid'
+    placeholders = ', '.join(['%s'] * len(book_ids))
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE {key} IN ({placeholders})", list(book_ids))
+
+
+# --------------------------------------------------
+# 🔎 Queries
+# --------------------------------------------------
+
+def _fts5_query(text):
+    """Quote every word so user input cannot use FTS5 operators; words are ANDed."""
+    return ' '.join(f'"{word}"' for word in re.findall(r'\w+', text))
+
+
+def _ranked_ids(text, limit, backend, using):
+    if backend == 'postgresql':
+        sql = f"""
+            SELECT s.book_id, ts_rank_cd(s.document, q) AS rank
+            FROM {SEARCH_TABLE} s, websearch_to_tsquery('english', %s) q
+            WHERE s.document @@ q
+            ORDER BY rank DESC, s.book_id
+            LIMIT %s
+        """
+        params = [text, limit]
+    else:
+        query = _fts5_query(text)
+        if not query:
+            return []
+        sql = f"SELECT rowid, -rank FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s ORDER BY rank LIMIT %s"
+        params = [query, limit]
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _ilike_queryset(words, using):
+    books = Book.objects.using(using)
+    for word in words:
+        books = books.filter(
+            Q(title__icontains=word) | Q(subtitle__icontains=word) | Q(author__name__icontains=word)
+            | Q(publisher__name__icontains=word) | Q(category__name__icontains=word)
+        )
+    return books
+
+
+def ilike_search(text, limit=SEARCH_LIMIT, using='default'):
+    """The unindexed fallback: every word must appear in one of the searched fields."""
+    words = text.split()
+    if not words:
+        return []
+    books = (
+        _ilike_queryset(words, using).select_related('author', 'publisher', 'category')
+        .order_by('title', 'id')[:limit]
+    )
+    return [(book, 0.0) for book in books]
+
+
+def search_books(text, limit=SEARCH_LIMIT, using='default'):
+    """Return up to ``limit`` ``(book, rank)`` pairs for ``text``, best match first."""
+    text = text.strip()
+    backend = search_backend(using)
+    if not text:
+        return []
+    if backend is None:
+        return ilike_search(text, limit, using)
+
+    ranked = _ranked_ids(text, limit, backend, using)
+    books = (
+        Book.objects.using(using).select_related('author', 'publisher', 'category')
+        .in_bulk([book_id for book_id, _ in ranked])
+    )
+    # Documents of books deleted behind the ORM's back simply drop out here.
+    return [(books[book_id], rank) for book_id, rank in ranked if book_id in books]
+
+
+def matching_books(text, using='default'):
+    """An unranked ``Book`` queryset of every match, for callers that filter or paginate further."""
+    backend = search_backend(using)
+    books = Book.objects.using(using)
+    if not re.search(r'\w', text):
+        return books.none()
+    if backend == 'postgresql':
+        subquery = f"SELECT book_id FROM {SEARCH_TABLE} WHERE document @@ websearch_to_tsquery('english', %s)"
+        return books.filter(pk__in=RawSQL(subquery, [text]))
+    if backend == 'sqlite':
+        subquery = f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s"
+        return books.filter(pk__in=RawSQL(subquery, [_fts5_query(text)]))
+    return _ilike_queryset(text.split(), using)
+
+
+def serialize_search_result(book, rank):
+    return {
+        'id': book.pk,
+        'title': book.title,
+        'subtitle': book.subtitle,
+        'author': book.author.name if book.author else None,
+        'publisher': book.publisher.name if book.publisher else None,
+        'category': book.category.name if book.category else None,
+        'rank': round(float(rank), 4),
+    }
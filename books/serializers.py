@@ -1,6 +1,16 @@
 from rest_framework import serializers
 
+from .models import Ticket
+
 class TicketSerializer(serializers.Serializer):
     id = serializers.IntegerField()
     priority = serializers.IntegerField()
     timestamp = serializers.DateTimeField()
+
+
+class ClaimedTicketSerializer(serializers.ModelSerializer):
+    assigned_to = serializers.CharField(source='assigned_to.username', default=None, read_only=True)
+
+    class Meta:
+        model = Ticket
+        fields = ['id', 'subject', 'description', 'status', 'priority', 'assigned_to', 'created_at', 'claimed_at']
@@ -0,0 +1,307 @@
+# books/sharding.py
+"""Optional user-sharded storage for ``Expense`` and ``Ticket``.
+
+``EXPENSE_SHARDS`` lists the database aliases, ``default`` first. With more
+than one alias each user's expenses and tickets live on exactly one of
+them. With a single alias nothing changes.
+
+* Placement. ``UserShard`` (on ``default``) records each user's shard.
+  The row is written on the user's first expense or ticket: ``default``
+  if rows from before sharding are already there, otherwise ``user_id``
+  modulo the number of shards. Users without a row read from ``default``.
+  A placement only changes when ``rebalance_shards`` moves the user, so
+  adding a shard strands nobody. Rows without a user stay on ``default``.
+* Reference data. Users, authors, publishers, categories, expense types
+  and books are written to ``default`` and copied to every other shard by
+  the signal handlers, so the joins behind exports and ``select_related``
+  run inside one database. Bulk loads that bypass the signals
+  (``import_books``, ``ingest_csv``) copy their rows when they finish, and
+  ``rebalance_shards`` recopies everything.
+* Derived tables (rollups, facets, spending summaries, data version) stay
+  on ``default`` and move by the usual deltas. Month-level reports read
+  them as before.
+* Scatter/gather. Work that spans users runs once per shard and the
+  results are merged in Python: date-range reports and ticket counts, row
+  exports, rollup rebuilds, reconciliation and ticket claiming.
+
+``ShardRouter`` sends a new expense or ticket to its user's shard, keeps a
+loaded one on the database it came from, and resolves ``user.expense_set``
+to the user's shard. Queries that are not tied to an instance read
+``default`` unless they pick shards with ``shard_for_user`` or
+``shard_querysets``.
+
+Ids are unique per shard only, and a move gives rows new ids; the user
+and ``external_id`` are the stable keys. Writes to two databases are not
+one transaction: a failure between them can leave a reference copy or a
+moved batch on both sides, never a lost row.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count
+
+from .models import Author, Book, Category, Expense, ExpenseType, Publisher, Ticket, UserShard
+
+SHARDED_MODELS = (Expense, Ticket)
+# Parents before children, so every copied row finds the rows it points at.
+REFERENCE_MODELS = (User, Author, Publisher, Category, ExpenseType, Book)
+# What import_books and ingest_csv books write.
+CATALOGUE_MODELS = (Author, Publisher, Category, Book)
+
+MOVE_BATCH_SIZE = 1000
+REPLICATE_BATCH_SIZE = 1000
+
+
+def shard_aliases():
+    return list(settings.EXPENSE_SHARDS) or [DEFAULT_DB_ALIAS]
+
+
+def is_sharded():
+    return len(settings.EXPENSE_SHARDS) > 1
+
+
+# --------------------------------------------------
+# 🗺️ Placement
+# --------------------------------------------------
+
+def _has_rows(user_id, using):
+    return any(model._base_manager.using(using).filter(user_id=user_id).exists() for model in SHARDED_MODELS)
+
+
+def shard_for_user(user_id, assign=False):
+    """The alias holding ``user_id``'s expenses and tickets.
+
+    With ``assign``, a user who has no placement yet is given one, for a
+    write that is about to happen.
+    """
+    if not is_sharded() or user_id is None:
+        return DEFAULT_DB_ALIAS
+    placed = UserShard.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).values_list('shard', flat=True).first()
+    if placed is not None or not assign:
+        return placed or DEFAULT_DB_ALIAS
+
+    aliases = shard_aliases()
+    # Rows written before sharding was switched on stay readable where they are.
+    home = DEFAULT_DB_ALIAS if _has_rows(user_id, DEFAULT_DB_ALIAS) else aliases[user_id % len(aliases)]
+    placement, _ = UserShard.objects.using(DEFAULT_DB_ALIAS).get_or_create(user_id=user_id, defaults={'shard': home})
+    return placement.shard
+
+
+def _shard_for_instance(instance, assign):
+    if isinstance(instance, SHARDED_MODELS):
+        if instance._state.db and not instance._state.adding:
+            return instance._state.db
+        return shard_for_user(instance.user_id, assign=assign)
+    if isinstance(instance, User) and instance.pk is not None:
+        return shard_for_user(instance.pk, assign=assign)
+    return None
+
+
+class ShardRouter:
+    def db_for_read(self, model, **hints):
+        if model in SHARDED_MODELS and is_sharded():
+            return _shard_for_instance(hints.get('instance'), assign=False)
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model in SHARDED_MODELS and is_sharded():
+            return _shard_for_instance(hints.get('instance'), assign=True)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every shard holds the same reference rows as default.
+        if is_sharded() and {obj1._state.db, obj2._state.db} <= set(shard_aliases()):
+            return True
+        return None
+
+
+# --------------------------------------------------
+# 🔭 Scatter/gather
+# --------------------------------------------------
+
+def shard_querysets(queryset):
+    """``queryset`` once per shard; just ``[queryset]`` when sharding is off, so the routers still decide."""
+    if not is_sharded():
+        return [queryset]
+    return [queryset.using(alias) for alias in shard_aliases()]
+
+
+def merge_sums(row_lists, sum_fields):
+    """Merge lists of dict rows, adding up ``sum_fields`` of rows whose other fields match."""
+    merged = {}
+    for rows in row_lists:
+        for row in rows:
+            key = tuple((name, value) for name, value in row.items() if name not in sum_fields)
+            entry = merged.get(key)
+            if entry is None:
+                merged[key] = dict(row)
+                continue
+            for name in sum_fields:
+                entry[name] = (entry[name] or 0) + (row[name] or 0)
+    return list(merged.values())
+
+
+def aggregate_rows(queryset, sum_fields):
+    """Rows of a ``values().annotate()`` queryset, summed across the shards."""
+    if not is_sharded():
+        return queryset.iterator()
+    return merge_sums((list(shard_qs) for shard_qs in shard_querysets(queryset)), sum_fields)
+
+
+# --------------------------------------------------
+# 📚 Reference data
+# --------------------------------------------------
+
+def _replica_aliases():
+    return [alias for alias in shard_aliases() if alias != DEFAULT_DB_ALIAS]
+
+
+def replicate(model, pks=None, batch_size=REPLICATE_BATCH_SIZE):
+    """Copy ``model`` rows (all, or those in ``pks``) from ``default`` to every other shard.
+
+    Rows are inserted or updated by primary key. Returns the number of
+    rows read from ``default``.
+    """
+    if not is_sharded():
+        return 0
+    fields = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+    rows = model._base_manager.using(DEFAULT_DB_ALIAS).order_by('pk')
+    if pks is not None:
+        rows = rows.filter(pk__in=pks)
+
+    copied, batch = 0, []
+    for row in rows.iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            _write_replicas(model, batch, fields)
+            copied, batch = copied + len(batch), []
+    if batch:
+        _write_replicas(model, batch, fields)
+    return copied + len(batch)
+
+
+def _write_replicas(model, rows, fields):
+    for alias in _replica_aliases():
+        model._base_manager.using(alias).bulk_create(
+            rows, update_conflicts=True, unique_fields=[model._meta.pk.name], update_fields=fields,
+        )
+
+
+def replicate_reference_data(models=REFERENCE_MODELS):
+    """Copy whole reference tables to every other shard; returns ``{model label: rows}``."""
+    return {model._meta.label: replicate(model) for model in models}
+
+
+def delete_replicas(model, pk):
+    """Delete ``model`` row ``pk`` from every shard but ``default``, with the usual cascades."""
+    for alias in _replica_aliases():
+        model._base_manager.using(alias).filter(pk=pk).delete()
+
+
+# --------------------------------------------------
+# 🚚 Rebalancing
+# --------------------------------------------------
+
+def shard_loads():
+    """``{alias: {user_id: rows}}``: expense plus ticket rows per user on each shard."""
+    loads = {}
+    for alias in shard_aliases():
+        users = loads[alias] = defaultdict(int)
+        for model in SHARDED_MODELS:
+            counts = (
+                model._base_manager.using(alias).filter(user__isnull=False)
+                .values_list('user_id').annotate(rows=Count('pk')).order_by()
+            )
+            for user_id, rows in counts:
+                users[user_id] += rows
+    return loads
+
+
+def plan_rebalance(loads, placements, tolerance=0.1, max_moves=None):
+    """``(user_id, source, target, rows)`` moves that even out ``loads``.
+
+    Rows found away from their user's placement (``placements`` maps user
+    ids to aliases; missing users belong on ``default``) are moved home
+    first. Then the largest move that narrows the gap between the busiest
+    and the quietest shard is taken, until every shard is within
+    ``tolerance`` of the mean.
+    """
+    loads = {alias: dict(users) for alias, users in loads.items()}
+    moves = []
+    for alias, users in loads.items():
+        for user_id in list(users):
+            home = placements.get(user_id, DEFAULT_DB_ALIAS)
+            if home != alias and home in loads:
+                rows = users.pop(user_id)
+                loads[home][user_id] = loads[home].get(user_id, 0) + rows
+                moves.append((user_id, alias, home, rows))
+
+    totals = {alias: sum(users.values()) for alias, users in loads.items()}
+    mean = sum(totals.values()) / len(totals)
+    while max_moves is None or len(moves) < max_moves:
+        heavy, light = max(totals, key=totals.get), min(totals, key=totals.get)
+        gap = totals[heavy] - totals[light]
+        if totals[heavy] - mean <= tolerance * mean:
+            break
+        # Moving ``rows`` leaves a gap of |gap - 2 * rows|, which only shrinks while rows < gap.
+        candidates = [(rows, user_id) for user_id, rows in loads[heavy].items() if rows < gap]
+        if not candidates:
+            break
+        rows, user_id = min(candidates, key=lambda candidate: (abs(gap - 2 * candidate[0]), candidate[1]))
+        del loads[heavy][user_id]
+        loads[light][user_id] = rows
+        totals[heavy] -= rows
+        totals[light] += rows
+        moves.append((user_id, heavy, light, rows))
+    return moves
+
+
+def _move_rows(model, user_id, source, target, batch_size):
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    source_connection, target_connection = connections[source], connections[target]
+    quote = target_connection.ops.quote_name
+    table, pk_column = quote(model._meta.db_table), quote(model._meta.pk.column)
+    insert = (
+        f"INSERT INTO {table} ({', '.join(quote(field.column) for field in fields)}) "
+        f"VALUES ({', '.join(['%s'] * len(fields))})"
+    )
+    # Plain SQL rather than bulk_create, which would reset created_at/updated_at to now.
+    rows = (
+        model._base_manager.using(source).filter(user_id=user_id).order_by('pk')
+        .values_list('pk', *(field.attname for field in fields))
+    )
+
+    moved = 0
+    while batch := list(rows[:batch_size]):
+        # The target commits before the source, so a failure in between duplicates a batch rather than losing it.
+        with transaction.atomic(using=source), transaction.atomic(using=target):
+            with target_connection.cursor() as cursor:
+                cursor.executemany(insert, [
+                    [field.get_db_prep_save(value, target_connection) for field, value in zip(fields, row[1:])]
+                    for row in batch
+                ])
+            with source_connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {table} WHERE {pk_column} IN ({', '.join(['%s'] * len(batch))})",
+                    [row[0] for row in batch],
+                )
+        moved += len(batch)
+    return moved
+
+
+def move_user(user_id, source, target, batch_size=MOVE_BATCH_SIZE):
+    """Move ``user_id``'s expenses and tickets from ``source`` to ``target``; returns the rows moved.
+
+    The rows are copied in batches with new ids and deleted from the
+    source, then the placement is switched. A second pass picks up rows
+    written to the source while the first one ran. The derived tables are
+    per user, not per shard, so they do not change.
+    """
+    if source == target:
+        return 0
+    moved = sum(_move_rows(model, user_id, source, target, batch_size) for model in SHARDED_MODELS)
+    UserShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(user_id=user_id, defaults={'shard': target})
+    moved += sum(_move_rows(model, user_id, source, target, batch_size) for model in SHARDED_MODELS)
+    return moved
@@ -0,0 +1,144 @@
+# books/signals.py
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import rollups, search, sharding, spending
+from .models import Author, Book, Category, Expense, ExpenseType, Publisher, Ticket
+from .report_cache import bump_data_version
+
+# --------------------------------------------------
+# 💸 Expense writes → monthly rollups and spending summaries
+# --------------------------------------------------
+
+@receiver(pre_save, sender=Expense)
+def remember_stored_expense(sender, instance, raw=False, using='default', **kwargs):
+    instance._rollup_previous, instance._spending_user_id = None, None
+    if not raw and instance.pk is not None:
+        instance._rollup_previous, instance._spending_user_id = rollups.stored_expense_state(instance.pk, using)
+
+@receiver(post_save, sender=Expense)
+def sync_rollup_on_expense_save(sender, instance, raw=False, using=DEFAULT_DB_ALIAS, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_rollup_previous', None)
+    current = rollups.expense_snapshot(instance)
+    rollups.apply_expense_change(previous, current)
+    spending.apply_spending_change(
+        spending.spending_snapshot(getattr(instance, '_spending_user_id', None), previous),
+        spending.spending_snapshot(instance.user_id, current),
+    )
+    bump_data_version(using)
+
+@receiver(post_delete, sender=Expense)
+def sync_rollup_on_expense_delete(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    snapshot = rollups.expense_snapshot(instance)
+    rollups.apply_expense_change(snapshot, None)
+    spending.apply_spending_change(spending.spending_snapshot(instance.user_id, snapshot), None)
+    bump_data_version(using)
+
+# --------------------------------------------------
+# 📖 Book changes that re-file existing expenses
+# --------------------------------------------------
+
+@receiver(pre_save, sender=Book)
+def remember_book_category(sender, instance, raw=False, **kwargs):
+    instance._rollup_category_id = None
+    if not raw and instance.pk is not None:
+        instance._rollup_category_id = (
+            Book.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+        )
+
+@receiver(post_save, sender=Book)
+def sync_rollup_on_book_save(sender, instance, created, raw=False, **kwargs):
+    if raw or created or instance._rollup_category_id == instance.category_id:
+        return
+    rollups.move_book_rollups(instance.pk, instance._rollup_category_id, instance.category_id)
+    spending.move_book_spending(instance.pk, instance._rollup_category_id, instance.category_id)
+    bump_data_version()
+
+@receiver(pre_delete, sender=Book)
+def sync_rollup_on_book_delete(sender, instance, using='default', **kwargs):
+    if using != DEFAULT_DB_ALIAS:
+        # A shard's copy going away; the delete on default already moved every shard's expenses.
+        return
+    # The book's expenses are about to be SET_NULL, which drops them out of the category.
+    rollups.move_book_rollups(instance.pk, instance.category_id, None)
+    spending.move_book_spending(instance.pk, instance.category_id, None)
+    bump_data_version()
+
+# --------------------------------------------------
+# 🔎 Catalogue writes → book search index
+# --------------------------------------------------
+
+@receiver(post_migrate)
+def install_book_search(sender, using='default', **kwargs):
+    if sender.name == 'books':
+        search.install_search_index(using)
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, using='default', **kwargs):
+    search.reindex_books(Book.objects.filter(pk=instance.pk), using)
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, using='default', **kwargs):
+    search.remove_books([instance.pk], using)
+
+@receiver(pre_save, sender=Author)
+@receiver(pre_save, sender=Category)
+@receiver(pre_save, sender=Publisher)
+def remember_indexed_name(sender, instance, raw=False, **kwargs):
+    instance._search_name = None
+    if not raw and instance.pk is not None:
+        instance._search_name = sender.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Publisher)
+def reindex_renamed_books(sender, instance, created, raw=False, using='default', **kwargs):
+    if raw or created or instance._search_name == instance.name:
+        return
+    field = sender._meta.model_name
+    search.reindex_books(Book.objects.filter(**{field: instance.pk}), using)
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Publisher)
+def reindex_orphaned_books(sender, instance, using='default', **kwargs):
+    # The books were SET_NULL without signals; re-indexing every book left without one is idempotent.
+    field = sender._meta.model_name
+    search.reindex_books(Book.objects.filter(**{f"{field}__isnull": True}), using)
+
+# --------------------------------------------------
+# 🎫 Ticket writes → report cache
+# --------------------------------------------------
+
+@receiver(post_save, sender=Ticket)
+@receiver(post_delete, sender=Ticket)
+def invalidate_reports_on_ticket_write(sender, raw=False, using=DEFAULT_DB_ALIAS, **kwargs):
+    if not raw:
+        bump_data_version(using)
+
+# --------------------------------------------------
+# 🧩 Reference writes → every expense shard
+# --------------------------------------------------
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Publisher)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=ExpenseType)
+@receiver(post_save, sender=Book)
+def replicate_reference_row(sender, instance, raw=False, using='default', **kwargs):
+    if not raw and using == DEFAULT_DB_ALIAS:
+        sharding.replicate(sender, [instance.pk])
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Publisher)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=ExpenseType)
+@receiver(post_delete, sender=Book)
+def delete_reference_replicas(sender, instance, using='default', **kwargs):
+    if using == DEFAULT_DB_ALIAS and sharding.is_sharded():
+        sharding.delete_replicas(sender, instance.pk)
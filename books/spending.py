@@ -0,0 +1,200 @@
+# books/spending.py
+"""Maintenance helpers for ``UserSpendingSummary``.
+
+Every change to an expense becomes a delta against the summary row for
+its (user, year, month, category) key. The signal handlers use the same
+snapshots as the monthly rollup (see ``books.rollups``). The dashboard
+then reads one user's few dozen summary rows instead of summing
+``books_expense``.
+
+If a write path ever skips the deltas, ``reconcile_spending_summaries``
+compares the rows with a fresh aggregate of ``books_expense`` and repairs
+the keys that drifted.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils import timezone
+
+from . import additive, sharding
+from .models import Expense, UserSpendingSummary
+
+SPENDING_KEY_FIELDS = ('user_id', 'year', 'month', 'category_id')
+
+
+# --------------------------------------------------
+# 🔑 Summary keys
+# --------------------------------------------------
+
+def spending_snapshot(user_id, snapshot):
+    """Turn a rollup ``(key, amount)`` snapshot into a spending one; ``None`` without a user."""
+    if user_id is None or snapshot is None:
+        return None
+    (year, month, category_id, _), amount = snapshot
+    return (user_id, year, month, category_id), amount
+
+
+# --------------------------------------------------
+# ➕ Incremental updates
+# --------------------------------------------------
+
+def apply_spending_delta(key, total, count):
+    """Add ``total`` and ``count`` to the summary row for ``key`` with an ``F()`` update."""
+    additive.update_row(UserSpendingSummary, SPENDING_KEY_FIELDS, key, total, count)
+
+
+def apply_spending_deltas(deltas, batch_size=500):
+    """Apply many ``{key: (total, count)}`` deltas; see ``additive.apply_deltas``."""
+    additive.apply_deltas(UserSpendingSummary, SPENDING_KEY_FIELDS, ('user_id', 'year'), deltas, batch_size)
+
+
+def apply_spending_change(previous, current):
+    """Move an expense's contribution from the ``previous`` spending snapshot to ``current``."""
+    if previous == current:
+        return
+    if previous and current and previous[0] == current[0]:
+        apply_spending_delta(current[0], current[1] - previous[1], 0)
+        return
+    if previous:
+        apply_spending_delta(previous[0], -previous[1], -1)
+    if current:
+        apply_spending_delta(current[0], current[1], 1)
+
+
+def move_book_spending(book_id, from_category_id, to_category_id):
+    """Re-file a book's expenses under another category for every user who bought it."""
+    if from_category_id == to_category_id:
+        return
+
+    rows = (
+        Expense.objects.filter(book_id=book_id, user__isnull=False)
+        .annotate(year=ExtractYear('date'), month=ExtractMonth('date'))
+        .values('user_id', 'year', 'month')
+        .annotate(total=Sum('amount'), count=Count('id'))
+        .order_by()
+    )
+    deltas = {}
+    for row in sharding.aggregate_rows(rows, ('total', 'count')):
+        deltas[(row['user_id'], row['year'], row['month'], from_category_id)] = (-row['total'], -row['count'])
+        deltas[(row['user_id'], row['year'], row['month'], to_category_id)] = (row['total'], row['count'])
+    with transaction.atomic():
+        apply_spending_deltas(deltas)
+
+
+# --------------------------------------------------
+# 👛 Dashboard totals
+# --------------------------------------------------
+
+def _money(value):
+    # Backends disagree on the scale of SUM() over decimals; SQLite drops trailing zeros.
+    return Decimal(value or 0).quantize(Decimal('0.01'))
+
+
+def spending_summary(user, today=None):
+    """Lifetime, year-to-date and month-to-date totals for ``user``, overall and per category.
+
+    One query over the user's summary rows.
+    """
+    today = today or timezone.localdate()
+    rows = (
+        UserSpendingSummary.objects.filter(user=user)
+        .values('category_id', 'category__name')
+        .annotate(
+            lifetime=Sum('total'),
+            year_to_date=Sum('total', filter=Q(year=today.year)),
+            month_to_date=Sum('total', filter=Q(year=today.year, month=today.month)),
+            count=Sum('count'),
+        )
+        .order_by('-lifetime', 'category__name')
+    )
+
+    zero = Decimal('0.00')
+    categories = [
+        {
+            'name': row['category__name'] or "Uncategorised",
+            'lifetime': _money(row['lifetime']),
+            'year_to_date': _money(row['year_to_date']),
+            'month_to_date': _money(row['month_to_date']),
+            'count': row['count'] or 0,
+        }
+        for row in rows
+    ]
+    return {
+        'lifetime': sum((row['lifetime'] for row in categories), zero),
+        'year_to_date': sum((row['year_to_date'] for row in categories), zero),
+        'month_to_date': sum((row['month_to_date'] for row in categories), zero),
+        'count': sum(row['count'] for row in categories),
+        'categories': categories,
+    }
+
+
+# --------------------------------------------------
+# 🔁 Rebuild and reconciliation
+# --------------------------------------------------
+
+def _expected_groups(user_ids=None):
+    expenses = Expense.objects.filter(user__isnull=False)
+    if user_ids is not None:
+        expenses = expenses.filter(user_id__in=user_ids)
+    return (
+        expenses.annotate(year=ExtractYear('date'), month=ExtractMonth('date'))
+        .values('user_id', 'year', 'month', 'book__category_id')
+        .annotate(total=Sum('amount'), count=Count('id'))
+        .order_by()
+    )
+
+
+def rebuild_spending_summaries():
+    """Recompute every summary row from ``books_expense``; returns the number of rows written."""
+    columns = {
+        'user_id': 'user_id', 'year': 'year', 'month': 'month', 'book__category_id': 'category_id',
+        'total': 'total', 'count': 'count',
+    }
+    return additive.rebuild_rows(UserSpendingSummary, _expected_groups(), columns)
+
+
+def reconcile_spending_summaries(user_ids=None, repair=True):
+    """Compare the summary rows with ``books_expense`` and repair any key that drifted.
+
+    Returns a list of ``(key, stored, expected)`` tuples, where ``stored``
+    and ``expected`` are ``(total, count)``. Only drifted keys are rewritten,
+    so a clean table costs two aggregate queries and no writes. Expense
+    writes that land between the two reads show up as drift, so run it
+    when writes are quiet or limit it to a few users.
+    """
+    stored_rows = UserSpendingSummary.objects.all()
+    if user_ids is not None:
+        stored_rows = stored_rows.filter(user_id__in=user_ids)
+
+    with transaction.atomic():
+        expected = {
+            (row['user_id'], row['year'], row['month'], row['book__category_id']): (row['total'], row['count'])
+            for row in sharding.aggregate_rows(_expected_groups(user_ids), ('total', 'count'))
+        }
+        stored = {
+            (row['user_id'], row['year'], row['month'], row['category_id']): (row['total'], row['count'])
+            for row in stored_rows.values(*SPENDING_KEY_FIELDS)
+            .annotate(total=Sum('total'), count=Sum('count')).order_by().iterator()
+        }
+
+        empty = (Decimal('0.00'), 0)
+        drift = sorted(
+            (
+                (key, stored.get(key, empty), expected.get(key, empty))
+                for key in expected.keys() | stored.keys()
+                if stored.get(key, empty) != expected.get(key, empty)
+            ),
+            key=lambda item: (item[0][0], item[0][1], item[0][2], item[0][3] or 0),
+        )
+
+        if repair and drift:
+            for key, _, _ in drift:
+                UserSpendingSummary.objects.filter(**dict(zip(SPENDING_KEY_FIELDS, key))).delete()
+            UserSpendingSummary.objects.bulk_create([
+                UserSpendingSummary(**dict(zip(SPENDING_KEY_FIELDS, key)), total=total, count=count)
+                for key, _, (total, count) in drift
+                if count
+            ])
+    return drift
@@ -1,7 +1,22 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from .models import Expense, Ticket
-from datetime import date
+from myproject.middleware import RequestMetricsMiddleware
+from .models import (
+    Author, Book, Category, Expense, ExpenseFacet, ExpenseType, MonthlyExpenseRollup, Publisher, Ticket,
+    UserSpendingSummary, safe_create_expense,
+)
+from .views import _filter_expenses
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import skipUnless
+import os
+import openpyxl
 
 
 class BaseTestSetup(TestCase):
@@ -83,3 +98,1915 @@ class TicketDashboardViewTests(TestCase):
         tickets = response.context['tickets']
         self.assertEqual(len(tickets), 2)
         self.assertLessEqual(tickets[0].priority, tickets[1].priority)
+
+
+class MonthlyExpenseRollupTests(TestCase):
+    def setUp(self):
+        author = Author.objects.create(name="Jay Liebowitz")
+        self.analytics = Category.objects.create(name="Analytics")
+        self.finance = Category.objects.create(name="Finance")
+        self.book = Book.objects.create(title="Business Analytics", author=author, category=self.analytics)
+        self.printing = ExpenseType.objects.create(name="Printing")
+
+    def rollup_totals(self):
+        return {
+            (r.year, r.month, r.category_id, r.expense_type_id): (r.total, r.count)
+            for r in MonthlyExpenseRollup.objects.all()
+        }
+
+    def test_create_update_and_delete_keep_rollup_in_sync(self):
+        expense = safe_create_expense({
+            'book_id': self.book.id, 'expense_type_id': self.printing.id,
+            'amount': '150.00', 'date': date(2025, 8, 3),
+        })
+        Expense.objects.create(book=self.book, expense_type=self.printing, amount=50, date=date(2025, 8, 20))
+        key = (2025, 8, self.analytics.id, self.printing.id)
+        self.assertEqual(self.rollup_totals(), {key: (Decimal('200.00'), 2)})
+
+        expense.amount = Decimal('100.00')
+        expense.save()
+        self.assertEqual(self.rollup_totals(), {key: (Decimal('150.00'), 2)})
+
+        expense.date = date(2025, 9, 1)
+        expense.save()
+        self.assertEqual(self.rollup_totals(), {
+            key: (Decimal('50.00'), 1),
+            (2025, 9, self.analytics.id, self.printing.id): (Decimal('100.00'), 1),
+        })
+
+        expense.delete()
+        Expense.objects.filter(date__month=8).delete()
+        self.assertEqual(self.rollup_totals(), {})
+
+    def test_recategorising_or_deleting_book_moves_totals(self):
+        Expense.objects.create(book=self.book, expense_type=self.printing, amount=80, date=date(2025, 8, 3))
+
+        self.book.category = self.finance
+        self.book.save()
+        self.assertEqual(self.rollup_totals(), {(2025, 8, self.finance.id, self.printing.id): (Decimal('80.00'), 1)})
+
+        self.book.delete()
+        self.assertEqual(self.rollup_totals(), {(2025, 8, None, self.printing.id): (Decimal('80.00'), 1)})
+
+    def test_rebuild_command_recovers_from_drift(self):
+        Expense.objects.create(book=self.book, expense_type=self.printing, amount=80, date=date(2025, 8, 3))
+        Expense.objects.create(book=self.book, amount=20, date=date(2025, 10, 3))
+        expected = self.rollup_totals()
+
+        MonthlyExpenseRollup.objects.update(total=0)
+        call_command('rebuild_expense_rollups', stdout=StringIO())
+        self.assertEqual(self.rollup_totals(), expected)
+
+    def test_report_view_reads_filtered_totals_from_rollup(self):
+        Expense.objects.create(book=self.book, expense_type=self.printing, amount=80, date=date(2025, 8, 3))
+        Expense.objects.create(book=self.book, amount=20, date=date(2025, 10, 3))
+
+        response = self.client.get(reverse('report'), {'category': 'analytics', 'year': '2025'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['labels']), ["Aug 2025", "Oct 2025"])
+        self.assertEqual(list(response.context['totals']), [80.0, 20.0])
+
+        response = self.client.get(reverse('export_report_csv'), {'month': 'october'})
+        self.assertEqual(response.content.decode().splitlines()[1:], ["Oct 2025,20.0,0"])
+
+
+
+class ExpenseFilterTests(TestCase):
+    def setUp(self):
+        author = Author.objects.create(name="Jay Liebowitz")
+        self.category = Category.objects.create(name="Analytics")
+        book = Book.objects.create(title="Business Analytics", author=author, category=self.category)
+        for day in (date(2024, 3, 31), date(2025, 3, 1), date(2025, 3, 31), date(2025, 4, 1)):
+            Expense.objects.create(book=book, amount=10, date=day)
+
+    def filtered_dates(self, **params):
+        qs, *_ = _filter_expenses(RequestFactory().get('/reports/', params))
+        return qs, sorted(qs.values_list('date', flat=True))
+
+    def test_month_and_year_use_half_open_date_ranges(self):
+        qs, dates = self.filtered_dates(month='march', year='2025')
+        self.assertEqual(dates, [date(2025, 3, 1), date(2025, 3, 31)])
+        where = str(qs.query).split('WHERE', 1)[1]
+        self.assertNotIn('EXTRACT', where.upper())
+        self.assertNotIn('django_date_extract', where)
+
+    def test_month_without_year_spans_every_year(self):
+        _, dates = self.filtered_dates(month='March')
+        self.assertEqual(dates, [date(2024, 3, 31), date(2025, 3, 1), date(2025, 3, 31)])
+
+    def test_from_and_to_are_inclusive(self):
+        _, dates = self.filtered_dates(**{'from': '2025-03-31', 'to': '2025-04-01'})
+        self.assertEqual(dates, [date(2025, 3, 31), date(2025, 4, 1)])
+
+    def test_report_view_honours_date_range(self):
+        response = self.client.get(reverse('report'), {'from': '2025-03-15', 'to': '2025-12-31'})
+        self.assertEqual(list(response.context['labels']), ["Mar 2025", "Apr 2025"])
+        self.assertEqual(list(response.context['totals']), [10.0, 10.0])
+        self.assertEqual(response.context['selected_from'], '2025-03-15')
+
+
+class ExpenseRowExportTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        user = User.objects.create(username="ada")
+        author = Author.objects.create(name="Jay Liebowitz")
+        category = Category.objects.create(name="Analytics")
+        book = Book.objects.create(title="Business Analytics", author=author, category=category)
+        printing = ExpenseType.objects.create(name="Printing")
+        Expense.objects.create(user=user, book=book, expense_type=printing, amount='12.50', date=date(2025, 8, 3))
+        Expense.objects.create(amount=7, date=date(2025, 7, 1))
+        Expense.objects.create(amount=9, date=date(2024, 8, 1))
+
+    def test_rows_mode_streams_every_filtered_expense(self):
+        response = self.client.get(reverse('export_report_csv'), {'mode': 'rows', 'year': '2025'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content).decode().splitlines(), [
+            "Date,User,Book,Category,Expense Type,Amount",
+            "2025-07-01,,,,,7.00",
+            "2025-08-03,ada,Business Analytics,Analytics,Printing,12.50",
+        ])
+
+    def test_rows_mode_xlsx_has_summary_and_one_sheet_per_category(self):
+        response = self.client.get(reverse('export-report-xlsx'), {'mode': 'rows'})
+        self.assertEqual(response.status_code, 200)
+        workbook = openpyxl.load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)
+        self.assertEqual(workbook.sheetnames, ['Summary', 'Uncategorised', 'Analytics'])
+
+        summary = list(workbook['Summary'].values)
+        self.assertEqual(summary[:4], [
+            ('Month', 'Total Expenses', 'Ticket Count'),
+            ('Aug 2024', 9, 0), ('Jul 2025', 7, 0), ('Aug 2025', 12.5, 0),
+        ])
+        self.assertIn(('Analytics', 1, 12.5), summary)
+        self.assertEqual(list(workbook['Analytics'].values)[1][1:], (
+            'ada', 'Business Analytics', 'Analytics', 'Printing', 12.5,
+        ))
+
+
+class ImportBooksCommandTests(TestCase):
+    def write_csv(self, rows):
+        import csv
+        import tempfile
+
+        handle = tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', delete=False)
+        self.addCleanup(os.remove, handle.name)
+        writer = csv.writer(handle)
+        writer.writerow(['id', 'title', 'subtitle', 'authors', 'publisher', 'published_date', 'category', 'distribution_expense'])
+        writer.writerows(rows)
+        handle.close()
+        return handle.name
+
+    def test_imports_every_column_and_reuses_existing_names(self):
+        Author.objects.create(name="Jay Liebowitz")
+        path = self.write_csv([
+            ['1', 'Business Analytics', 'An Introduction', 'Jay Liebowitz', 'CRC Press', '12/19/2013', 'Business Analytics', '5.6'],
+            ['2', 'Essentials', '', 'Bhimasankaram Pochiraju, Sridhar Seshadri', 'Springer', '7/10/2019', 'Business Analytics', '4.55'],
+            ['3', '', '', 'Nobody', 'Springer', '', '', ''],
+        ])
+        call_command('import_books', path, stdout=StringIO(), stderr=StringIO())
+
+        book = Book.objects.get(title='Business Analytics')
+        self.assertEqual(book.subtitle, 'An Introduction')
+        self.assertEqual(book.publisher.name, 'CRC Press')
+        self.assertEqual(book.category.name, 'Business Analytics')
+        self.assertEqual(book.published_date, date(2013, 12, 19))
+        self.assertEqual(book.distribution_expense, Decimal('5.60'))
+        self.assertEqual(Book.objects.get(title='Essentials').author.name, 'Bhimasankaram Pochiraju')
+        self.assertEqual(Author.objects.filter(name="Jay Liebowitz").count(), 1)
+        self.assertEqual(Category.objects.count(), 1)
+
+    def test_query_count_depends_on_batches_not_rows(self):
+        rows = [[str(i), f'Book {i}', '', f'Author {i}', f'Publisher {i % 7}', '', f'Cat {i % 5}', '1']
+                for i in range(500)]
+        path = self.write_csv(rows)
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_books', path, '--batch-size', '250', stdout=StringIO())
+        self.assertEqual(Book.objects.count(), 500)
+        # The old per-row get_or_create/save loop needed about 1,000 queries here. The id column makes
+        # these upserts, which look up the categories of the books they replace once per batch.
+        self.assertLess(len(queries), 25)
+
+    def test_upsert_that_recategorises_a_book_refiles_its_expenses(self):
+        from unittest import mock
+        from books import rollups
+
+        header = "external_id,title,authors,category\n"
+        call_command('import_books', self.write_csv_text(header + "B-1,Old,Ann,Finance\n"), stdout=StringIO())
+        user = User.objects.create(username="ada")
+        Expense.objects.create(user=user, book=Book.objects.get(external_id='B-1'), amount=5, date=date(2025, 1, 2))
+        with mock.patch('books.rollups.rebuild_monthly_rollups') as rebuild, \
+                mock.patch('books.rollups.move_book_rollups', wraps=rollups.move_book_rollups) as move:
+            call_command('import_books', self.write_csv_text(header + "B-1,New,Ann,Finance\n"), stdout=StringIO())
+            move.assert_not_called()
+            call_command('import_books', self.write_csv_text(header + "B-1,New,Ann,History\n"), stdout=StringIO())
+        rebuild.assert_not_called()
+        self.assertEqual(move.call_count, 1)
+        self.assertEqual(MonthlyExpenseRollup.objects.get().category.name, 'History')
+        self.assertEqual(UserSpendingSummary.objects.exclude(count=0).get().category.name, 'History')
+
+        # ingest_csv's COPY path on PostgreSQL, the same command elsewhere.
+        with mock.patch('books.rollups.rebuild_monthly_rollups') as rebuild:
+            call_command('ingest_csv', 'books', self.write_csv_text(header + "B-1,New,Ann,Finance\n"), stdout=StringIO())
+        rebuild.assert_not_called()
+        self.assertEqual(MonthlyExpenseRollup.objects.exclude(count=0).get().category.name, 'Finance')
+        self.assertEqual(UserSpendingSummary.objects.exclude(count=0).get().category.name, 'Finance')
+
+    def write_csv_text(self, text):
+        import tempfile
+
+        handle = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+        self.addCleanup(os.remove, handle.name)
+        handle.write(text)
+        handle.close()
+        return handle.name
+
+    def test_imports_sample_catalogue_once_per_isbn(self):
+        path = os.path.join(settings.BASE_DIR, 'books_data.csv')
+        call_command('import_books', path, stdout=StringIO())
+        # 4,090 rows, but many repeat an ISBN; the last row for each wins.
+        self.assertEqual(Book.objects.count(), 1073)
+        self.assertEqual(Book.objects.get(external_id='9781466596092').title, 'Business Analytics')
+
+        call_command('import_books', path, stdout=StringIO())
+        self.assertEqual(Book.objects.count(), 1073)
+        call_command('ingest_csv', 'books', path, stdout=StringIO())
+        self.assertEqual(Book.objects.count(), 1073)
+
+
+class IngestCsvCommandTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        User.objects.create(username="ada")
+        author = Author.objects.create(name="Jay Liebowitz")
+        self.category = Category.objects.create(name="Analytics")
+        Book.objects.create(title="Business Analytics", author=author, category=self.category)
+
+    def write_csv(self, text):
+        import tempfile
+
+        handle = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+        self.addCleanup(os.remove, handle.name)
+        handle.write(text)
+        handle.close()
+        return handle.name
+
+    def test_expense_ingest_resolves_names_upserts_and_updates_rollups(self):
+        path = self.write_csv(
+            "external_id,Date,User,Book,Category,Expense Type,Amount\n"
+            "L-1,2025-08-03,ada,Business Analytics,Analytics,Printing,12.50\n"
+            "L-2,2025-08-04,ghost,Unknown Book,,,7\n"
+            ",not-a-date,ada,,,,1\n"
+        )
+        call_command('ingest_csv', 'expenses', path, stdout=StringIO())
+        first = Expense.objects.get(external_id='L-1')
+        self.assertEqual((first.user.username, first.book.title, first.expense_type.name), ('ada', 'Business Analytics', 'Printing'))
+        self.assertIsNone(Expense.objects.get(external_id='L-2').user_id)
+        self.assertEqual(Expense.objects.count(), 2)
+
+        path = self.write_csv("external_id,date,amount\nL-1,2025-09-01,20\n")
+        call_command('ingest_csv', 'expenses', path, stdout=StringIO())
+        self.assertEqual(Expense.objects.count(), 2)
+        self.assertEqual(Expense.objects.get(external_id='L-1').amount, Decimal('20.00'))
+        self.assertEqual(
+            sorted(MonthlyExpenseRollup.objects.values_list('year', 'month', 'total')),
+            [(2025, 8, Decimal('7.00')), (2025, 9, Decimal('20.00'))],
+        )
+
+    def test_book_ingest_upserts_on_external_id(self):
+        header = "external_id,title,subtitle,authors,publisher,published_date,category,distribution_expense\n"
+        call_command('ingest_csv', 'books', self.write_csv(header + "B-1,Old Title,,Ann Author,Springer,07/10/2019,Finance,4.55\n"), stdout=StringIO())
+        call_command('ingest_csv', 'books', self.write_csv(header + "B-1,New Title,,Ann Author,Springer,07/10/2019,Finance,4.55\n"), stdout=StringIO())
+        self.assertEqual(list(Book.objects.filter(external_id='B-1').values_list('title', flat=True)), ['New Title'])
+
+    def test_impossible_dates_are_skipped_not_fatal(self):
+        # On PostgreSQL this runs the COPY path, where a bad cast would abort the whole file.
+        path = self.write_csv(
+            "external_id,date,amount\n"
+            "D-1,2025-02-30,5\n"
+            "D-2,2025-13-01,5\n"
+            "D-3,2025-02-28,5\n"
+        )
+        out = StringIO()
+        call_command('ingest_csv', 'expenses', path, stdout=out)
+        self.assertEqual(list(Expense.objects.values_list('external_id', flat=True)), ['D-3'])
+
+        header = "external_id,title,subtitle,authors,publisher,published_date,category,distribution_expense\n"
+        call_command('ingest_csv', 'books', self.write_csv(
+            header + "B-1,Leap,,Ann Author,,02/30/2019,,0\nB-2,Valid,,Ann Author,,02/28/2019,,0\n"
+        ), stdout=StringIO())
+        self.assertEqual(
+            dict(Book.objects.filter(external_id__isnull=False).values_list('external_id', 'published_date')),
+            {'B-1': None, 'B-2': date(2019, 2, 28)},
+        )
+
+    def test_orm_fallback_moves_the_rollups_by_deltas(self):
+        from unittest import mock
+        from .ingest import ingest_expenses
+        from .rollups import rebuild_monthly_rollups
+
+        def derived_tables():
+            # Deltas may leave emptied rows behind; a rebuild drops them.
+            return [
+                list(model.objects.exclude(count=0).order_by(*fields).values_list(*fields))
+                for model, fields in (
+                    (MonthlyExpenseRollup, ('year', 'month', 'category_id', 'expense_type_id', 'total', 'count')),
+                    (UserSpendingSummary, ('user_id', 'year', 'month', 'category_id', 'total', 'count')),
+                    (ExpenseFacet, ('kind', 'value', 'count')),
+                )
+            ]
+
+        ingest_expenses(self.write_csv(
+            "external_id,Date,User,Book,Expense Type,Amount\n"
+            "F-1,2025-08-03,ada,Business Analytics,Printing,12.50\n"
+            "F-2,2025-08-04,ada,,,7\n"
+        ), force_orm=True)
+        with mock.patch('books.rollups.rebuild_monthly_rollups') as rebuild:
+            ingest_expenses(self.write_csv(
+                "external_id,Date,User,Book,Expense Type,Amount\n"
+                "F-1,2025-09-01,,,Printing,20\n"
+                "F-3,2025-08-05,ada,Business Analytics,Shipping,3.25\n"
+            ), force_orm=True)
+        rebuild.assert_not_called()
+
+        incremental = derived_tables()
+        rebuild_monthly_rollups()
+        self.assertEqual(incremental, derived_tables())
+
+    def test_missing_required_column_is_reported(self):
+        from django.core.management.base import CommandError
+
+        with self.assertRaisesMessage(CommandError, 'amount'):
+            call_command('ingest_csv', 'expenses', self.write_csv("date,user\n2025-01-01,ada\n"), stdout=StringIO())
+
+
+class ExpenseBulkCreateApiTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        self.user = User.objects.create_user(username="ada", password="pw")
+        self.other = User.objects.create_user(username="bob", password="pw")
+        author = Author.objects.create(name="Jay Liebowitz")
+        category = Category.objects.create(name="Analytics")
+        self.book = Book.objects.create(title="Business Analytics", author=author, category=category)
+        self.expense_type = ExpenseType.objects.create(name="Printing")
+        self.client.force_login(self.user)
+
+    def post_ndjson(self, lines):
+        import json
+
+        body = "\n".join(json.dumps(line) for line in lines) + "\n"
+        return self.client.post(reverse('expense-bulk-create'), data=body, content_type='application/x-ndjson')
+
+    def test_ndjson_rows_are_created_with_rollup_and_owner(self):
+        response = self.post_ndjson([
+            {'amount': '10.50', 'date': '2025-08-03', 'book_id': self.book.id, 'expense_type_id': self.expense_type.id},
+            {'amount': 4, 'date': '2025-08-20', 'book_id': self.book.id, 'expense_type_id': self.expense_type.id},
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'received': 2, 'created': 2, 'errors': []})
+        self.assertEqual(set(Expense.objects.values_list('user_id', flat=True)), {self.user.id})
+        rollup = MonthlyExpenseRollup.objects.get()
+        self.assertEqual((rollup.total, rollup.count, rollup.category_id), (Decimal('14.50'), 2, self.book.category_id))
+
+    def test_invalid_rows_are_reported_by_index_and_the_rest_saved(self):
+        Expense.objects.create(amount=1, date=date(2025, 1, 1), external_id="card-1")
+        response = self.client.post(
+            reverse('expense-bulk-create'),
+            data=[
+                {'amount': '3.00', 'date': '2025-08-03'},
+                {'amount': 'abc', 'book_id': 999999},
+                {'amount': '1.234', 'date': '03/08/2025', 'expense_type_id': 999999},
+                {'amount': '2', 'user_id': self.other.id},
+                {'amount': '2', 'external_id': 'card-1'},
+                {'amount': '2', 'external_id': 'card-2'},
+                {'amount': '2', 'external_id': 'card-2'},
+                "not an object",
+            ],
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 207)
+        body = response.json()
+        self.assertEqual(body['created'], 2)
+        errors = {error['index']: set(error['errors']) for error in body['errors']}
+        self.assertEqual(errors, {
+            1: {'amount', 'book_id'},
+            2: {'amount', 'date', 'expense_type_id'},
+            3: {'user_id'},
+            4: {'external_id'},
+            6: {'external_id'},
+            7: {'non_field_errors'},
+        })
+        self.assertEqual(Expense.objects.count(), 3)
+
+    def test_lookups_are_batched_not_per_row(self):
+        rows = [{'amount': '1.00', 'book_id': self.book.id, 'expense_type_id': self.expense_type.id}] * 300
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post_ndjson(rows)
+        self.assertEqual(response.json()['created'], 300)
+        statements = [q['sql'] for q in queries if 'SAVEPOINT' not in q['sql']]
+        # Session/user lookup, three IN lookups, expense types, the rollup upsert and the
+        # report-cache version; SQLite splits the INSERT at its parameter limit.
+        self.assertLess(len(statements), 20)
+
+    def test_external_id_inserted_after_validation_is_a_row_error(self):
+        from unittest import mock
+        from books import bulk_expenses
+
+        real_lookup = bulk_expenses.BulkExpenseImporter.taken_external_ids
+
+        def lookup_then_lose_the_race(importer, external_ids):
+            taken = real_lookup(importer, external_ids)
+            # Another request commits card-2 between this chunk's lookup and its insert.
+            if not Expense.objects.filter(external_id='card-2').exists():
+                Expense.objects.create(amount=5, date=date(2025, 1, 1), external_id='card-2')
+            return taken
+
+        with mock.patch.object(bulk_expenses.BulkExpenseImporter, 'taken_external_ids', lookup_then_lose_the_race):
+            response = self.post_ndjson([
+                {'amount': '1.00', 'date': '2025-08-03', 'external_id': 'card-1'},
+                {'amount': '2.00', 'date': '2025-08-03', 'external_id': 'card-2'},
+            ])
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json(), {
+            'received': 2, 'created': 1,
+            'errors': [{'index': 1, 'errors': {'external_id': ["An expense with this external_id already exists."]}}],
+        })
+        self.assertEqual(sorted(Expense.objects.values_list('external_id', 'amount')),
+                         [('card-1', Decimal('1.00')), ('card-2', Decimal('5.00'))])
+        self.assertEqual(MonthlyExpenseRollup.objects.get(year=2025, month=8).total, Decimal('1.00'))
+
+    def test_malformed_ndjson_and_anonymous_requests_are_rejected(self):
+        response = self.client.post(reverse('expense-bulk-create'), data='{"amount": 1}\n{oops\n', content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('line 2', response.json()['detail'])
+
+        self.client.logout()
+        response = self.post_ndjson([{'amount': 1}])
+        self.assertIn(response.status_code, (401, 403))
+        self.assertFalse(Expense.objects.exists())
+
+
+class ReportCacheTests(TestCase):
+    def setUp(self):
+        from .report_cache import report_cache
+
+        report_cache().clear()
+        author = Author.objects.create(name="Jay Liebowitz")
+        self.category = Category.objects.create(name="Analytics")
+        self.book = Book.objects.create(title="Business Analytics", author=author, category=self.category)
+        Expense.objects.create(book=self.book, amount=Decimal("10.00"), date=date(2025, 3, 5))
+
+    def test_repeat_request_is_a_hit_and_skips_the_queries(self):
+        url = reverse('report') + '?month=March&year=2025'
+        self.assertEqual(self.client.get(url)['X-Report-Cache'], 'miss')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('report') + '?month=march&year=2025&category=')
+        self.assertEqual(response['X-Report-Cache'], 'hit')
+        # Only the data-version lookup reaches the database.
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response.context['totals'], [10.0])
+
+    def test_filters_and_exports_are_cached_separately(self):
+        self.client.get(reverse('export-report-xlsx') + '?year=2025')
+        self.assertEqual(self.client.get(reverse('export_report_csv') + '?year=2025')['X-Report-Cache'], 'miss')
+        self.assertEqual(self.client.get(reverse('export_report_csv') + '?year=2024')['X-Report-Cache'], 'miss')
+        self.assertEqual(self.client.get(reverse('export-report-xlsx') + '?year=2025')['X-Report-Cache'], 'hit')
+
+    def test_stats_endpoint_reports_hits_and_misses(self):
+        from django.contrib.auth.models import User
+
+        from .report_cache import cache_stats
+
+        # The counts are the Prometheus counters, which other tests move too.
+        before = cache_stats()
+        url = reverse('report')
+        self.client.get(url)
+        self.client.get(url)
+        self.client.force_login(User.objects.create_user(username="admin", password="pw", is_staff=True))
+        stats = self.client.get(reverse('report-cache-stats')).json()
+        self.assertEqual((stats['hits'] - before['hits'], stats['misses'] - before['misses']), (1, 1))
+        report = before['kinds'].get('report', {'hits': 0, 'misses': 0})
+        self.assertEqual(stats['kinds']['report'], {'hits': report['hits'] + 1, 'misses': report['misses'] + 1})
+        self.assertEqual(stats['hit_ratio'], round(stats['hits'] / (stats['hits'] + stats['misses']), 4))
+
+    def test_stats_are_summed_across_worker_processes(self):
+        import subprocess
+        import sys
+        import tempfile
+        from unittest import mock
+        from .report_cache import cache_stats
+
+        worker = "import sys; from books.metrics import record_cache_lookup; record_cache_lookup('csv', sys.argv[1] == 'hit')"
+        with tempfile.TemporaryDirectory() as directory:
+            environment = {**os.environ, 'PROMETHEUS_MULTIPROC_DIR': directory}
+            for outcome in ('hit', 'miss', 'miss', 'miss'):
+                subprocess.run([sys.executable, '-c', worker, outcome], env=environment, cwd=settings.BASE_DIR, check=True)
+            with mock.patch.dict(os.environ, {'PROMETHEUS_MULTIPROC_DIR': directory}):
+                stats = cache_stats()
+        self.assertEqual(stats, {'hits': 1, 'misses': 3, 'kinds': {'csv': {'hits': 1, 'misses': 3}}, 'hit_ratio': 0.25})
+
+
+class ReportCacheVersionTests(TransactionTestCase):
+    """Writes that really commit, since the data version moves on commit."""
+
+    def setUp(self):
+        from .report_cache import report_cache
+
+        report_cache().clear()
+        author = Author.objects.create(name="Jay Liebowitz")
+        self.book = Book.objects.create(title="Business Analytics", author=author)
+        Expense.objects.create(book=self.book, amount=Decimal("10.00"), date=date(2025, 3, 5))
+
+    def test_expense_and_ticket_writes_invalidate(self):
+        from django.db import transaction
+
+        url = reverse('export_report_csv') + '?year=2025'
+        self.client.get(url)
+        self.assertEqual(self.client.get(url)['X-Report-Cache'], 'hit')
+
+        with transaction.atomic():
+            Expense.objects.create(book=self.book, amount=Decimal("5.00"), date=date(2025, 3, 9))
+            # The version moves when the write commits, not when it is made.
+            self.assertEqual(self.client.get(url)['X-Report-Cache'], 'hit')
+        response = self.client.get(url)
+        self.assertEqual(response['X-Report-Cache'], 'miss')
+        self.assertIn('Mar 2025,15.0,0', response.content.decode())
+
+        Ticket.objects.create(subject="Printer jam")
+        self.assertEqual(self.client.get(url)['X-Report-Cache'], 'miss')
+
+    def test_a_transaction_bumps_the_version_once(self):
+        from django.db import transaction
+        from .report_cache import get_data_version
+
+        before = get_data_version()
+        with transaction.atomic():
+            for day in range(1, 4):
+                Expense.objects.create(book=self.book, amount=Decimal("1.00"), date=date(2025, 4, day))
+            Ticket.objects.create(subject="Printer jam")
+            self.assertEqual(get_data_version(), before)
+        self.assertEqual(get_data_version(), before + 1)
+
+
+class ExpenseFacetTests(TestCase):
+    def setUp(self):
+        author = Author.objects.create(name="Jay Liebowitz")
+        self.analytics = Category.objects.create(name="Analytics")
+        self.finance = Category.objects.create(name="Finance")
+        self.book = Book.objects.create(title="Business Analytics", author=author, category=self.analytics)
+
+    def options(self):
+        from .facets import dropdown_options
+
+        return dropdown_options()
+
+    def test_writes_keep_dropdowns_to_non_empty_facets(self):
+        first = Expense.objects.create(book=self.book, amount=5, date=date(2024, 3, 1))
+        second = Expense.objects.create(book=self.book, amount=7, date=date(2025, 1, 9))
+        self.assertEqual(self.options(), (['January', 'March'], ['Analytics'], [2024, 2025]))
+
+        second.date = date(2025, 2, 9)
+        second.save()
+        first.delete()
+        self.assertEqual(self.options(), (['February'], ['Analytics'], [2025]))
+
+        self.book.category = self.finance
+        self.book.save()
+        self.assertEqual(self.options()[1], ['Finance'])
+
+    def test_bulk_rollup_deltas_and_rebuild_agree(self):
+        from .facets import rebuild_expense_facets
+
+        user = User.objects.create_user(username="ada", password="pw")
+        self.client.force_login(user)
+        self.client.post(
+            reverse('expense-bulk-create'),
+            data=[{'amount': 1, 'date': f'2023-{month:02d}-01', 'book_id': self.book.id} for month in (1, 1, 6)],
+            content_type='application/json',
+        )
+        incremental = sorted(ExpenseFacet.objects.values_list('kind', 'value', 'count'))
+        rebuild_expense_facets()
+        self.assertEqual(sorted(ExpenseFacet.objects.values_list('kind', 'value', 'count')), incremental)
+        self.assertIn(('month', 1, 2), incremental)
+
+    def test_dropdowns_cost_two_queries_regardless_of_expense_count(self):
+        for day in range(1, 29):
+            Expense.objects.create(book=self.book, amount=1, date=date(2025, 5, day))
+        with CaptureQueriesContext(connection) as queries:
+            self.options()
+        self.assertEqual(len(queries), 2)
+
+
+class ReportQueryTests(TestCase):
+    def setUp(self):
+        from django.utils import timezone
+        from .report_cache import report_cache
+
+        report_cache().clear()
+        author = Author.objects.create(name="Jay Liebowitz")
+        self.analytics = Category.objects.create(name="Analytics")
+        self.finance = Category.objects.create(name="Finance")
+        analytics_book = Book.objects.create(title="Business Analytics", author=author, category=self.analytics)
+        finance_book = Book.objects.create(title="Corporate Finance", author=author, category=self.finance)
+        Expense.objects.create(book=analytics_book, amount=Decimal("10.00"), date=date(2025, 3, 5))
+        Expense.objects.create(book=analytics_book, amount=Decimal("2.50"), date=date(2025, 3, 20))
+        Expense.objects.create(book=finance_book, amount=Decimal("7.00"), date=date(2025, 4, 1))
+        Expense.objects.create(book=finance_book, amount=Decimal("1.00"), date=date(2024, 12, 31))
+        for day in (3, 4):
+            ticket = Ticket.objects.create(subject=f"Ticket {day}")
+            Ticket.objects.filter(pk=ticket.pk).update(
+                created_at=timezone.make_aware(timezone.datetime(2025, 3, day, 12))
+            )
+
+    def execute(self, **filters):
+        from .reports import ReportQuery
+
+        return ReportQuery(**filters).execute()
+
+    def test_series_tickets_and_categories_come_back_together(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = self.execute(year=2025)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(result.series, [
+            {'year': 2025, 'month': 3, 'total': Decimal("12.50"), 'tickets': 2},
+            {'year': 2025, 'month': 4, 'total': Decimal("7.00"), 'tickets': 0},
+        ])
+        self.assertEqual(result.category_totals, [
+            {'category__name': "Analytics", 'total': Decimal("12.50")},
+            {'category__name': "Finance", 'total': Decimal("7.00")},
+        ])
+
+    def test_category_totals_follow_the_filters(self):
+        result = self.execute(month=3, category="analytics")
+        self.assertEqual([entry['month'] for entry in result.series], [3])
+        self.assertEqual(result.category_totals, [{'category__name': "Analytics", 'total': Decimal("12.50")}])
+
+    def test_date_range_splits_months(self):
+        result = self.execute(date_from=date(2025, 3, 10), date_to=date(2025, 3, 31))
+        self.assertEqual(result.series, [{'year': 2025, 'month': 3, 'total': Decimal("2.50"), 'tickets': 0}])
+
+    def test_out_of_range_year_is_empty_without_a_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = self.execute(year=99999)
+        self.assertEqual((result.series, result.category_totals, len(queries)), ([], [], 0))
+
+    def test_report_and_exports_use_one_statement(self):
+        # Data version + report statement + the two dropdown reads.
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('report') + '?year=2025')
+        self.assertEqual(len(queries), 4)
+        self.assertEqual(response.context['labels'], ["Mar 2025", "Apr 2025"])
+        self.assertEqual(response.context['ticket_counts'], [2, 0])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('export_report_csv') + '?year=2025')
+        self.assertEqual(len(queries), 2)
+        self.assertIn('Mar 2025,12.5,2', response.content.decode())
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('export-report-xlsx') + '?year=2025')
+        self.assertEqual(len(queries), 2)
+
+
+class AsyncReportViewTests(TransactionTestCase):
+    """The ASGI profile's report views; rows must be committed for the query pool to see them."""
+
+    def setUp(self):
+        from .report_cache import report_cache
+
+        report_cache().clear()
+        author = Author.objects.create(name="Jay Liebowitz")
+        analytics = Category.objects.create(name="Analytics")
+        book = Book.objects.create(title="Business Analytics", author=author, category=analytics)
+        Expense.objects.create(book=book, amount=Decimal("10.00"), date=date(2025, 3, 5))
+        Expense.objects.create(book=book, amount=Decimal("4.00"), date=date(2025, 4, 9))
+        Ticket.objects.create(subject="Printer jam")
+
+    def use_async_urls(self, enabled):
+        import importlib
+        from django.urls import clear_url_caches
+        from . import urls
+
+        with self.settings(ASYNC_REPORTS=enabled):
+            importlib.reload(urls)
+        # The project urlconf holds the include() resolver built from the old patterns.
+        importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+        clear_url_caches()
+
+    def test_async_views_match_the_sync_views(self):
+        from asgiref.sync import async_to_sync
+        from django.test import AsyncRequestFactory
+        from .views import _report_context, aexport_report_csv, _areport_context
+
+        request = RequestFactory().get('/reports/', {'year': '2025'})
+        self.assertEqual(async_to_sync(_areport_context)(request), _report_context(request))
+
+        response = async_to_sync(aexport_report_csv)(AsyncRequestFactory().get('/reports/export/', {'year': '2025'}))
+        self.assertEqual(response['X-Report-Cache'], 'miss')
+        self.assertIn('Apr 2025,4.0,0', response.content.decode())
+
+    def test_asgi_profile_routes_reports_to_the_async_views(self):
+        from asgiref.sync import async_to_sync
+        from django.test import AsyncClient
+        from django.urls import resolve
+        from .views import areport_view
+
+        self.use_async_urls(True)
+        self.addCleanup(self.use_async_urls, False)
+        self.assertIs(resolve(reverse('report')).func, areport_view)
+
+        client = AsyncClient()
+        response = async_to_sync(client.get)(reverse('report') + '?year=2025')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Report-Cache'], 'miss')
+        self.assertEqual(response.context['totals'], [10.0, 4.0])
+        response = async_to_sync(client.get)(reverse('export-report-xlsx') + '?year=2025')
+        self.assertEqual(response.status_code, 200)
+
+    def test_queries_overlap_under_latency(self):
+        import time
+        from unittest import mock
+        from asgiref.sync import async_to_sync
+        from django.db.backends.utils import CursorWrapper
+        from .facets import adropdown_options
+        from .reports import ReportQuery
+
+        latency = 0.05
+        execute = CursorWrapper._execute
+
+        def slow_execute(self, *args, **kwargs):
+            time.sleep(latency)
+            return execute(self, *args, **kwargs)
+
+        async def both():
+            import asyncio
+            return await asyncio.gather(ReportQuery(year=2025).aexecute(), adropdown_options())
+
+        with mock.patch.object(CursorWrapper, '_execute', slow_execute):
+            started = time.perf_counter()
+            result, (months, categories, years) = async_to_sync(both)()
+            elapsed = time.perf_counter() - started
+
+        # Five queries: one after another would take 5 x latency.
+        self.assertLess(elapsed, 3 * latency)
+        self.assertEqual([entry['tickets'] for entry in result.series], [0, 0])
+        self.assertEqual((months, categories, years), (["April", "March"], ["Analytics"], [2025]))
+
+
+class TicketOrderingTests(TestCase):
+    def post(self, payload, query=''):
+        return self.client.post(reverse('sort-tickets') + query, data=payload, content_type='application/json')
+
+    def test_priority_ordering_breaks_ties_on_timestamp_then_id(self):
+        payload = [
+            {'id': 4, 'priority': 2, 'timestamp': "2025-03-01T10:00:00Z"},
+            {'id': 3, 'priority': 1, 'timestamp': "2025-03-01T12:00:00+01:00"},
+            {'id': 1, 'priority': 1, 'timestamp': "2025-03-01T11:30:00Z"},
+            # Naive timestamps are read in TIME_ZONE (UTC+1), so this equals ticket 3's.
+            {'id': 2, 'priority': "1", 'timestamp': "2025-03-01T12:00:00"},
+        ]
+        response = self.post(payload)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'sorted_ticket_ids': [2, 3, 1, 4]})
+
+    def test_created_ordering_and_top_k(self):
+        payload = [{'id': i, 'created_at': f"2025-03-{day:02d}T09:00:00Z"} for i, day in enumerate([9, 3, 7, 1, 5], start=1)]
+        self.assertEqual(self.post(payload, '?order=created').json()['sorted_ticket_ids'], [4, 2, 5, 3, 1])
+        self.assertEqual(self.post(payload, '?order=created&limit=2').json()['sorted_ticket_ids'], [4, 2])
+        self.assertEqual(self.post(payload, '?order=created&limit=50').json()['sorted_ticket_ids'], [4, 2, 5, 3, 1])
+
+    def test_invalid_items_are_reported_by_index(self):
+        payload = [
+            {'id': 1, 'priority': 1, 'timestamp': "2025-03-01T10:00:00Z"},
+            {'id': True, 'priority': 1, 'timestamp': "yesterday"},
+            "ticket",
+        ]
+        response = self.post(payload)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.json()['error']], [1, 2])
+        self.assertEqual(set(response.json()['error'][0]['errors']), {'id', 'timestamp'})
+
+    def test_bad_query_parameters_and_body(self):
+        self.assertEqual(self.post([], '?order=newest').status_code, 400)
+        self.assertEqual(self.post([], '?limit=0').status_code, 400)
+        self.assertEqual(self.post({'id': 1}).status_code, 400)
+
+    def test_python_helpers_share_the_engine(self):
+        from myproject.utils import sort_tickets as sort_by_priority
+        from .views import sort_tickets as sort_by_created
+
+        tickets = [
+            {'id': 2, 'priority': 1, 'timestamp': 5, 'created_at': 1},
+            {'id': 1, 'priority': 1, 'timestamp': 5, 'created_at': 2},
+        ]
+        self.assertEqual(sort_by_priority(tickets), [1, 2])
+        self.assertEqual(sort_by_created(tickets), [2, 1])
+        with self.assertRaises(ValueError):
+            sort_by_created([{'id': 1}])
+
+
+class TicketClaimTests(TestCase):
+    def setUp(self):
+        self.agent = User.objects.create_user(username="agent", password="pw")
+        self.old = self.make_ticket("Old", priority=3, minutes_ago=30)
+        self.urgent = self.make_ticket("Urgent", priority=1, minutes_ago=10)
+        self.make_ticket("Done", priority=1, minutes_ago=60, status='resolved')
+
+    def make_ticket(self, subject, priority, minutes_ago, status='open'):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        ticket = Ticket.objects.create(subject=subject, priority=priority, status=status)
+        Ticket.objects.filter(pk=ticket.pk).update(created_at=timezone.now() - timedelta(minutes=minutes_ago))
+        return ticket
+
+    def test_claims_follow_the_requested_order_and_skip_closed_tickets(self):
+        from .ticket_queue import claim_next_ticket
+
+        ticket = claim_next_ticket(agent=self.agent, ordering='priority')
+        self.assertEqual((ticket.pk, ticket.status, ticket.assigned_to), (self.urgent.pk, 'in_progress', self.agent))
+        self.assertIsNotNone(ticket.claimed_at)
+        self.assertEqual(claim_next_ticket().pk, self.old.pk)
+        self.assertIsNone(claim_next_ticket())
+
+    def test_api_claims_for_the_caller(self):
+        url = reverse('ticket-claim')
+        self.assertEqual(self.client.post(url).status_code, 403)
+
+        self.client.force_login(self.agent)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['id'], response.json()['assigned_to']), (self.old.pk, "agent"))
+        self.assertEqual(self.client.post(url + '?order=newest').status_code, 400)
+        self.assertEqual(self.client.post(url).status_code, 200)
+        self.assertEqual(self.client.post(url).status_code, 204)
+
+    def test_command_claims_until_the_queue_is_empty(self):
+        out = StringIO()
+        call_command('claim_ticket', '--count', '5', '--order', 'priority', '--agent', 'agent', stdout=out)
+        self.assertIn("Claimed 2 ticket(s)", out.getvalue())
+        self.assertEqual(Ticket.objects.filter(status='in_progress', assigned_to=self.agent).count(), 2)
+
+
+class TicketClaimConcurrencyTests(TransactionTestCase):
+    def test_concurrent_claimers_never_share_a_ticket(self):
+        import threading
+        from django.db import connections
+        from .ticket_queue import claim_next_ticket
+
+        Ticket.objects.bulk_create([Ticket(subject=f"Ticket {i}") for i in range(120)])
+        claimed, lock = [], threading.Lock()
+
+        def worker():
+            try:
+                while (ticket := claim_next_ticket()) is not None:
+                    with lock:
+                        claimed.append(ticket.pk)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(claimed), 120)
+        self.assertEqual(len(set(claimed)), 120)
+        self.assertFalse(Ticket.objects.filter(status='open').exists())
+
+
+class ExpenseHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="reader", password="pw")
+        self.other = User.objects.create_user(username="other", password="pw")
+        author = Author.objects.create(name="Jay Liebowitz")
+        category = Category.objects.create(name="Analytics")
+        self.book = Book.objects.create(title="Business Analytics", author=author, category=category)
+
+    def add_expenses(self, user, days):
+        Expense.objects.bulk_create([
+            Expense(user=user, book=self.book, amount=Decimal("1.00"), date=date(2020, 1, 1) + timedelta(days=day))
+            for day in days
+        ])
+
+    def fetch(self, **params):
+        self.client.force_login(self.user)
+        return self.client.get(reverse('expense-history'), params)
+
+    def test_pages_cover_every_expense_once_in_date_then_id_order(self):
+        # Several expenses share a date, so cursors must break ties on id.
+        self.add_expenses(self.user, [day // 3 for day in range(25)])
+        self.add_expenses(self.other, [0, 1])
+        expected = list(Expense.objects.filter(user=self.user).order_by('-date', '-id').values_list('id', flat=True))
+
+        seen, cursor = [], None
+        while True:
+            page = self.fetch(limit=4, **({'cursor': cursor} if cursor else {})).json()
+            seen += [expense['id'] for expense in page['results']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(reverse('expense-history')).status_code, 403)
+        self.assertEqual(self.fetch(cursor="not-a-cursor").status_code, 400)
+        self.assertEqual(self.fetch(limit=0).status_code, 400)
+        self.assertEqual(self.fetch(limit=1000).status_code, 400)
+
+    def test_dashboard_renders_the_first_page_and_a_cursor(self):
+        self.add_expenses(self.user, range(12))
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(len(response.context['expenses']), 10)
+        self.assertContains(response, f'data-cursor="{response.context["next_cursor"]}"')
+
+    def test_page_1000_costs_the_same_as_page_1(self):
+        import statistics
+        import time
+        from .expense_history import encode_cursor, expense_history_page
+
+        page_size = 10
+        self.add_expenses(self.user, [day // 4 for day in range(1000 * page_size + page_size)])
+        last_of_page_999 = Expense.objects.filter(user=self.user).order_by('-date', '-id')[999 * page_size - 1]
+        cursor = encode_cursor(last_of_page_999.date, last_of_page_999.pk)
+
+        with CaptureQueriesContext(connection) as queries:
+            deep, _ = expense_history_page(self.user, cursor, page_size)
+        self.assertEqual(len(deep), page_size)
+        self.assertNotIn('OFFSET', queries[0]['sql'].upper())
+
+        def median_seconds(cursor):
+            samples = []
+            for _ in range(7):
+                started = time.perf_counter()
+                expense_history_page(self.user, cursor, page_size)
+                samples.append(time.perf_counter() - started)
+            return statistics.median(samples)
+
+        first, thousandth = median_seconds(None), median_seconds(cursor)
+        self.assertLess(thousandth, first * 2 + 0.002)
+
+
+class SpendingSummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="ada", password="pw")
+        self.other = User.objects.create_user(username="bob", password="pw")
+        author = Author.objects.create(name="Jay Liebowitz")
+        self.analytics = Category.objects.create(name="Analytics")
+        self.finance = Category.objects.create(name="Finance")
+        self.book = Book.objects.create(title="Business Analytics", author=author, category=self.analytics)
+
+    def summaries(self):
+        return {
+            (row.user_id, row.year, row.month, row.category_id): (row.total, row.count)
+            for row in UserSpendingSummary.objects.all()
+        }
+
+    def test_expense_writes_move_the_owners_totals(self):
+        expense = Expense.objects.create(user=self.user, book=self.book, amount=100, date=date(2025, 8, 3))
+        Expense.objects.create(user=self.user, book=self.book, amount=20, date=date(2025, 8, 9))
+        Expense.objects.create(book=self.book, amount=5, date=date(2025, 8, 9))
+        key = (self.user.id, 2025, 8, self.analytics.id)
+        self.assertEqual(self.summaries(), {key: (Decimal('120.00'), 2)})
+
+        expense.amount = Decimal('60.00')
+        expense.user = self.other
+        expense.save()
+        self.assertEqual(self.summaries(), {
+            key: (Decimal('20.00'), 1),
+            (self.other.id, 2025, 8, self.analytics.id): (Decimal('60.00'), 1),
+        })
+
+        self.book.category = self.finance
+        self.book.save()
+        self.assertEqual(self.summaries(), {
+            (self.user.id, 2025, 8, self.finance.id): (Decimal('20.00'), 1),
+            (self.other.id, 2025, 8, self.finance.id): (Decimal('60.00'), 1),
+        })
+
+        expense.delete()
+        self.other.delete()
+        self.assertEqual(self.summaries(), {(self.user.id, 2025, 8, self.finance.id): (Decimal('20.00'), 1)})
+
+    def test_bulk_api_applies_the_same_deltas_as_a_rebuild(self):
+        from .spending import rebuild_spending_summaries
+
+        self.client.force_login(self.user)
+        self.client.post(
+            reverse('expense-bulk-create'),
+            data=[{'amount': 2, 'date': f'2024-{month:02d}-01', 'book_id': self.book.id} for month in (1, 1, 6)]
+            + [{'amount': 1, 'date': '2024-01-05', 'user_id': self.other.id}],
+            content_type='application/json',
+        )
+        incremental = self.summaries()
+        rebuild_spending_summaries()
+        self.assertEqual(self.summaries(), incremental)
+        self.assertEqual(incremental[(self.user.id, 2024, 1, self.analytics.id)], (Decimal('4.00'), 2))
+
+    def test_reconcile_command_reports_then_repairs_drift(self):
+        Expense.objects.create(user=self.user, book=self.book, amount=30, date=date(2025, 8, 3))
+        Expense.objects.create(user=self.other, amount=7, date=date(2025, 9, 3))
+        expected = self.summaries()
+
+        UserSpendingSummary.objects.filter(user=self.user).update(total=1)
+        UserSpendingSummary.objects.create(user=self.other, year=2020, month=1, total=5, count=1)
+
+        out = StringIO()
+        call_command('reconcile_spending', '--dry-run', stdout=out)
+        self.assertIn("2 drifted summary key(s) found", out.getvalue())
+        self.assertNotEqual(self.summaries(), expected)
+
+        out = StringIO()
+        call_command('reconcile_spending', '--user', 'ada', stdout=out)
+        self.assertIn("1 drifted summary key(s) repaired", out.getvalue())
+        call_command('reconcile_spending', stdout=StringIO())
+        self.assertEqual(self.summaries(), expected)
+
+    def test_dashboard_totals_come_from_the_summary_not_books_expense(self):
+        from .spending import spending_summary
+
+        today = date.today()
+        last_year = today.replace(year=today.year - 1, day=1)
+        Expense.objects.create(user=self.user, book=self.book, amount=10, date=today)
+        Expense.objects.create(user=self.user, amount=4, date=last_year)
+        Expense.objects.create(user=self.other, book=self.book, amount=99, date=today)
+
+        with CaptureQueriesContext(connection) as queries:
+            summary = spending_summary(self.user)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('books_expense', queries[0]['sql'])
+        self.assertEqual(
+            (summary['month_to_date'], summary['year_to_date'], summary['lifetime'], summary['count']),
+            (Decimal('10.00'), Decimal('10.00'), Decimal('14.00'), 2),
+        )
+        self.assertEqual([row['name'] for row in summary['categories']], ["Analytics", "Uncategorised"])
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['spending'], summary)
+        self.assertContains(response, "Analytics: ₦10.00")
+
+
+class BookAutocompleteTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="ada", password="pw")
+        author = Author.objects.create(name="Jay Liebowitz")
+        Book.objects.bulk_create([
+            Book(title=title, author=author)
+            for title in ["Business Analytics", "business law", "Busy Hands", "Bus Routes", "Data Science"]
+            + [f"Catalogue Volume {i}" for i in range(200)]
+        ])
+        self.client.force_login(self.user)
+
+    def fetch(self, **params):
+        return self.client.get(reverse('book-autocomplete'), params)
+
+    def test_prefix_matches_are_case_insensitive_ordered_and_limited(self):
+        response = self.fetch(q="BUSI")
+        self.assertEqual([title for _, title in response.json()['results']], ["Business Analytics", "business law"])
+        self.assertEqual(len(self.fetch(q="bus", limit=2).json()['results']), 2)
+        self.assertEqual(self.fetch(q="  ").json(), {'results': []})
+        self.assertEqual(self.fetch(q="zzz").json(), {'results': []})
+
+    def test_bad_requests(self):
+        self.assertEqual(self.fetch(q="bus", limit=0).status_code, 400)
+        self.assertEqual(self.fetch(q="bus", limit=500).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.fetch(q="bus").status_code, 403)
+
+    def test_prefixes_ending_in_punctuation_or_the_last_code_point(self):
+        author = Author.objects.get()
+        Book.objects.create(title="Harry: A Life", author=author)
+        Book.objects.create(title="Harry Potter", author=author)
+        Book.objects.create(title="Max \U0010ffff\U0010ffff", author=author)
+
+        self.assertEqual([title for _, title in self.fetch(q="harry:").json()['results']], ["Harry: A Life"])
+        self.assertEqual(
+            [title for _, title in self.fetch(q="max \U0010ffff").json()['results']], ["Max \U0010ffff\U0010ffff"],
+        )
+        self.assertEqual(self.fetch(q="\U0010ffff").json(), {'results': []})
+
+    def test_lookup_is_an_index_range_scan(self):
+        from .autocomplete import autocomplete_books
+
+        with CaptureQueriesContext(connection) as queries:
+            autocomplete_books("cata", 10)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # A handful of rows would otherwise be read with a sequential scan.
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute(f"EXPLAIN {queries[0]['sql']}")
+            else:
+                cursor.execute(f"EXPLAIN QUERY PLAN {queries[0]['sql']}")
+            plan = " ".join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('book_title_prefix_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        self.assertNotIn('Sort', plan)
+
+    def test_dashboard_renders_only_the_selected_book(self):
+        response = self.client.get(reverse('dashboard'))
+        self.assertNotContains(response, "Catalogue Volume")
+        self.assertContains(response, reverse('book-autocomplete'))
+
+        book = Book.objects.get(title="Bus Routes")
+        response = self.client.post(reverse('dashboard'), {'book': book.id, 'amount': 'oops'})
+        self.assertContains(response, 'value="Bus Routes"')
+        self.assertNotContains(response, "Catalogue Volume")
+
+        response = self.client.post(reverse('dashboard'), {'book': book.id, 'amount': '12.00'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Expense.objects.get().book, book)
+
+
+class BookSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="ada", password="pw", is_staff=True, is_superuser=True)
+        self.liebowitz = Author.objects.create(name="Jay Liebowitz")
+        self.analytics = Category.objects.create(name="Analytics")
+        self.crc = Publisher.objects.create(name="CRC Press")
+        self.book = Book.objects.create(
+            title="Business Analytics", subtitle="An Introduction", author=self.liebowitz,
+            category=self.analytics, publisher=self.crc,
+        )
+        self.other = Book.objects.create(title="Marketing Basics", author=self.liebowitz, category=self.analytics)
+        # Unrelated books, so bm25 sees the searched words as rare.
+        for title in ("Cooking at Home", "Garden Design", "Sailing Made Simple", "Night Skies"):
+            Book.objects.create(title=title, author=Author.objects.create(name="Someone Else"))
+        self.client.force_login(self.user)
+
+    def titles(self, text):
+        from .search import search_books
+
+        return [book.title for book, _ in search_books(text)]
+
+    def test_searches_every_field_and_ranks_title_matches_first(self):
+        self.assertEqual(self.titles("analytics"), ["Business Analytics", "Marketing Basics"])
+        self.assertEqual(self.titles("introduction"), ["Business Analytics"])
+        self.assertEqual(self.titles("liebowitz marketing"), ["Marketing Basics"])
+        self.assertEqual(self.titles("crc"), ["Business Analytics"])
+        self.assertEqual(self.titles('"analytics ('), ["Business Analytics", "Marketing Basics"])
+        self.assertEqual(self.titles("  "), [])
+
+    def test_index_follows_book_and_related_writes(self):
+        self.book.title = "Data Science"
+        self.book.save()
+        self.assertEqual(self.titles("science"), ["Data Science"])
+        self.assertEqual(self.titles("business"), [])
+
+        self.liebowitz.name = "J. Liebowitz-Smith"
+        self.liebowitz.save()
+        self.assertEqual(len(self.titles("smith")), 2)
+
+        self.analytics.delete()
+        self.assertEqual(self.titles("analytics"), [])
+
+        self.other.delete()
+        self.assertEqual(self.titles("liebowitz"), ["Data Science"])
+
+    def test_bulk_import_indexes_new_books(self):
+        import tempfile
+
+        handle = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+        self.addCleanup(os.remove, handle.name)
+        handle.write("title,authors,publisher,category\nQuantum Gardens,Ann Lee,Orbit,Fiction\n")
+        handle.close()
+        call_command('import_books', handle.name, stdout=StringIO())
+        self.assertEqual(self.titles("orbit fiction"), ["Quantum Gardens"])
+
+    def test_api_returns_ranked_results(self):
+        response = self.client.get(reverse('book-search'), {'q': 'analytics', 'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        [result] = response.json()['results']
+        self.assertEqual(
+            {key: result[key] for key in ('title', 'author', 'publisher', 'category')},
+            {'title': "Business Analytics", 'author': "Jay Liebowitz", 'publisher': "CRC Press", 'category': "Analytics"},
+        )
+        self.assertGreater(result['rank'], 0)
+        self.assertEqual(self.client.get(reverse('book-search'), {'q': 'x', 'limit': 0}).status_code, 400)
+
+    def test_admin_search_uses_the_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:books_book_changelist'), {'q': 'introduction'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.book])
+        self.assertFalse(any('LIKE' in query['sql'] for query in queries))
+
+
+class AdminScalabilityTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username="root", password="pw")
+        self.author = Author.objects.create(name="Jay Liebowitz")
+        self.category = Category.objects.create(name="Analytics")
+        self.publisher = Publisher.objects.create(name="CRC Press")
+        self.expense_type = ExpenseType.objects.create(name="Printing")
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        books = [
+            Book.objects.create(title=f"Volume {Book.objects.count()}", author=self.author,
+                                category=self.category, publisher=self.publisher)
+            for _ in range(count)
+        ]
+        user = User.objects.create_user(username=f"buyer-{User.objects.count()}", password="pw")
+        Expense.objects.bulk_create([
+            Expense(user=user, book=book, expense_type=self.expense_type, amount=1, date=date(2025, 1, 1))
+            for book in books
+        ])
+        Ticket.objects.bulk_create([Ticket(subject=book.title, user=user, assigned_to=self.admin) for book in books])
+
+    def changelist_queries(self, model):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f'admin:books_{model}_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_query_count_does_not_grow_with_rows(self):
+        self.add_rows(3)
+        small = {model: self.changelist_queries(model) for model in ('expense', 'book', 'ticket')}
+        self.add_rows(60)
+        large = {model: self.changelist_queries(model) for model in ('expense', 'book', 'ticket')}
+        self.assertEqual(large, small)
+
+    def test_expense_filters_do_not_list_every_book(self):
+        self.add_rows(5)
+        book = Book.objects.order_by('id').last()
+        url = reverse('admin:books_expense_changelist')
+
+        response = self.client.get(url)
+        self.assertNotContains(response, "?book=")
+        response = self.client.get(url, {'book': book.pk})
+        self.assertEqual([expense.book for expense in response.context['cl'].result_list], [book])
+        self.assertContains(response, f"?book={book.pk}")
+
+    def test_book_picker_autocompletes_on_title_prefix(self):
+        self.add_rows(3)
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'books', 'model_name': 'expense', 'field_name': 'book', 'term': 'volume 1',
+        })
+        self.assertEqual([result['text'] for result in response.json()['results']], ["Volume 1"])
+
+    def test_paginator_uses_the_planner_estimate_for_large_tables(self):
+        from .pagination import EstimatedCountPaginator
+
+        self.add_rows(30)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+        paginator = EstimatedCountPaginator(Expense.objects.order_by('-id'), 10)
+        paginator.exact_count_threshold = 1
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(paginator.count, 30)
+        self.assertFalse(any('COUNT(' in query['sql'].upper() for query in queries))
+
+        filtered = EstimatedCountPaginator(Expense.objects.filter(amount__gte=1).order_by('-id'), 10)
+        filtered.filtered_count_limit = 25
+        self.assertEqual(filtered.count, 25)
+
+
+class RequestMetricsMiddlewareTests(TestCase):
+    def setUp(self):
+        from django.test import override_settings
+
+        self.enterContext(override_settings(REQUEST_METRICS_SAMPLE_RATE=1.0))
+        self.user = User.objects.create_user(username="ada", password="pw")
+        author = Author.objects.create(name="Jay Liebowitz")
+        Book.objects.bulk_create([Book(title=f"Book {i}", author=author) for i in range(8)])
+
+    def middleware(self, get_response):
+        return RequestMetricsMiddleware(get_response)
+
+    def test_logs_one_json_line_and_sets_server_timing(self):
+        import json
+
+        self.client.force_login(self.user)
+        with self.assertLogs('myproject.requests', 'INFO') as logs:
+            response = self.client.get(reverse('dashboard'))
+        [line] = logs.records
+        record = json.loads(line.getMessage())
+        self.assertEqual((record['view'], record['status'], record['method']), ('dashboard', 200, 'GET'))
+        self.assertGreater(record['queries'], 0)
+        self.assertIn(f'desc="{record["queries"]} queries"', response['Server-Timing'])
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+')
+
+    def test_flags_repeated_sql_shapes_as_n_plus_one(self):
+        import json
+        from django.http import HttpResponse
+
+        def view(request):
+            for book in Book.objects.order_by('id'):
+                Book.objects.filter(pk=book.pk).values_list('title', flat=True).first()
+            return HttpResponse("ok")
+
+        with self.assertLogs('myproject.requests', 'INFO') as logs:
+            self.middleware(view)(RequestFactory().get('/n-plus-one/'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['queries'], 9)
+        [repeated] = record['n_plus_one']
+        self.assertEqual(repeated['count'], 8)
+        self.assertIn('books_book', repeated['sql'])
+
+    def test_streamed_exports_are_logged_when_the_stream_ends(self):
+        import json
+
+        self.client.force_login(self.user)
+        with self.assertLogs('myproject.requests', 'INFO') as logs:
+            response = self.client.get(reverse('export_report_csv'), {'mode': 'rows'})
+            self.assertEqual(logs.records, [])
+            b''.join(response.streaming_content)
+        self.assertEqual(json.loads(logs.records[0].getMessage())['view'], 'export_report_csv')
+
+    async def test_async_requests_count_queries_run_through_sync_to_async(self):
+        import json
+        from asgiref.sync import sync_to_async
+        from django.http import HttpResponse
+
+        async def view(request):
+            await sync_to_async(list)(Book.objects.all())
+            return HttpResponse("ok")
+
+        with self.assertLogs('myproject.requests', 'INFO') as logs:
+            response = await self.middleware(view)(RequestFactory().get('/async/'))
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+        self.assertEqual(json.loads(logs.records[0].getMessage())['queries'], 1)
+
+    def test_sample_rate_zero_turns_it_off(self):
+        from django.http import HttpResponse
+        from django.test import override_settings
+
+        with override_settings(REQUEST_METRICS_SAMPLE_RATE=0, PROMETHEUS_METRICS=False), \
+                self.assertNoLogs('myproject.requests'):
+            response = self.middleware(lambda request: HttpResponse("ok"))(RequestFactory().get('/'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_unsampled_requests_count_queries_without_their_sql(self):
+        from myproject.middleware import RequestMetrics
+
+        metrics = RequestMetrics(sampled=False)
+        metrics.record('SELECT 1', 0.5)
+        self.assertEqual((metrics.queries, metrics.sql_seconds), (1, 0.5))
+        self.assertEqual((metrics.shapes, metrics.repeated_shapes(1)), ({}, []))
+
+
+class PrometheusMetricsTests(TestCase):
+    def setUp(self):
+        from .report_cache import report_cache
+
+        report_cache().clear()
+        self.user = User.objects.create_user(username="ada", password="pw")
+        author = Author.objects.create(name="Jay Liebowitz")
+        book = Book.objects.create(title="Business Analytics", author=author)
+        Expense.objects.bulk_create(
+            [Expense(user=self.user, book=book, amount=Decimal("2.00"), date=date(2025, 3, day)) for day in range(1, 8)]
+        )
+
+    def sample(self, name, **labels):
+        from prometheus_client import REGISTRY
+
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_requests_are_counted_and_timed_by_url_name(self):
+        from django.test import override_settings
+
+        labels = {'view': 'sort-tickets', 'method': 'POST', 'status': '200'}
+        before = self.sample('http_requests_total', **labels)
+        timed = self.sample('http_request_duration_seconds_count', view='sort-tickets')
+        self.client.post(reverse('sort-tickets'), '[]', content_type='application/json')
+        self.assertEqual(self.sample('http_requests_total', **labels), before + 1)
+        self.assertEqual(self.sample('http_request_duration_seconds_count', view='sort-tickets'), timed + 1)
+
+        with override_settings(METRICS_TOKEN='s3cret'):
+            body = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').content.decode()
+        self.assertIn('http_requests_total{method="POST",status="200",view="sort-tickets"}', body)
+        self.assertIn('db_queries_per_request_bucket{le="1.0",view="sort-tickets"}', body)
+
+    def test_dashboard_queries_land_in_the_query_histogram(self):
+        self.client.force_login(self.user)
+        before = self.sample('db_queries_per_request_sum', view='dashboard')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('dashboard'))
+        self.assertEqual(self.sample('db_queries_per_request_sum', view='dashboard'), before + len(queries))
+
+    def test_row_exports_count_rows_and_report_cache_lookups_are_counted(self):
+        rows = self.sample('export_rows_total', format='csv')
+        response = self.client.get(reverse('export_report_csv'), {'mode': 'rows'})
+        b''.join(response.streaming_content)
+        self.assertEqual(self.sample('export_rows_total', format='csv'), rows + 7)
+
+        hits = self.sample('report_cache_lookups_total', kind='csv', outcome='hit')
+        self.client.get(reverse('export_report_csv'))
+        self.client.get(reverse('export_report_csv'))
+        self.assertEqual(self.sample('report_cache_lookups_total', kind='csv', outcome='hit'), hits + 1)
+        self.assertIsNotNone(self.sample('report_cache_hit_ratio', kind='csv'))
+
+    def test_totals_are_summed_across_worker_processes(self):
+        import subprocess
+        import sys
+        import tempfile
+        from unittest import mock
+        from .metrics import render_metrics
+
+        worker = (
+            "import sys; from books.metrics import record_cache_lookup, record_export_rows;"
+            "record_export_rows('xlsx', 5); record_cache_lookup('report', sys.argv[1] == 'hit')"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            environment = {**os.environ, 'PROMETHEUS_MULTIPROC_DIR': directory}
+            for outcome in ('hit', 'miss', 'miss', 'miss'):
+                subprocess.run([sys.executable, '-c', worker, outcome], env=environment, cwd=settings.BASE_DIR, check=True)
+            with mock.patch.dict(os.environ, {'PROMETHEUS_MULTIPROC_DIR': directory}):
+                body = render_metrics()[0].decode()
+        self.assertIn('export_rows_total{format="xlsx"} 20.0', body)
+        self.assertIn('report_cache_hit_ratio{kind="report"} 0.25', body)
+
+    def test_token_is_required_when_configured(self):
+        from django.test import override_settings
+
+        with override_settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer nope').status_code, 403)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+    def test_without_a_token_metrics_are_served_only_in_debug(self):
+        from django.test import override_settings
+
+        with override_settings(METRICS_TOKEN='', DEBUG=False):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+        with override_settings(METRICS_TOKEN='', DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+class SeedExpensesTests(TestCase):
+    def test_seeds_every_table_and_the_derived_summaries(self):
+        from django.db.models import Sum
+        from myproject.seed_expenses import seed
+
+        sizes = seed(300, seed=3, log=lambda message: None)
+        self.assertEqual(Expense.objects.count(), 300)
+        self.assertEqual(Ticket.objects.count(), sizes['tickets'])
+        self.assertEqual(User.objects.filter(username__startswith='seed3-').count(), sizes['users'])
+        self.assertEqual(Book.objects.count(), sizes['books'])
+        self.assertEqual(MonthlyExpenseRollup.objects.aggregate(n=Sum('count'))['n'], 300)
+        self.assertEqual(
+            UserSpendingSummary.objects.aggregate(total=Sum('total'))['total'],
+            Expense.objects.aggregate(total=Sum('amount'))['total'],
+        )
+        self.assertFalse(Ticket.objects.filter(status='open', assigned_to__isnull=False).exists())
+
+        with self.assertRaises(ValueError):
+            seed(300, seed=3, log=lambda message: None)
+
+    def test_same_seed_generates_the_same_rows(self):
+        from myproject.seed_expenses import generate_expenses, generate_tickets
+
+        ids = {'users': [1, 2, 3], 'books': [10, 11], 'expense_types': list(range(1, 10))}
+        end = date(2025, 12, 31)
+        self.assertEqual(list(generate_expenses(ids, 50, 7, end)), list(generate_expenses(ids, 50, 7, end)))
+        self.assertNotEqual(list(generate_expenses(ids, 50, 7, end)), list(generate_expenses(ids, 50, 8, end)))
+        self.assertEqual(list(generate_tickets(ids, 20, 7, end)), list(generate_tickets(ids, 20, 7, end)))
+
+
+@skipUnless(connection.vendor == 'postgresql', "Declarative partitioning is PostgreSQL only")
+class ExpensePartitioningTests(TestCase):
+    def setUp(self):
+        author = Author.objects.create(name="Jay Liebowitz")
+        self.category = Category.objects.create(name="Analytics")
+        self.book = Book.objects.create(title="Business Analytics", author=author, category=self.category)
+        for i, day in enumerate((date(2024, 3, 31), date(2025, 3, 1), date(2025, 3, 31), date(2025, 4, 1))):
+            Expense.objects.create(book=self.book, amount=10, date=day, external_id=f"L-{i}")
+
+    def convert(self, **kwargs):
+        from .partitions import convert_expense_table
+
+        kwargs.setdefault('today', date(2025, 6, 15))
+        return convert_expense_table(**kwargs)
+
+    def plan(self, **params):
+        qs, *_ = _filter_expenses(RequestFactory().get('/reports/', params))
+        return qs.explain()
+
+    def test_conversion_keeps_rows_and_prunes_report_filters(self):
+        from .partitions import is_partitioned, list_partitions
+
+        self.assertEqual(self.convert(months_ahead=2), 18 + 1)
+        self.assertEqual(self.convert(), 0)
+        self.assertTrue(is_partitioned())
+        partitions = list_partitions()
+        self.assertEqual((partitions[0][1], partitions[-1][2]), (date(2024, 3, 1), date(2025, 9, 1)))
+        self.assertEqual(Expense.objects.count(), 4)
+        last_id = Expense.objects.order_by('-id').values_list('id', flat=True)[0]
+        self.assertEqual(Expense.objects.create(book=self.book, amount=1, date=date(2025, 5, 2)).pk, last_id + 1)
+
+        month = self.plan(month='march', year='2025')
+        self.assertIn('books_expense_y2025m03', month)
+        for pruned in ('books_expense_y2025m04', 'books_expense_y2024m03', 'books_expense_default'):
+            self.assertNotIn(pruned, month)
+        year = self.plan(year='2025')
+        self.assertIn('books_expense_y2025m04', year)
+        self.assertNotIn('books_expense_y2024m03', year)
+
+    def test_external_ids_stay_unique_and_ingest_upserts_across_partitions(self):
+        import tempfile
+        from django.db import IntegrityError, transaction
+        from .ingest import ingest_expenses
+
+        self.convert()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Expense.objects.create(amount=1, date=date(2025, 5, 1), external_id='L-1')
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as handle:
+            handle.write("external_id,date,amount\nL-1,2025-05-20,20\nL-9,2025-05-21,5\n")
+        self.addCleanup(os.remove, handle.name)
+        result = ingest_expenses(handle.name, force_orm=True)
+        self.assertEqual(result['written'], 2)
+        self.assertEqual(Expense.objects.count(), 5)
+        self.assertEqual(Expense.objects.get(external_id='L-1').date, date(2025, 5, 20))
+        self.assertEqual(
+            sorted(MonthlyExpenseRollup.objects.filter(year=2025).values_list('month', 'total')),
+            [(3, Decimal('10.00')), (4, Decimal('10.00')), (5, Decimal('25.00'))],
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM books_expense_external_id")
+            self.assertEqual(cursor.fetchone()[0], 5)
+
+    def test_command_creates_months_ahead_and_archives_expired_ones(self):
+        from django.db.models import Sum
+        from django.utils import timezone
+        from .partitions import add_months, list_partitions
+
+        this_month = add_months(timezone.localdate(), 0)
+        self.convert(today=this_month, months_ahead=0)
+        # Lands in the default partition until its month is created.
+        Expense.objects.create(book=self.book, amount=3, date=add_months(this_month, 2), external_id='L-ahead')
+
+        out = StringIO()
+        call_command('partition_expenses', ahead=3, retain_months=12, stdout=out)
+        self.assertIn('3 partition(s) created', out.getvalue())
+        self.assertEqual(list_partitions()[-1][2], add_months(this_month, 4))
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM books_expense_default")
+            self.assertEqual(cursor.fetchone()[0], 0)
+            cursor.execute("SELECT count(*) FROM expense_archive.books_expense_y2024m03")
+            archived = cursor.fetchone()[0]
+        self.assertEqual(list_partitions()[0][1], add_months(this_month, -12))
+        self.assertEqual(archived, 1)
+        self.assertEqual(Expense.objects.get(external_id='L-ahead').amount, Decimal('3.00'))
+        self.assertEqual(
+            MonthlyExpenseRollup.objects.aggregate(n=Sum('count'))['n'], Expense.objects.count(),
+        )
+
+
+class ReplicaRouterTests(TestCase):
+    """A second SQLite file stands in for the replica; it holds different rows so reads show where they went."""
+    # Resolved in setUpClass, once the replica alias exists; a named alias would fail the runner's checks.
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        import tempfile
+        from django.db import connections
+        from myproject.db_router import REPLICA
+
+        cls.replica_dir = tempfile.TemporaryDirectory()
+        replica = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(cls.replica_dir.name, 'replica.db')}
+        connections.settings[REPLICA] = connections.configure_settings(
+            {'default': connections.settings['default'], REPLICA: replica},
+        )[REPLICA]
+        call_command('migrate', database=REPLICA, run_syncdb=True, verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        from django.db import connections
+        from myproject.db_router import REPLICA
+
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        cls.replica_dir.cleanup()
+
+    def setUp(self):
+        from myproject.db_router import REPLICA, replica_health
+        from .report_cache import report_cache
+
+        replica_health.reset()
+        report_cache().clear()
+        Expense.objects.create(amount=Decimal('11.00'), date=date(2025, 3, 1))
+        Expense.objects.using(REPLICA).bulk_create([Expense(amount=Decimal('22.00'), date=date(2025, 3, 2))])
+
+    def export_amounts(self):
+        response = self.client.get(reverse('export_report_csv'), {'mode': 'rows'})
+        body = b''.join(response.streaming_content).decode()
+        return [line.rsplit(',', 1)[1] for line in body.splitlines()[1:]]
+
+    def test_report_and_exports_read_from_the_replica(self):
+        from django.db import connections
+        from myproject.db_router import REPLICA
+
+        self.assertEqual(self.export_amounts(), ['22.00'])
+        with CaptureQueriesContext(connections[REPLICA]) as replica_queries:
+            response = self.client.get(reverse('report'), {'year': '2025'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any('WITH series' in query['sql'] for query in replica_queries.captured_queries))
+
+    def test_falls_back_to_the_primary_when_the_replica_lags_or_is_down(self):
+        from unittest import mock
+        from django.db import OperationalError
+        from myproject.db_router import replica_health
+
+        with mock.patch('myproject.db_router.measure_replica_lag', return_value=3600):
+            self.assertEqual(self.export_amounts(), ['11.00'])
+        replica_health.reset()
+        with mock.patch('myproject.db_router.measure_replica_lag', side_effect=OperationalError('down')):
+            self.assertEqual(self.export_amounts(), ['11.00'])
+
+    def test_a_write_pins_the_client_to_the_primary(self):
+        from myproject.db_router import PIN_COOKIE
+
+        response = self.client.post(reverse('sort-tickets'), '[]', content_type='application/json')
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self.export_amounts(), ['11.00'])
+        del self.client.cookies[PIN_COOKIE]
+        self.assertEqual(self.export_amounts(), ['22.00'])
+
+    def test_writes_go_to_the_primary_and_later_reads_follow_them(self):
+        from django.db import router
+        from myproject.db_router import REPLICA, reads_from_replica
+
+        self.assertEqual(router.db_for_write(Expense, instance=Expense.objects.using(REPLICA).get()), 'default')
+
+        from django.http import JsonResponse
+
+        @reads_from_replica
+        def view(request):
+            before = str(Expense.objects.get().amount)
+            Ticket.objects.create(subject="Written mid-request")
+            return JsonResponse({'before': before, 'after': str(Expense.objects.get().amount)})
+
+        response = view(RequestFactory().get('/'))
+        self.assertJSONEqual(response.content, {'before': '22.00', 'after': '11.00'})
+
+
+class ExpenseShardingTests(TestCase):
+    """A second SQLite file is ``shard1``; alice's rows live on ``default`` and bob's on ``shard1``."""
+    # Resolved in setUpClass, once the shard alias exists.
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        import tempfile
+        from django.db import connections
+        from django.test import override_settings
+
+        cls.shard_dir = tempfile.TemporaryDirectory()
+        shard = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(cls.shard_dir.name, 'shard1.db')}
+        connections.settings['shard1'] = connections.configure_settings(
+            {'default': connections.settings['default'], 'shard1': shard},
+        )['shard1']
+        call_command('migrate', database='shard1', run_syncdb=True, verbosity=0)
+        cls.enterClassContext(override_settings(EXPENSE_SHARDS=['default', 'shard1']))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        from django.db import connections
+
+        super().tearDownClass()
+        connections['shard1'].close()
+        del connections['shard1']
+        del connections.settings['shard1']
+        cls.shard_dir.cleanup()
+
+    def setUp(self):
+        from .models import UserShard
+        from .report_cache import report_cache
+
+        report_cache().clear()
+        self.category = Category.objects.create(name='Fiction')
+        self.book = Book.objects.create(
+            title='Dune', author=Author.objects.create(name='Frank Herbert'), category=self.category,
+        )
+        self.alice = User.objects.create_user('alice', password='pass12345')
+        self.bob = User.objects.create_user('bob', password='pass12345')
+        UserShard.objects.create(user=self.alice, shard='default')
+        UserShard.objects.create(user=self.bob, shard='shard1')
+
+    def add_expense(self, user, amount, day, using=None):
+        expense = Expense(user=user, book=self.book, amount=Decimal(amount), date=day)
+        expense.save(using=using)
+        return expense
+
+    def test_rows_follow_their_user_and_reference_data_is_copied(self):
+        from .sharding import shard_for_user
+
+        carol = User.objects.create_user('carol')
+        home = ['default', 'shard1'][carol.pk % 2]
+        expense = self.add_expense(carol, '4.00', date(2025, 3, 1))
+        Ticket.objects.create(user=carol, subject="Help")
+
+        self.assertEqual((expense._state.db, shard_for_user(carol.pk)), (home, home))
+        self.assertEqual(carol.expense_set.get().pk, expense.pk)
+        self.assertEqual(Ticket.objects.using(home).get().user_id, carol.pk)
+        self.assertTrue(User.objects.using('shard1').filter(username='carol').exists())
+        self.assertTrue(Book.objects.using('shard1').filter(pk=self.book.pk, category=self.category).exists())
+
+        expense.amount = Decimal('7.00')
+        expense.save()
+        self.assertEqual(Expense.objects.using(home).get().amount, Decimal('7.00'))
+        self.assertEqual(MonthlyExpenseRollup.objects.get().total, Decimal('7.00'))
+
+    def test_reports_and_exports_gather_every_shard(self):
+        from datetime import datetime
+        from django.utils import timezone
+        from .reports import ReportQuery
+        from .rollups import rebuild_monthly_rollups
+        from .spending import reconcile_spending_summaries
+
+        self.add_expense(self.alice, '10.00', date(2025, 3, 1))
+        self.add_expense(self.bob, '5.00', date(2025, 3, 2))
+        self.assertEqual(Expense.objects.using('shard1').get().user, self.bob)
+        Ticket.objects.create(user=self.bob, subject="Refund")
+        Ticket.objects.using('shard1').update(created_at=timezone.make_aware(datetime(2025, 3, 2, 12)))
+
+        for query in (ReportQuery(year=2025), ReportQuery(date_from=date(2025, 3, 1), date_to=date(2025, 3, 31))):
+            result = query.execute()
+            self.assertEqual([(row['total'], row['tickets']) for row in result.series], [(Decimal('15.00'), 1)])
+            self.assertEqual(result.category_totals[0]['total'], Decimal('15.00'))
+
+        response = self.client.get(reverse('export_report_csv'), {'mode': 'rows', 'month': 'March'})
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual([line.split(',')[1] for line in body.splitlines()[1:]], ['alice', 'bob'])
+
+        self.assertEqual(rebuild_monthly_rollups(), 1)
+        self.assertEqual(MonthlyExpenseRollup.objects.get().total, Decimal('15.00'))
+        self.assertEqual(reconcile_spending_summaries(), [])
+
+    def test_book_changes_reach_every_shard(self):
+        self.add_expense(self.bob, '5.00', date(2025, 3, 2))
+        self.book.category = Category.objects.create(name='Science')
+        self.book.save()
+        self.assertEqual(MonthlyExpenseRollup.objects.get().category_id, self.book.category_id)
+        self.assertEqual(Book.objects.using('shard1').get().category_id, self.book.category_id)
+
+        self.book.delete()
+        self.assertIsNone(Expense.objects.using('shard1').get().book_id)
+        self.assertIsNone(MonthlyExpenseRollup.objects.get().category_id)
+
+    def test_claims_reach_tickets_on_any_shard(self):
+        from .ticket_queue import claim_next_ticket
+
+        Ticket.objects.create(user=self.bob, subject="Refund")
+        ticket = claim_next_ticket(agent=self.alice)
+        self.assertEqual(
+            (ticket._state.db, ticket.status, ticket.assigned_to_id), ('shard1', 'in_progress', self.alice.pk),
+        )
+        self.assertIsNone(claim_next_ticket(agent=self.alice))
+
+    def test_rebalance_moves_users_and_their_stragglers(self):
+        from .models import UserShard
+        from .reports import ReportQuery
+        from .sharding import shard_for_user
+
+        carol = User.objects.create_user('carol')
+        UserShard.objects.filter(user=self.bob).update(shard='default')
+        UserShard.objects.create(user=carol, shard='default')
+        for user, count in ((self.alice, 3), (self.bob, 3), (carol, 2)):
+            for day in range(1, count + 1):
+                self.add_expense(user, '1.00', date(2025, 3, day))
+        ticket = Ticket.objects.create(user=self.alice, subject="Moving")
+        created_at = ticket.created_at
+
+        out = StringIO()
+        call_command('rebalance_shards', '--dry-run', stdout=out)
+        self.assertIn(f"user {self.alice.pk}: 4 rows default → shard1", out.getvalue())
+        self.assertFalse(Expense.objects.using('shard1').exists())
+
+        call_command('rebalance_shards', stdout=StringIO())
+        self.assertEqual(shard_for_user(self.alice.pk), 'shard1')
+        self.assertEqual(Expense.objects.using('shard1').filter(user=self.alice).count(), 3)
+        self.assertEqual(Ticket.objects.using('shard1').get().created_at, created_at)
+        self.assertFalse(Expense.objects.filter(user=self.alice).exists())
+        self.assertEqual(ReportQuery(date_from=date(2025, 3, 1)).execute().series[0]['total'], Decimal('8.00'))
+
+        # A write routed by the old placement is moved home on the next run.
+        self.add_expense(self.alice, '2.00', date(2025, 3, 9), using='default')
+        call_command('rebalance_shards', '--skip-reference', stdout=StringIO())
+        self.assertEqual(Expense.objects.using('shard1').filter(user=self.alice).count(), 4)
+        self.assertEqual(Expense.objects.count(), 5)
+
+
+class ExportJobTests(TestCase):
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+
+        self.user = User.objects.create_user(username="ada", password="pw")
+        author = Author.objects.create(name="Jay Liebowitz")
+        category = Category.objects.create(name="Analytics")
+        book = Book.objects.create(title="Business Analytics", author=author, category=category)
+        printing = ExpenseType.objects.create(name="Printing")
+        Expense.objects.create(user=self.user, book=book, expense_type=printing, amount='12.50', date=date(2025, 8, 3))
+        Expense.objects.create(amount=7, date=date(2025, 7, 1))
+        Expense.objects.create(amount=9, date=date(2024, 8, 1))
+
+        export_dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(EXPORT_JOBS=True, EXPORT_JOB_DIR=export_dir))
+
+    def run_worker(self):
+        out = StringIO()
+        call_command('run_export_worker', '--once', stdout=out)
+        return out.getvalue()
+
+    def test_rows_export_is_queued_then_written_by_the_worker(self):
+        from .models import ExportJob
+
+        response = self.client.get(reverse('export_report_csv'), {'mode': 'rows', 'year': '2025'})
+        job = ExportJob.objects.get()
+        self.assertRedirects(response, reverse('export-job', args=[job.pk]))
+        self.assertEqual((job.kind, job.status, job.params), ('csv', 'queued', {'year': ['2025']}))
+        self.assertContains(self.client.get(response.url), reverse('export-job-status', args=[job.pk]))
+        # Summaries come from the rollups and are still written inline.
+        self.assertEqual(self.client.get(reverse('export_report_csv'), {'year': '2025'}).status_code, 200)
+
+        self.assertIn("Wrote 1 export(s), 0 failed", self.run_worker())
+        status = self.client.get(reverse('export-job-status', args=[job.pk])).json()
+        self.assertEqual((status['status'], status['rows_written'], status['rows_total']), ('done', 2, 2))
+
+        download = self.client.get(status['download_url'])
+        self.assertEqual(download['Content-Disposition'], 'attachment; filename="expense_rows.csv"')
+        self.assertEqual(b''.join(download.streaming_content).decode().splitlines(), [
+            "Date,User,Book,Category,Expense Type,Amount",
+            "2025-07-01,,,,,7.00",
+            "2025-08-03,ada,Business Analytics,Analytics,Printing,12.50",
+        ])
+
+    def test_xlsx_jobs_are_owned_and_not_duplicated(self):
+        self.client.force_login(self.user)
+        url = reverse('export-report-xlsx')
+        first = self.client.get(url, {'mode': 'rows'}, HTTP_ACCEPT='application/json')
+        self.assertEqual((first.status_code, first.json()['status']), (202, 'queued'))
+        again = self.client.get(url, {'mode': 'rows'}, HTTP_ACCEPT='application/json')
+        self.assertEqual(again.json()['id'], first.json()['id'])
+        download_url = reverse('export-job-download', args=[first.json()['id']])
+        self.assertEqual(self.client.get(download_url).status_code, 409)
+
+        self.run_worker()
+        workbook = openpyxl.load_workbook(BytesIO(b''.join(self.client.get(download_url).streaming_content)))
+        self.assertEqual(workbook.sheetnames, ['Summary', 'Uncategorised', 'Analytics'])
+
+        self.client.force_login(User.objects.create_user(username="bob", password="pw"))
+        self.assertEqual(self.client.get(download_url).status_code, 404)
+
+    def test_stale_jobs_are_requeued_and_the_old_worker_stops(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .export_jobs import ExportJobLost, claim_next_job, report_progress, requeue_stale_jobs
+        from .models import ExportJob
+
+        self.client.get(reverse('export_report_csv'), {'mode': 'rows'})
+        stuck = claim_next_job('worker-1')
+        ExportJob.objects.filter(pk=stuck.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale_jobs(), (1, 0))
+
+        retried = claim_next_job('worker-2')
+        self.assertEqual((retried.pk, retried.attempts), (stuck.pk, 2))
+        with self.assertRaises(ExportJobLost):
+            report_progress(stuck, 5000)
+
+        ExportJob.objects.filter(pk=stuck.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1), attempts=3)
+        self.assertEqual(requeue_stale_jobs(), (0, 1))
+        self.assertEqual(ExportJob.objects.get().status, 'failed')
+
+
+class ExportJobConcurrencyTests(TransactionTestCase):
+    def test_concurrent_workers_never_share_a_job(self):
+        import threading
+        from django.db import connections
+        from .export_jobs import claim_next_job
+        from .models import ExportJob
+
+        ExportJob.objects.bulk_create([ExportJob(kind='csv') for _ in range(60)])
+        claimed, lock = [], threading.Lock()
+
+        def worker(name):
+            try:
+                while (job := claim_next_job(name)) is not None:
+                    with lock:
+                        claimed.append(job.pk)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(f"worker-{i}",)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(claimed), 60)
+        self.assertEqual(len(set(claimed)), 60)
+        self.assertFalse(ExportJob.objects.filter(status='queued').exists())
@@ -0,0 +1,193 @@
+# books/ticket_ordering.py
+"""Validation and ordering for large ticket payloads (``/sort-tickets/``).
+
+Two orderings are supported, and both end with ``id`` so equal keys still
+sort deterministically:
+
+* ``priority``: ``(priority, timestamp, id)``, the ``TicketSerializer`` payload.
+* ``created``: ``(created_at, id)``.
+
+``parse_ticket_keys`` validates raw JSON items and packs each one into a
+single integer with the same order as its key tuple:
+
+    key = (priority * TIMESTAMP_RANGE + timestamp) * ID_RANGE + id
+
+Timestamps are microseconds since ``datetime.min``. Ids are limited to the
+``BigAutoField`` range, so the low bits of a key are always its id. Sorting
+plain ints is about three times faster than sorting tuples whose first
+elements mostly tie. Validating in one pass is far faster than running a
+serializer per item, which dominated request time at hundreds of thousands
+of tickets. ``order_ticket_ids`` then sorts the keys, or keeps only the first
+``limit`` with a heap.
+"""
+import heapq
+from datetime import datetime, timedelta, timezone as dt_timezone
+from operator import itemgetter
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+ORDERINGS = {
+    'priority': ('priority', 'timestamp', 'id'),
+    'created': ('created_at', 'id'),
+}
+DEFAULT_ORDERING = 'priority'
+DATETIME_FIELDS = {'timestamp', 'created_at'}
+
+_MICROSECOND = timedelta(microseconds=1)
+# Shifted one day below datetime.min so that a UTC offset cannot make a timestamp negative.
+_TIMESTAMP_ORIGIN = datetime.min.replace(tzinfo=dt_timezone.utc)
+_TIMESTAMP_SHIFT = timedelta(days=1) // _MICROSECOND
+TIMESTAMP_RANGE = 2 ** 59
+ID_RANGE = 2 ** 63
+_ID_MASK = ID_RANGE - 1
+
+
+class TicketOrderingError(ValueError):
+    """Invalid items; ``errors`` is a list of ``{'index', 'errors'}`` dicts."""
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} invalid ticket(s)")
+        self.errors = errors
+
+
+# --------------------------------------------------
+# 🔍 Field parsers (raise ValueError with the message for the client)
+# --------------------------------------------------
+
+def _parse_int(value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            pass
+    elif isinstance(value, float) and value.is_integer():
+        return int(value)
+    raise ValueError("A valid integer is required.")
+
+
+def _parse_id(value):
+    value = _parse_int(value)
+    if not 0 <= value < ID_RANGE:
+        raise ValueError(f"Ensure this value is between 0 and {ID_RANGE - 1}.")
+    return value
+
+
+def _parse_timestamp(value, default_tz):
+    """ISO 8601 string -> non-negative integer microseconds; naive values are in ``TIME_ZONE``."""
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            parsed = parse_datetime(value)
+        if parsed is not None:
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=default_tz)
+            return (parsed - _TIMESTAMP_ORIGIN) // _MICROSECOND + _TIMESTAMP_SHIFT
+    raise ValueError("Datetime has wrong format. Use one of these formats instead: YYYY-MM-DDThh:mm[:ss[.uuuuuu]][+HH:MM|-HH:MM|Z].")
+
+
+# --------------------------------------------------
+# 🔢 Ordering
+# --------------------------------------------------
+
+def _fast_keys(items, ordering, default_tz):
+    """Pack keys for the common payload: JSON ints and ``fromisoformat`` strings.
+
+    Returns ``None`` at the first item that needs anything more, and the
+    caller then falls back to the field-by-field loop.
+    """
+    keys = []
+    append = keys.append
+    fromisoformat, origin, microsecond, shift = datetime.fromisoformat, _TIMESTAMP_ORIGIN, _MICROSECOND, _TIMESTAMP_SHIFT
+    try:
+        if ordering == 'priority':
+            for priority, timestamp, ticket_id in map(itemgetter('priority', 'timestamp', 'id'), items):
+                if type(priority) is not int or type(ticket_id) is not int or not 0 <= ticket_id < ID_RANGE:
+                    return None
+                moment = fromisoformat(timestamp)
+                if moment.tzinfo is None:
+                    moment = moment.replace(tzinfo=default_tz)
+                append((priority * TIMESTAMP_RANGE + (moment - origin) // microsecond + shift) * ID_RANGE + ticket_id)
+        else:
+            for created_at, ticket_id in map(itemgetter('created_at', 'id'), items):
+                if type(ticket_id) is not int or not 0 <= ticket_id < ID_RANGE:
+                    return None
+                moment = fromisoformat(created_at)
+                if moment.tzinfo is None:
+                    moment = moment.replace(tzinfo=default_tz)
+                append(((moment - origin) // microsecond + shift) * ID_RANGE + ticket_id)
+    except (KeyError, TypeError, ValueError):
+        return None
+    return keys
+
+
+def parse_ticket_keys(items, ordering=DEFAULT_ORDERING):
+    """Turn raw ticket dicts into packed integer sort keys; raise ``TicketOrderingError`` listing every bad item."""
+    fields = ORDERINGS[ordering]
+    default_tz = timezone.get_current_timezone()
+    keys = _fast_keys(items, ordering, default_tz)
+    if keys is not None:
+        return keys
+
+    parsers = []
+    for field in fields:
+        if field in DATETIME_FIELDS:
+            parsers.append((field, lambda value: _parse_timestamp(value, default_tz), TIMESTAMP_RANGE))
+        elif field == 'id':
+            parsers.append((field, _parse_id, ID_RANGE))
+        else:
+            parsers.append((field, _parse_int, None))
+
+    keys, errors = [], []
+    append = keys.append
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({'index': index, 'errors': {'non_field_errors': ["Expected an object."]}})
+            continue
+        key, item_errors = 0, None
+        for field, parse, field_range in parsers:
+            try:
+                value = parse(item[field])
+            except KeyError:
+                item_errors = item_errors or {}
+                item_errors[field] = ["This field is required."]
+                continue
+            except ValueError as exc:
+                item_errors = item_errors or {}
+                item_errors[field] = [str(exc)]
+                continue
+            # Only the leading field has no range; the ones after it are bounded.
+            key = key * field_range + value if field_range else value
+        if item_errors:
+            errors.append({'index': index, 'errors': item_errors})
+        else:
+            append(key)
+
+    if errors:
+        raise TicketOrderingError(errors)
+    return keys
+
+
+def order_ticket_ids(keys, limit=None):
+    """Ticket ids in key order; with ``limit``, only the first ``limit`` (heap top-k, O(n log k))."""
+    if limit is not None and limit < len(keys):
+        ordered = heapq.nsmallest(limit, keys)
+    else:
+        ordered = sorted(keys)
+    return [key & _ID_MASK for key in ordered]
+
+
+def sort_tickets(tickets, ordering=DEFAULT_ORDERING, limit=None):
+    """Order already-typed ticket dicts, e.g. model values; raise ``ValueError`` on a missing key."""
+    fields = ORDERINGS[ordering]
+    key = itemgetter(*fields)
+    try:
+        keys = [key(ticket) for ticket in tickets]
+    except KeyError:
+        quoted = ', '.join(f"'{field}'" for field in fields)
+        raise ValueError(f"Each ticket must contain {quoted}")
+    ordered = heapq.nsmallest(limit, keys) if limit is not None else sorted(keys)
+    return [key[-1] for key in ordered]
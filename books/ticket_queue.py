@@ -0,0 +1,134 @@
+# books/ticket_queue.py
+"""Claiming open tickets from several agents or workers at once.
+
+``claim_next_ticket`` moves one ``open`` ticket to ``in_progress`` and
+returns it. No two callers ever receive the same ticket. Where the backend
+supports ``RETURNING`` (PostgreSQL, SQLite 3.35+), a claim is one statement:
+
+    UPDATE books_ticket SET status = 'in_progress', ...
+    WHERE id = (SELECT id FROM books_ticket WHERE status = 'open'
+                ORDER BY created_at, id LIMIT 1 FOR UPDATE SKIP LOCKED)
+      AND status = 'open'
+    RETURNING ...
+
+On PostgreSQL, ``SKIP LOCKED`` makes concurrent claimers pass over a row
+that another claimer is taking, so they do not queue behind it. SQLite has
+no row locks and no ``FOR UPDATE``. There the statement runs under
+SQLite's single-writer lock, which serialises claims by itself. Backends
+without ``RETURNING`` fall back to a compare-and-swap loop. The UPDATE
+only matches while the ticket is still ``open``, and a claimer that loses
+the race retries with the next candidate.
+
+Claims bypass ``save()``. The reports count tickets by creation date, so a
+status change does not need to invalidate them.
+
+With sharded tickets (see ``books.sharding``) each shard is its own queue.
+A claim tries them in turn from a random one, so agents spread over the
+shards and an empty shard costs one query. The claim ordering then holds
+within a shard, not across them.
+"""
+import random
+import time
+
+from django.db import OperationalError, connections, transaction
+from django.utils import timezone
+
+from . import sharding
+from .models import Ticket
+
+CLAIM_ORDERINGS = {
+    'oldest': ('created_at', 'id'),
+    'priority': ('priority', 'created_at', 'id'),
+}
+DEFAULT_CLAIM_ORDERING = 'oldest'
+
+# Attempts before giving up under heavy contention.
+CLAIM_RETRIES = 100
+
+
+class TicketClaimContention(Exception):
+    """Every retry lost its race or hit a lock; the caller may try again."""
+
+
+def _claim_values(agent):
+    now = timezone.now()
+    return {'status': 'in_progress', 'assigned_to': agent, 'claimed_at': now, 'updated_at': now}
+
+
+def _supports_update_returning(connection):
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35)
+
+
+def _claim_returning(candidates, agent, using):
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    meta = Ticket._meta
+    values = _claim_values(agent)
+
+    assignments, params = [], []
+    for name, value in values.items():
+        field = meta.get_field(name)
+        assignments.append(f"{quote(field.column)} = %s")
+        params.append(field.get_db_prep_save(value.pk if name == 'assigned_to' and value else value, connection))
+    columns = ', '.join(quote(field.column) for field in meta.concrete_fields)
+
+    with transaction.atomic(using=using):
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        subquery, subquery_params = candidates.values('pk')[:1].query.get_compiler(using=using).as_sql()
+        sql = (
+            f"UPDATE {quote(meta.db_table)} SET {', '.join(assignments)} "
+            f"WHERE {quote(meta.pk.column)} = ({subquery}) AND {quote(meta.get_field('status').column)} = %s "
+            f"RETURNING {columns}"
+        )
+        claimed = list(Ticket.objects.using(using).raw(sql, [*params, *subquery_params, 'open']))
+    return claimed[0] if claimed else None
+
+
+def _claim_compare_and_swap(candidates, agent, using):
+    for attempt in range(CLAIM_RETRIES):
+        try:
+            pk = candidates.values_list('pk', flat=True).first()
+            if pk is None:
+                return None
+            if Ticket.objects.using(using).filter(pk=pk, status='open').update(**_claim_values(agent)):
+                return Ticket.objects.using(using).get(pk=pk)
+        except OperationalError as exc:
+            if 'locked' not in str(exc):
+                raise
+            time.sleep(random.uniform(0, 0.001 * min(attempt + 1, 20)))
+    raise TicketClaimContention(f"No ticket claimed after {CLAIM_RETRIES} attempts.")
+
+
+def claim_next_ticket(agent=None, ordering=DEFAULT_CLAIM_ORDERING, using=None):
+    """Claim the next open ticket for ``agent``; ``None`` when the queue is empty.
+
+    Without ``using``, every shard's queue is tried.
+    """
+    if using is not None:
+        return _claim_on(agent, ordering, using)
+    aliases = sharding.shard_aliases()
+    start = random.randrange(len(aliases))
+    for alias in aliases[start:] + aliases[:start]:
+        ticket = _claim_on(agent, ordering, alias)
+        if ticket is not None:
+            return ticket
+    return None
+
+
+def _claim_on(agent, ordering, using):
+    candidates = Ticket.objects.using(using).filter(status='open').order_by(*CLAIM_ORDERINGS[ordering])
+    if not _supports_update_returning(connections[using]):
+        return _claim_compare_and_swap(candidates, agent, using)
+
+    for attempt in range(CLAIM_RETRIES):
+        try:
+            return _claim_returning(candidates, agent, using)
+        except OperationalError as exc:
+            # SQLite reports writer contention as "database is locked" / "database table is locked".
+            if 'locked' not in str(exc):
+                raise
+            time.sleep(random.uniform(0, 0.001 * min(attempt + 1, 20)))
+    raise TicketClaimContention(f"No ticket claimed after {CLAIM_RETRIES} attempts.")
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from books.views import dashboard_view
 from django.contrib.auth import views as auth_views
@@ -7,12 +8,29 @@ from .views import export_report_xlsx
 from books.views import (
     homepage_view,
     report_view,
+    report_cache_stats_view,
     export_report_csv,
+    areport_view,
+    aexport_report_csv,
+    aexport_report_xlsx,
+    export_job_view,
+    export_job_status_view,
+    export_job_download_view,
     ticket_dashboard_view,
     ticket_sort_view,
+    ticket_claim_view,
+    expense_bulk_create_view,
+    expense_history_view,
+    book_autocomplete_view,
+    book_search_view,
+    metrics_view,
     register,  # 👈 Make sure this view exists in books/views.py
 )
 
+# ⚡ The ASGI profile serves the reports from their async counterparts.
+if settings.ASYNC_REPORTS:
+    report_view, export_report_csv, export_report_xlsx = areport_view, aexport_report_csv, aexport_report_xlsx
+
 urlpatterns = [
     path('', homepage_view, name='home'),
     path('dashboard/', dashboard_view, name='dashboard'),
@@ -20,8 +38,18 @@ urlpatterns = [
     path('reports/', report_view, name='report'),
     path('reports/export/xlsx/', export_report_xlsx, name='export-report-xlsx'),
     path('reports/export/', export_report_csv, name='export_report_csv'),
+    path('reports/exports/<uuid:job_id>/', export_job_view, name='export-job'),
+    path('reports/exports/<uuid:job_id>/status/', export_job_status_view, name='export-job-status'),
+    path('reports/exports/<uuid:job_id>/download/', export_job_download_view, name='export-job-download'),
+    path('reports/cache/stats/', report_cache_stats_view, name='report-cache-stats'),
+    path('api/expenses/bulk/', expense_bulk_create_view, name='expense-bulk-create'),
+    path('api/expenses/history/', expense_history_view, name='expense-history'),
+    path('api/books/autocomplete/', book_autocomplete_view, name='book-autocomplete'),
+    path('api/books/search/', book_search_view, name='book-search'),
+    path('metrics', metrics_view, name='metrics'),
     path('tickets/', ticket_dashboard_view, name='ticket-dashboard'),
     path('sort-tickets/', ticket_sort_view, name='sort-tickets'),
+    path('api/tickets/claim/', ticket_claim_view, name='ticket-claim'),
     path('accounts/register/', register, name='register'),  # 👈 Add this line
     path('accounts/password-reset/', auth_views.PasswordResetView.as_view(template_name='registration/password_reset_form.html'), name='password_reset'),
     path('accounts/password-reset/done/', auth_views.PasswordResetDoneView.as_view(template_name='registration/password_reset_done.html'), name='password_reset_done'),
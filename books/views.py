@@ -1,130 +1,258 @@
 # 📦 Imports
-from django.shortcuts import render, redirect
-from django.http import HttpResponse
-from django.db.models import Sum, Count
-from django.db.models.functions import ExtractMonth, ExtractYear
+from django.shortcuts import get_object_or_404, render, redirect
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Max, Min, Q
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from rest_framework.decorators import api_view
+from django.conf import settings
+from rest_framework.decorators import api_view, parser_classes, permission_classes
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from calendar import month_name
-from datetime import datetime
+from collections import defaultdict
+from decimal import Decimal
+from datetime import date, datetime, timedelta
 from django.utils import timezone
 from .forms import TicketForm, ExpenseForm
-from .models import Expense, Ticket, Book, Category, ExpenseType
-from .serializers import TicketSerializer
+from .models import Expense, ExportJob, Ticket
+from . import export_jobs, ticket_ordering
+from .serializers import ClaimedTicketSerializer
+from .ticket_queue import CLAIM_ORDERINGS, DEFAULT_CLAIM_ORDERING, TicketClaimContention, claim_next_ticket
+from .autocomplete import AUTOCOMPLETE_LIMIT, AUTOCOMPLETE_MAX_LIMIT, autocomplete_books
+from .bulk_expenses import BulkExpenseImporter
+from .expense_history import (
+    EXPENSE_HISTORY_MAX_PAGE_SIZE, EXPENSE_HISTORY_PAGE_SIZE, InvalidCursor, expense_history_page, serialize_expense,
+)
+from .facets import adropdown_options, dropdown_options
+from .metrics import record_export_rows, render_metrics
+from .parsers import NDJSONParser
+from .report_cache import acached_report, cache_stats, cached_report
+from .reports import ReportQuery
+from .search import SEARCH_LIMIT, SEARCH_MAX_LIMIT, search_books, serialize_search_result
+from .sharding import shard_for_user, shard_querysets
+from .spending import spending_summary
 from django.contrib import messages
+from myproject.db_router import reads_from_replica
+from asgiref.sync import sync_to_async
+import asyncio
 import csv
+import heapq
+import hmac
+import io
+import re
+import tempfile
 import openpyxl
 
+# Rows fetched per round trip when streaming row-level exports.
+EXPORT_CHUNK_SIZE = 2000
+
+# Excel's hard limit per worksheet; larger categories roll over to another sheet.
+XLSX_MAX_ROWS = 1_048_576
+# Workbooks bigger than this are spooled to disk instead of memory.
+XLSX_SPOOL_SIZE = 8 * 1024 * 1024
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Expenses shown on the dashboard before "Load more".
+DASHBOARD_EXPENSES = 10
+
+# Upper bound on rows accepted by one bulk expense request.
+BULK_EXPENSE_MAX_ROWS = 100_000
+
+EXPENSE_EXPORT_COLUMNS = [
+    ('Date', 'date'),
+    ('User', 'user__username'),
+    ('Book', 'book__title'),
+    ('Category', 'book__category__name'),
+    ('Expense Type', 'expense_type__name'),
+    ('Amount', 'amount'),
+]
+
 # --------------------------------------------------
 # 🔧 Utility Functions
 # --------------------------------------------------
 
 def sort_tickets(tickets):
-    required_keys = {'created_at', 'id'}
-    for ticket in tickets:
-        if not required_keys.issubset(ticket):
-            raise ValueError("Each ticket must contain 'created_at' and 'id'")
-    return [x['id'] for x in sorted(tickets, key=lambda x: (x['created_at'], x['id']))]
+    return ticket_ordering.sort_tickets(tickets, 'created')
 
-def _filter_expenses(request):
+def _parse_report_filters(request):
     selected_month = request.GET.get('month', '').strip().title()
     selected_category = request.GET.get('category', '').strip().title()
     selected_year = request.GET.get('year', '').strip()
 
-    qs = Expense.objects.select_related('book__category')
-
+    month_number = None
     try:
         if selected_month:
             month_number = datetime.strptime(selected_month, '%B').month
-            qs = qs.filter(date__month=month_number)
     except ValueError:
         selected_month = ''
 
+    return selected_month, month_number, selected_category, selected_year
+
+def _parse_date_range(request):
+    """Read the optional ``from``/``to`` ISO dates. Both bounds are inclusive."""
+    bounds = []
+    for param in ('from', 'to'):
+        try:
+            bounds.append(date.fromisoformat(request.GET.get(param, '').strip()))
+        except ValueError:
+            bounds.append(None)
+    return bounds[0], bounds[1]
+
+def _month_bounds(year, month):
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+def _month_year_q(month_number, year):
+    """Turn month/year filters into half-open ``date`` ranges that an index on ``date`` can serve."""
+    if year:
+        if month_number:
+            start, end = _month_bounds(year, month_number)
+        else:
+            start, end = date(year, 1, 1), date(year + 1, 1, 1)
+        return Q(date__gte=start, date__lt=end)
+
+    # A month without a year means that month in every year we hold data for.
+    spans = [qs.aggregate(first=Min('date'), last=Max('date')) for qs in shard_querysets(Expense.objects.all())]
+    spans = [span for span in spans if span['first'] is not None]
+    if not spans:
+        return Q(pk__in=[])
+    q = Q()
+    for year in range(min(span['first'] for span in spans).year, max(span['last'] for span in spans).year + 1):
+        start, end = _month_bounds(year, month_number)
+        q |= Q(date__gte=start, date__lt=end)
+    return q
+
+def _report_cache_params(request):
+    """The filters a report depends on, normalised so equivalent URLs share a cache entry."""
+    selected_month, month_number, selected_category, selected_year = _parse_report_filters(request)
+    date_from, date_to = _parse_date_range(request)
+    return {
+        'month': month_number,
+        'category': selected_category.lower(),
+        'year': int(selected_year) if selected_year.isdigit() else None,
+        'from': date_from,
+        'to': date_to,
+    }
+
+def _filter_expenses(request):
+    selected_month, month_number, selected_category, selected_year = _parse_report_filters(request)
+    date_from, date_to = _parse_date_range(request)
+
+    qs = Expense.objects.select_related('book__category')
+
+    year = int(selected_year) if selected_year.isdigit() else None
+    if year is not None and not 1 <= year < date.max.year:
+        return qs.none(), selected_month, selected_category, selected_year
+
+    if month_number or year:
+        qs = qs.filter(_month_year_q(month_number, year))
+
+    if date_from:
+        qs = qs.filter(date__gte=date_from)
+
+    if date_to and date_to < date.max:
+        qs = qs.filter(date__lt=date_to + timedelta(days=1))
+
     if selected_category:
         qs = qs.filter(book__category__name__iexact=selected_category)
 
-    if selected_year.isdigit():
-        qs = qs.filter(date__year=int(selected_year))
-
     return qs, selected_month, selected_category, selected_year
 
-def _get_monthly_expenses(qs):
-    return qs.annotate(
-        month=ExtractMonth('date'),
-        year=ExtractYear('date')
-    ).values('month', 'year').annotate(total=Sum('amount')).order_by('year', 'month')
-
-def _get_monthly_ticket_counts():
-    return Ticket.objects.annotate(
-        month=ExtractMonth('created_at'),
-        year=ExtractYear('created_at')
-    ).values('month', 'year').annotate(count=Count('id'))
-
-def _build_chart_data(expenses, ticket_data):
-    ticket_map = {
-        (entry['month'], entry['year']): entry['count']
-        for entry in ticket_data
-    }
-    labels, totals, ticket_counts = [], [], []
-    for entry in expenses:
-        month, year, total = entry['month'], entry['year'], entry['total']
-        if month and year:
-            label = f"{month_name[month][:3]} {year}"
-            labels.append(label)
-            totals.append(float(total))
-            ticket_counts.append(ticket_map.get((month, year), 0))
-    return labels, totals, ticket_counts
-
-def _get_dropdown_options():
-    months = sorted(set(
-        month_name[m] for m in Expense.objects.annotate(month=ExtractMonth('date'))
-        .values_list('month', flat=True).distinct() if m
-    ))
-
-    categories = sorted(set(
-        Expense.objects.select_related('book__category')
-        .values_list('book__category__name', flat=True)
-        .distinct()
-    ))
-
-    years = sorted(set(
-        Expense.objects.annotate(year=ExtractYear('date'))
-        .values_list('year', flat=True).distinct()
-    ))
-
-    return months, categories, years
+def _report_query(request):
+    """The ``ReportQuery`` for the request's filters, plus the normalised filter values."""
+    selected_month, month_number, selected_category, selected_year = _parse_report_filters(request)
+    date_from, date_to = _parse_date_range(request)
+    query = ReportQuery(
+        month=month_number,
+        year=int(selected_year) if selected_year.isdigit() else None,
+        category=selected_category,
+        date_from=date_from,
+        date_to=date_to,
+    )
+    return query, selected_month, selected_category, selected_year
+
+def _month_label(entry):
+    return f"{month_name[entry['month']][:3]} {entry['year']}"
+
+def _expense_export_rows(qs, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield one tuple per expense without materialising the queryset.
+
+    ``iterator()`` uses a server-side cursor on PostgreSQL, so only
+    ``chunk_size`` rows are held in memory at a time. Sharded expenses are
+    read from every shard at once and merged by date.
+    """
+    fields = [field for _, field in EXPENSE_EXPORT_COLUMNS]
+    streams = [
+        shard_qs.order_by('date', 'id').values_list(*fields).iterator(chunk_size=chunk_size)
+        for shard_qs in shard_querysets(qs)
+    ]
+    if len(streams) == 1:
+        return streams[0]
+    return heapq.merge(*streams, key=lambda row: row[0])
+
+def _stream_csv(header, rows, rows_per_write=500):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    # The header goes out before the query runs, so the download starts at once.
+    writer.writerow(header)
+    yield flush()
+
+    count = 0
+    try:
+        for count, row in enumerate(rows, start=1):
+            writer.writerow(row)
+            if count % rows_per_write == 0:
+                yield flush()
+
+        yield flush()
+    finally:
+        # Also counts the rows sent before a client hung up.
+        record_export_rows('csv', count)
+
+def _xlsx_sheet_title(name, taken):
+    """Return a unique, Excel-safe worksheet title (max 31 chars, no []:*?/\\)."""
+    base = re.sub(r'[\[\]:*?/\\]', ' ', name).strip()[:31] or 'Sheet'
+    title, suffix_number = base, 2
+    while title.lower() in taken:
+        suffix = f" ({suffix_number})"
+        title = base[:31 - len(suffix)] + suffix
+        suffix_number += 1
+    taken.add(title.lower())
+    return title
 
 # --------------------------------------------------
 # 📊 Reporting Views
 # --------------------------------------------------
 
-def report_view(request):
-    expenses_qs, selected_month, selected_category, selected_year = _filter_expenses(request)
-    expenses = _get_monthly_expenses(expenses_qs)
-    ticket_data = _get_monthly_ticket_counts()
-    labels, totals, ticket_counts = _build_chart_data(expenses, ticket_data)
+def _build_report_context(query, filters, result, dropdowns):
+    selected_month, selected_category, selected_year = filters
+    labels = [_month_label(entry) for entry in result.series]
+    totals = [float(entry['total']) for entry in result.series]
+    ticket_counts = [entry['tickets'] for entry in result.series]
 
     report_data = list(zip(labels, totals, ticket_counts))
     no_data = not report_data
 
     if no_data:
         report_data = [("No data", 0.0, 0)]
-        labels, totals, ticket_counts = zip(*report_data)
+        labels, totals, ticket_counts = ["No data"], [0.0], [0]
 
-    months, categories, years = _get_dropdown_options()
+    months, categories, years = dropdowns
 
-    category_totals = (
-        Expense.objects.select_related('book__category')
-        .values('book__category__name')
-        .annotate(total=Sum('amount'))
-        .order_by('-total')
-    )
-
-    return render(request, 'books/report.html', {
+    return {
         'labels': labels,
         'totals': totals,
         'ticket_counts': ticket_counts,
@@ -135,57 +263,249 @@ def report_view(request):
         'selected_month': selected_month,
         'selected_category': selected_category,
         'selected_year': selected_year,
+        'selected_from': query.date_from.isoformat() if query.date_from else '',
+        'selected_to': query.date_to.isoformat() if query.date_to else '',
         'no_data': no_data,
-        'category_totals': category_totals,
-    })
-
-def export_report_csv(request):
-    expenses_qs, selected_month, selected_category, selected_year = _filter_expenses(request)
-    expenses = _get_monthly_expenses(expenses_qs)
-    ticket_data = _get_monthly_ticket_counts()
-    ticket_map = {
-        (entry['month'], entry['year']): entry['count']
-        for entry in ticket_data
+        'category_totals': result.category_totals,
     }
 
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="expense_report.csv"'
-    writer = csv.writer(response)
-    writer.writerow(['Month', 'Total Expenses', 'Ticket Count'])
+def _report_context(request):
+    query, *filters = _report_query(request)
+    return _build_report_context(query, filters, query.execute(), dropdown_options())
 
-    for entry in expenses:
-        month, year, total = entry['month'], entry['year'], entry['total']
-        label = f"{month_name[month][:3]} {year}"
-        ticket_count = ticket_map.get((month, year), 0)
-        writer.writerow([label, float(total), ticket_count])
+def _cached(kind, request, compute):
+    """Serve ``compute(request)`` from the versioned report cache; returns ``(value, 'hit'|'miss')``."""
+    value, hit = cached_report(kind, _report_cache_params(request), lambda: compute(request))
+    return value, 'hit' if hit else 'miss'
 
+@reads_from_replica
+def report_view(request):
+    context, outcome = _cached('report', request, _report_context)
+    response = render(request, 'books/report.html', context)
+    response['X-Report-Cache'] = outcome
     return response
 
-def export_report_xlsx(request):
+@staff_member_required
+def report_cache_stats_view(request):
+    return JsonResponse(cache_stats())
+
+def count_expense_rows(request):
+    """How many rows the row-level export for the request's filters holds."""
+    return sum(shard_qs.count() for shard_qs in shard_querysets(_filter_expenses(request)[0]))
+
+def write_expense_rows_csv(request, output, track=None):
+    """Write the row-level CSV to the text file ``output``; ``track`` wraps the row iterator."""
+    rows = _expense_export_rows(_filter_expenses(request)[0])
+    header = [label for label, _ in EXPENSE_EXPORT_COLUMNS]
+    for chunk in _stream_csv(header, track(rows) if track else rows):
+        output.write(chunk)
+
+def export_expense_rows_csv(request):
+    if settings.EXPORT_JOBS:
+        return _queue_export(request, 'csv')
+
     expenses_qs, selected_month, selected_category, selected_year = _filter_expenses(request)
-    expenses = _get_monthly_expenses(expenses_qs)
-    ticket_data = _get_monthly_ticket_counts()
-    ticket_map = {
-        (entry['month'], entry['year']): entry['count']
-        for entry in ticket_data
-    }
+    header = [label for label, _ in EXPENSE_EXPORT_COLUMNS]
+
+    response = StreamingHttpResponse(
+        _stream_csv(header, _expense_export_rows(expenses_qs)),
+        content_type='text/csv',
+    )
+    response['Content-Disposition'] = 'attachment; filename="expense_rows.csv"'
+    return response
+
+def _build_report_csv(result):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['Month', 'Total Expenses', 'Ticket Count'])
+
+    for entry in result.series:
+        writer.writerow([_month_label(entry), float(entry['total']), entry['tickets']])
+
+    return output.getvalue()
+
+def _report_csv(request):
+    return _build_report_csv(_report_query(request)[0].execute())
+
+@reads_from_replica
+def export_report_csv(request):
+    # Row-level exports stream unbounded data and are never cached; with EXPORT_JOBS they are queued instead.
+    if request.GET.get('mode') == 'rows':
+        return export_expense_rows_csv(request)
 
+    content, outcome = _cached('csv', request, _report_csv)
+    response = HttpResponse(content, content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="expense_report.csv"'
+    response['X-Report-Cache'] = outcome
+    return response
+
+def write_expense_rows_xlsx(request, output, track=None):
+    """Write the row-level workbook to the binary file ``output``; ``track`` wraps the row iterator."""
+    expenses_qs = _filter_expenses(request)[0]
+    result = _report_query(request)[0].execute()
+
+    # Write-only workbooks stream each sheet to a temp file instead of keeping cell objects.
+    wb = openpyxl.Workbook(write_only=True)
+    taken_titles = set()
+    summary = wb.create_sheet(_xlsx_sheet_title("Summary", taken_titles))
+    summary.append(['Month', 'Total Expenses', 'Ticket Count'])
+    for entry in result.series:
+        summary.append([_month_label(entry), float(entry['total']), entry['tickets']])
+
+    header = [label for label, _ in EXPENSE_EXPORT_COLUMNS]
+    sheets = {}
+    category_totals = defaultdict(lambda: [0, Decimal('0')])
+
+    rows = _expense_export_rows(expenses_qs)
+    for row in track(rows) if track else rows:
+        category = row[3] or 'Uncategorised'
+        sheet = sheets.get(category)
+        if sheet is None or sheet[1] >= XLSX_MAX_ROWS:
+            ws = wb.create_sheet(_xlsx_sheet_title(category, taken_titles))
+            ws.append(header)
+            sheet = sheets[category] = [ws, 1]
+        sheet[0].append(row)
+        sheet[1] += 1
+
+        totals = category_totals[category]
+        totals[0] += 1
+        totals[1] += row[5]
+
+    record_export_rows('xlsx', sum(count for count, _ in category_totals.values()))
+    summary.append([])
+    summary.append(['Category', 'Expenses', 'Total'])
+    for category, (count, total) in sorted(category_totals.items()):
+        summary.append([category, count, float(total)])
+
+    wb.save(output)
+
+def export_expense_rows_xlsx(request):
+    if settings.EXPORT_JOBS:
+        return _queue_export(request, 'xlsx')
+
+    output = tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_SIZE)
+    write_expense_rows_xlsx(request, output)
+    output.seek(0)
+    return FileResponse(output, as_attachment=True, filename='expense_rows.xlsx', content_type=XLSX_CONTENT_TYPE)
+
+def _build_report_xlsx(result):
     wb = openpyxl.Workbook()
     ws = wb.active
     ws.title = "Expense Report"
     ws.append(['Month', 'Total Expenses', 'Ticket Count'])
 
-    for entry in expenses:
-        month, year, total = entry['month'], entry['year'], entry['total']
-        label = f"{month_name[month][:3]} {year}"
-        ticket_count = ticket_map.get((month, year), 0)
-        ws.append([label, float(total), ticket_count])
+    for entry in result.series:
+        ws.append([_month_label(entry), float(entry['total']), entry['tickets']])
+
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+def _report_xlsx(request):
+    return _build_report_xlsx(_report_query(request)[0].execute())
+
+@reads_from_replica
+def export_report_xlsx(request):
+    if request.GET.get('mode') == 'rows':
+        return export_expense_rows_xlsx(request)
 
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    content, outcome = _cached('xlsx', request, _report_xlsx)
+    response = HttpResponse(content, content_type=XLSX_CONTENT_TYPE)
     response['Content-Disposition'] = 'attachment; filename="expense_report.xlsx"'
-    wb.save(response)
+    response['X-Report-Cache'] = outcome
     return response
 
+# --------------------------------------------------
+# ⚡ Async Reporting Views (ASGI)
+# --------------------------------------------------
+# Served instead of the sync views above when ASYNC_REPORTS is on. The report
+# parts and the dropdown reads run as concurrent queries, so a cache miss waits
+# for the slowest query instead of all of them in turn.
+
+async def _areport_context(request):
+    query, *filters = _report_query(request)
+    result, dropdowns = await asyncio.gather(query.aexecute(), adropdown_options())
+    return _build_report_context(query, filters, result, dropdowns)
+
+async def _areport_csv(request):
+    return _build_report_csv(await _report_query(request)[0].aexecute())
+
+async def _areport_xlsx(request):
+    return _build_report_xlsx(await _report_query(request)[0].aexecute())
+
+async def _acached(kind, request, acompute):
+    value, hit = await acached_report(kind, _report_cache_params(request), lambda: acompute(request))
+    return value, 'hit' if hit else 'miss'
+
+@reads_from_replica
+async def areport_view(request):
+    context, outcome = await _acached('report', request, _areport_context)
+    # Context processors may touch the session and user, which are sync-only.
+    response = await sync_to_async(render)(request, 'books/report.html', context)
+    response['X-Report-Cache'] = outcome
+    return response
+
+@reads_from_replica
+async def aexport_report_csv(request):
+    if request.GET.get('mode') == 'rows':
+        return await sync_to_async(export_expense_rows_csv)(request)
+
+    content, outcome = await _acached('csv', request, _areport_csv)
+    response = HttpResponse(content, content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="expense_report.csv"'
+    response['X-Report-Cache'] = outcome
+    return response
+
+@reads_from_replica
+async def aexport_report_xlsx(request):
+    if request.GET.get('mode') == 'rows':
+        return await sync_to_async(export_expense_rows_xlsx)(request)
+
+    content, outcome = await _acached('xlsx', request, _areport_xlsx)
+    response = HttpResponse(content, content_type=XLSX_CONTENT_TYPE)
+    response['Content-Disposition'] = 'attachment; filename="expense_report.xlsx"'
+    response['X-Report-Cache'] = outcome
+    return response
+
+# --------------------------------------------------
+# 📤 Background Export Views
+# --------------------------------------------------
+# With EXPORT_JOBS on, row-level exports are queued for run_export_worker
+# (books.export_jobs). The browser lands on a page that polls the job and
+# downloads the file once it is written.
+
+def _queue_export(request, kind):
+    job = export_jobs.enqueue_export(kind, request.GET, request.user)
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse(export_jobs.serialize_job(job), status=202)
+    return redirect('export-job', job_id=job.pk)
+
+def _export_job_for(request, job_id):
+    job = get_object_or_404(ExportJob.objects.using(DEFAULT_DB_ALIAS), pk=job_id)
+    # Anonymous jobs are reachable by their random id alone; a user's jobs only by that user.
+    if job.user_id is not None and job.user_id != request.user.id:
+        raise Http404("No such export.")
+    return job
+
+def export_job_view(request, job_id):
+    job = _export_job_for(request, job_id)
+    return render(request, 'books/export_job.html', {'job': job, 'job_status': export_jobs.serialize_job(job)})
+
+def export_job_status_view(request, job_id):
+    return JsonResponse(export_jobs.serialize_job(_export_job_for(request, job_id)))
+
+def export_job_download_view(request, job_id):
+    job = _export_job_for(request, job_id)
+    if job.status != 'done':
+        return JsonResponse({'error': f"The export is {job.status}, not ready for download."}, status=409)
+    try:
+        handle = open(export_jobs.export_path(job.file_name), 'rb')
+    except FileNotFoundError:
+        raise Http404("The export file has expired.")
+    content_type = XLSX_CONTENT_TYPE if job.kind == 'xlsx' else 'text/csv'
+    return FileResponse(handle, as_attachment=True, filename=export_jobs.DOWNLOAD_NAMES[job.kind],
+                        content_type=content_type)
+
 # --------------------------------------------------
 # 🎫 Ticket Views
 # --------------------------------------------------
@@ -195,12 +515,41 @@ def ticket_sort_view(request):
     if not isinstance(request.data, list):
         return Response({'error': 'Expected a list of tickets.'}, status=status.HTTP_400_BAD_REQUEST)
 
-    serializer = TicketSerializer(data=request.data, many=True)
-    if serializer.is_valid():
-        sorted_ids = sort_tickets(serializer.validated_data)
-        return Response({'sorted_ticket_ids': sorted_ids}, status=status.HTTP_200_OK)
+    # ?order=priority (default: priority, timestamp, id) or ?order=created (created_at, id)
+    ordering = request.query_params.get('order', ticket_ordering.DEFAULT_ORDERING)
+    if ordering not in ticket_ordering.ORDERINGS:
+        choices = ', '.join(ticket_ordering.ORDERINGS)
+        return Response({'error': f"Unknown order '{ordering}'; use one of: {choices}."}, status=status.HTTP_400_BAD_REQUEST)
+
+    limit = request.query_params.get('limit')
+    if limit is not None:
+        if not limit.isdigit() or int(limit) < 1:
+            return Response({'error': "limit must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
+        limit = int(limit)
+
+    try:
+        keys = ticket_ordering.parse_ticket_keys(request.data, ordering)
+    except ticket_ordering.TicketOrderingError as exc:
+        return Response({'error': exc.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({'sorted_ticket_ids': ticket_ordering.order_ticket_ids(keys, limit)}, status=status.HTTP_200_OK)
 
-    return Response({'error': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def ticket_claim_view(request):
+    """Claim the next open ticket for the caller: 200 with the ticket, or 204 when none are open."""
+    ordering = request.query_params.get('order', DEFAULT_CLAIM_ORDERING)
+    if ordering not in CLAIM_ORDERINGS:
+        choices = ', '.join(CLAIM_ORDERINGS)
+        return Response({'error': f"Unknown order '{ordering}'; use one of: {choices}."}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        ticket = claim_next_ticket(agent=request.user, ordering=ordering)
+    except TicketClaimContention as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    if ticket is None:
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response(ClaimedTicketSerializer(ticket).data, status=status.HTTP_200_OK)
 
 @login_required
 def ticket_dashboard_view(request):
@@ -214,13 +563,114 @@ def ticket_dashboard_view(request):
             messages.success(request, "🎫 Ticket submitted successfully!")
             return redirect('ticket-dashboard')
 
-    tickets = Ticket.objects.filter(user=request.user).order_by('-created_at')[:10]
+    tickets = (
+        Ticket.objects.using(shard_for_user(request.user.pk))
+        .filter(user=request.user).order_by('-created_at')[:10]
+    )
 
     return render(request, 'books/ticket_dashboard.html', {
         'form': form,
         'tickets': tickets
     })
 
+# --------------------------------------------------
+# 💸 Expense API
+# --------------------------------------------------
+
+@api_view(['POST'])
+@parser_classes([JSONParser, NDJSONParser])
+@permission_classes([IsAuthenticated])
+def expense_bulk_create_view(request):
+    """Create expenses from a JSON array or NDJSON body.
+
+    Valid rows are saved even when others fail; each failure is reported
+    with its zero-based ``index`` in the request body.
+    """
+    rows = request.data
+    if not isinstance(rows, list):
+        return Response({'error': 'Expected a list of expenses.'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(rows) > BULK_EXPENSE_MAX_ROWS:
+        return Response(
+            {'error': f'At most {BULK_EXPENSE_MAX_ROWS} expenses per request.'},
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+
+    result = BulkExpenseImporter(request.user).run(rows)
+    if not result['errors']:
+        code = status.HTTP_201_CREATED
+    elif result['created']:
+        code = status.HTTP_207_MULTI_STATUS
+    else:
+        code = status.HTTP_400_BAD_REQUEST
+    return Response(result, status=code)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def expense_history_view(request):
+    """The caller's expenses, newest first, one keyset page at a time (``?cursor=&limit=``)."""
+    limit = request.query_params.get('limit', str(EXPENSE_HISTORY_PAGE_SIZE))
+    if not limit.isdigit() or not 1 <= int(limit) <= EXPENSE_HISTORY_MAX_PAGE_SIZE:
+        return Response(
+            {'error': f"limit must be between 1 and {EXPENSE_HISTORY_MAX_PAGE_SIZE}."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        expenses, next_cursor = expense_history_page(request.user, request.query_params.get('cursor'), int(limit))
+    except InvalidCursor as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'results': [serialize_expense(expense) for expense in expenses], 'next_cursor': next_cursor})
+
+# --------------------------------------------------
+# 🔎 Book Autocomplete and Search APIs
+# --------------------------------------------------
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def book_autocomplete_view(request):
+    """Books whose title starts with ``?q=``, as ``{"results": [[id, title], ...]}``."""
+    limit = request.query_params.get('limit', str(AUTOCOMPLETE_LIMIT))
+    if not limit.isdigit() or not 1 <= int(limit) <= AUTOCOMPLETE_MAX_LIMIT:
+        return Response(
+            {'error': f"limit must be between 1 and {AUTOCOMPLETE_MAX_LIMIT}."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    books = autocomplete_books(request.query_params.get('q', ''), int(limit))
+    response = Response({'results': [[book_id, title] for book_id, title in books]})
+    # The picker re-asks for the same prefixes as the user types and deletes.
+    response['Cache-Control'] = 'private, max-age=60'
+    return response
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def book_search_view(request):
+    """Ranked full-text search over title, subtitle, author, publisher and category (``?q=&limit=``)."""
+    limit = request.query_params.get('limit', str(SEARCH_LIMIT))
+    if not limit.isdigit() or not 1 <= int(limit) <= SEARCH_MAX_LIMIT:
+        return Response(
+            {'error': f"limit must be between 1 and {SEARCH_MAX_LIMIT}."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    results = search_books(request.query_params.get('q', ''), int(limit))
+    return Response({'results': [serialize_search_result(book, rank) for book, rank in results]})
+
+# --------------------------------------------------
+# 📊 Prometheus Metrics
+# --------------------------------------------------
+
+def metrics_view(request):
+    if settings.METRICS_TOKEN:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(supplied.encode(), settings.METRICS_TOKEN.encode()):
+            return HttpResponse(status=403)
+    elif not settings.DEBUG:
+        # Per-view traffic and latency are not for the public; without a token only DEBUG serves them.
+        raise Http404("Metrics are not enabled.")
+    body, content_type = render_metrics()
+    return HttpResponse(body, content_type=content_type)
+
 # --------------------------------------------------
 # 🏠 Homepage View
 # --------------------------------------------------
@@ -261,14 +711,17 @@ def dashboard_view(request):
         else:
             messages.error(request, "⚠️ Please correct the errors below.")
 
-    expenses = list(Expense.objects.select_related('book__category', 'expense_type')
-                    .filter(user=request.user).order_by('-date')[:10])
+    expenses, next_cursor = expense_history_page(request.user, limit=DASHBOARD_EXPENSES)
+    # Totals come from the per-user summary rows, not from summing books_expense.
+    spending = spending_summary(request.user)
 
     greeting = "Good evening" if timezone.now().hour >= 18 else "Hello"
 
     return render(request, 'books/dashboard.html', {
         'form': form,
         'expenses': expenses,
+        'next_cursor': next_cursor,
+        'spending': spending,
         'greeting': greeting,
         'user': request.user,
     })
@@ -0,0 +1,24 @@
+# gunicorn.conf.py
+"""Gunicorn settings, read automatically when gunicorn starts in this directory.
+
+Prepares the directory in which prometheus_client's multiprocess mode
+collects every worker's metrics (see ``books.metrics``).
+"""
+import os
+import shutil
+import tempfile
+
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'myproject-prometheus'))
+
+
+def on_starting(server):
+    # Files left by an earlier run would be added to this run's totals.
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
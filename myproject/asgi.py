@@ -2,6 +2,7 @@
 ASGI config for myproject project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Run it with ``gunicorn myproject.asgi:application -k uvicorn.workers.UvicornWorker``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -12,5 +13,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
+# Serve reports from the async views; set ASYNC_REPORTS=0 to keep the sync ones.
+os.environ.setdefault('ASYNC_REPORTS', '1')
 
 application = get_asgi_application()
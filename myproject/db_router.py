@@ -0,0 +1,175 @@
+# myproject/db_router.py
+"""Send report and export reads to an optional ``replica`` database.
+
+The replica is configured with ``REPLICA_DATABASE_URL``. Without it every
+query uses ``default``, just as before.
+
+Views decorated with ``reads_from_replica`` pick a database once, when the
+request arrives, and read every ``books`` model from it. That includes
+queries run later: streamed export bodies, ``sync_to_async`` calls and the
+report query pool. The choice falls back to ``default`` when:
+
+* the client wrote something in the last ``REPLICA_PIN_SECONDS``.
+  ``ReplicaPinMiddleware`` marks such clients with a cookie, so a report
+  opened right after adding an expense includes it;
+* the replica is down, or more than ``REPLICA_MAX_LAG_SECONDS`` behind. The
+  replica is checked at most once every ``REPLICA_CHECK_SECONDS`` per
+  process.
+
+Writes always go to ``default``, even for an instance loaded from the
+replica. After a write, the rest of that request reads from ``default``.
+Sessions and users are never read from the replica: a new login may not
+have reached it yet.
+
+The report cache key includes the data version, and that version is read
+from the same database as the report. A report served from a lagging
+replica is therefore cached under the older version it matches.
+"""
+import logging
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+REPLICA = 'replica'
+# Only these apps are read from the replica; sessions and auth stay on the primary.
+REPLICA_APPS = {'books'}
+PIN_COOKIE = 'primary_reads'
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def replica_configured():
+    return REPLICA in connections.settings
+
+
+def measure_replica_lag(connection):
+    """Seconds the replica's data is behind the primary; raises ``DatabaseError`` if it is unreachable."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # Idle primaries send nothing to replay, so "fully replayed" counts as no lag at all.
+            cursor.execute("""
+                SELECT CASE
+                    WHEN NOT pg_is_in_recovery() THEN 0
+                    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+                END::float
+            """)
+        else:
+            cursor.execute("SELECT 0")
+        return cursor.fetchone()[0]
+
+
+class ReplicaHealth:
+    """Whether the replica may serve reads, re-checked at most every ``REPLICA_CHECK_SECONDS``."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.checked_at = None
+        self.usable = False
+        self.lag = None
+
+    def is_usable(self):
+        now = time.monotonic()
+        if self.checked_at is None or now - self.checked_at >= settings.REPLICA_CHECK_SECONDS:
+            self.usable, self.lag = self._check()
+            self.checked_at = now
+        return self.usable
+
+    def _check(self):
+        try:
+            lag = measure_replica_lag(connections[REPLICA])
+        except DatabaseError as exc:
+            logger.warning("Replica unavailable, reading from the primary: %s", exc)
+            return False, None
+        if lag > settings.REPLICA_MAX_LAG_SECONDS:
+            logger.warning("Replica is %.1fs behind, reading from the primary", lag)
+            return False, lag
+        return True, lag
+
+
+replica_health = ReplicaHealth()
+
+
+def read_alias_for(request):
+    """The database that ``request`` should read reports from."""
+    if not replica_configured() or PIN_COOKIE in request.COOKIES:
+        return DEFAULT_DB_ALIAS
+    return REPLICA if replica_health.is_usable() else DEFAULT_DB_ALIAS
+
+
+def _bind_stream(response, alias):
+    """Read a streamed body from ``alias`` too; it is produced after the view has returned."""
+    if not response.streaming or getattr(response, 'file_to_stream', None) is not None:
+        return response
+    content = response.streaming_content
+
+    if response.is_async:
+        async def bound():
+            _read_alias.set(alias)
+            try:
+                async for chunk in content:
+                    yield chunk
+            finally:
+                _read_alias.set(None)
+    else:
+        def bound():
+            _read_alias.set(alias)
+            try:
+                yield from content
+            finally:
+                _read_alias.set(None)
+
+    response.streaming_content = bound()
+    return response
+
+
+def reads_from_replica(view):
+    """Run ``view`` (sync or async) with its ``books`` reads on the replica, when it is usable."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            alias = await sync_to_async(read_alias_for)(request)
+            token = _read_alias.set(alias)
+            try:
+                response = await view(request, *args, **kwargs)
+            finally:
+                _read_alias.reset(token)
+            return _bind_stream(response, alias)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            alias = read_alias_for(request)
+            token = _read_alias.set(alias)
+            try:
+                response = view(request, *args, **kwargs)
+            finally:
+                _read_alias.reset(token)
+            return _bind_stream(response, alias)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in REPLICA_APPS:
+            return _read_alias.get()
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Read your own writes: the rest of this request reads from the primary.
+        if _read_alias.get() == REPLICA:
+            _read_alias.set(DEFAULT_DB_ALIAS)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both databases hold the same rows.
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPLICA}:
+            return True
+        return None
@@ -0,0 +1,241 @@
+# myproject/middleware.py
+"""Per-request SQL and latency metrics, and read-your-writes pinning for the replica.
+
+``RequestMetricsMiddleware`` samples a share of requests
+(``REQUEST_METRICS_SAMPLE_RATE``). For each sampled request it records:
+
+* wall time, query count and total SQL time, across every database alias
+  and every thread the request uses. That covers ``sync_to_async`` and
+  the report query pool, which copy the request's context;
+* how often each distinct SQL string ran. A string that repeats
+  ``REQUEST_METRICS_N_PLUS_ONE_THRESHOLD`` times or more is reported as a
+  likely N+1.
+
+It then writes one JSON line to the ``myproject.requests`` logger, and adds
+a ``Server-Timing`` header that browser dev tools show next to the request.
+
+With ``PROMETHEUS_METRICS`` on, every request, sampled or not, is also
+counted in the ``books.metrics`` request and query histograms.
+
+Django emits parametrised SQL, so a query's shape is simply its SQL
+string. Each query of a sampled request costs one ``perf_counter`` pair and
+a dict update. An unsampled request only adds each query to its count and
+SQL time for Prometheus, and pays one ``ContextVar`` lookup per query when
+Prometheus is off too.
+
+Streaming responses (CSV and XLSX exports) run queries after the view has
+returned. Their ``Server-Timing`` therefore covers the time to the first
+byte, and the log line is written when the stream is exhausted.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from books.metrics import observe_request
+from myproject.db_router import PIN_COOKIE, replica_configured
+
+logger = logging.getLogger('myproject.requests')
+
+_current = ContextVar('request_metrics', default=None)
+
+SAFE_METHODS = {'GET', 'HEAD', 'OPTIONS', 'TRACE'}
+
+
+class RequestMetrics:
+    def __init__(self, sampled=True):
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.shapes = Counter()
+        self.shape_seconds = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def record(self, sql, seconds):
+        with self._lock:
+            self.queries += 1
+            self.sql_seconds += seconds
+            # Only sampled requests are logged, so only they need the N+1 breakdown.
+            if self.sampled:
+                self.shapes[sql] += 1
+                self.shape_seconds[sql] += seconds
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def repeated_shapes(self, threshold):
+        with self._lock:
+            return [
+                {'sql': sql[:300], 'count': count, 'sql_ms': round(self.shape_seconds[sql] * 1000, 2)}
+                for sql, count in self.shapes.most_common()
+                if count >= threshold
+            ]
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record(sql, time.perf_counter() - started)
+
+
+def _install(connection):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _install_on_new_connection(sender, connection, **kwargs):
+    # Pool and sync_to_async threads open their own connections.
+    _install(connection)
+
+
+connection_created.connect(_install_on_new_connection, dispatch_uid='request_metrics')
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.REQUEST_METRICS_SAMPLE_RATE
+        self.n_plus_one_threshold = settings.REQUEST_METRICS_N_PLUS_ONE_THRESHOLD
+        self.prometheus = settings.PROMETHEUS_METRICS
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _start(self):
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not (sampled or self.prometheus):
+            return None, None
+        for connection in connections.all(initialized_only=True):
+            _install(connection)
+        metrics = RequestMetrics(sampled)
+        return metrics, _current.set(metrics)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token = self._start()
+        if metrics is None:
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics, token = self._start()
+        if metrics is None:
+            return await self.get_response(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics)
+
+    # --------------------------------------------------
+    # 📝 Reporting
+    # --------------------------------------------------
+
+    def _finish(self, request, response, metrics):
+        if metrics.sampled:
+            response['Server-Timing'] = (
+                f'app;dur={metrics.elapsed_ms():.1f}, '
+                f'db;dur={metrics.sql_seconds * 1000:.1f};desc="{metrics.queries} queries"'
+            )
+        # A FileResponse may be sent by the server's file wrapper, which bypasses streaming_content.
+        if response.streaming and getattr(response, 'file_to_stream', None) is None:
+            self._report_after_stream(request, response, metrics)
+        else:
+            self._report(request, response, metrics)
+        return response
+
+    def _report_after_stream(self, request, response, metrics):
+        content = response.streaming_content
+
+        if response.is_async:
+            async def observed():
+                _current.set(metrics)
+                try:
+                    async for chunk in content:
+                        yield chunk
+                finally:
+                    # set(), not reset(): a stream closed early may finish in another context.
+                    _current.set(None)
+                    self._report(request, response, metrics)
+        else:
+            def observed():
+                _current.set(metrics)
+                try:
+                    yield from content
+                finally:
+                    _current.set(None)
+                    self._report(request, response, metrics)
+
+        response.streaming_content = observed()
+
+    def _report(self, request, response, metrics):
+        match = request.resolver_match
+        view = match.view_name if match else None
+        elapsed_ms = metrics.elapsed_ms()
+        if self.prometheus:
+            observe_request(
+                view, request.method, response.status_code, elapsed_ms / 1000, metrics.queries, metrics.sql_seconds,
+            )
+        if not metrics.sampled:
+            return
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'duration_ms': round(elapsed_ms, 2),
+            'db_ms': round(metrics.sql_seconds * 1000, 2),
+            'queries': metrics.queries,
+            'n_plus_one': metrics.repeated_shapes(self.n_plus_one_threshold),
+        }
+        logger.info(json.dumps(record))
+
+
+class ReplicaPinMiddleware:
+    """After a successful write, read this client's reports from the primary for ``REPLICA_PIN_SECONDS``.
+
+    See ``myproject.db_router``. Nothing is set unless a replica is configured.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._pin(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._pin(request, await self.get_response(request))
+
+    def _pin(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400 and replica_configured():
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
@@ -1,28 +1,344 @@
+# myproject/seed_expenses.py
+"""Deterministic synthetic data at production-like scales.
+
+    python -m myproject.seed_expenses --scale 10k
+    python -m myproject.seed_expenses --scale 1m --seed 7 --end-date 2025-06-30
+    python -m myproject.seed_expenses --expenses 250000
+
+The script loads users, authors, publishers, categories, expense types,
+books, expenses and tickets into the database named by the usual settings.
+The reference data grows with the number of expenses (see ``scale_sizes``).
+
+Each table draws from its own ``random.Random`` seeded with ``--seed`` and
+the table name, so the same seed, scale and end date always produce the
+same rows. The data is shaped to look real:
+
+* a few heavy users and bestselling books account for most expenses;
+* amounts are log-normal;
+* activity grows towards ``--end-date``;
+* tickets are mostly resolved, with the open ones spread over priorities.
+
+Expenses and tickets are written with multi-row inserts, or ``COPY`` on
+PostgreSQL, which skips the model signals. The rollups, spending summaries,
+dropdown facets and search index are therefore rebuilt once at the end.
+"""
+import argparse
+import csv
+import io
 import os
-import django
 import random
-from datetime import datetime, timedelta
-
-# Setup Django environment
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "myproject")
-django.setup()
-
-from expenses.models import Expense  # Adjust to match your app/model name
-
-# Sample categories
-categories = ["Food", "Transport", "Utilities", "Entertainment", "Health", "Misc"]
-
-# Generate random expenses
-def create_expenses(n=50):
-    for _ in range(n):
-        Expense.objects.create(
-            title=random.choice(["Lunch", "Uber", "Electricity Bill", "Movie", "Pharmacy", "Coffee"]),
-            amount=round(random.uniform(5, 100), 2),
-            category=random.choice(categories),
-            date=datetime.now() - timedelta(days=random.randint(0, 365)),
-            notes="Seeded data"
+import time
+from bisect import bisect
+from datetime import date, datetime, time as clock, timedelta
+from itertools import accumulate
+
+SCALES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+DEFAULT_SEED = 42
+DEFAULT_END_DATE = date(2025, 12, 31)
+HISTORY_DAYS = 5 * 365
+
+USERNAME_PREFIX = 'seed'
+
+FIRST_NAMES = [
+    'Ada', 'Bola', 'Chidi', 'Dara', 'Emeka', 'Funmi', 'Grace', 'Hassan', 'Ife', 'Jide', 'Kemi', 'Lara',
+    'Musa', 'Ngozi', 'Obi', 'Ola', 'Sade', 'Tunde', 'Uche', 'Yemi', 'Zainab', 'Maria', 'James', 'Wei',
+]
+LAST_NAMES = [
+    'Adeyemi', 'Bello', 'Chukwu', 'Danjuma', 'Eze', 'Fashola', 'Garba', 'Ibrahim', 'Johnson', 'Kalu',
+    'Lawal', 'Mohammed', 'Nwosu', 'Okafor', 'Okonkwo', 'Olawale', 'Smith', 'Usman', 'Williams', 'Zhang',
+]
+TITLE_WORDS = [
+    'Analytics', 'Business', 'Data', 'Strategy', 'Modern', 'Practical', 'Applied', 'Finance', 'Markets',
+    'Learning', 'Systems', 'Design', 'Leadership', 'Statistics', 'Economics', 'Networks', 'Models',
+    'Decisions', 'Growth', 'Risk', 'Accounting', 'Operations', 'Marketing', 'Insight', 'Methods',
+]
+SUBTITLES = [
+    '', '', 'An Introduction', 'A Practitioner\'s Guide', 'Theory and Practice', 'Second Edition',
+    'Concepts and Cases', 'A Hands-On Approach', 'Foundations',
+]
+CATEGORIES = [
+    'Business Analytics', 'Finance', 'Economics', 'Computer Science', 'Statistics', 'Marketing',
+    'Management', 'Accounting', 'Operations', 'Data Science', 'Law', 'Engineering', 'Health',
+    'Education', 'History', 'Fiction',
+]
+PUBLISHER_NAMES = [
+    'Springer', 'CRC Press', 'Wiley', 'Pearson', 'O\'Reilly', 'McGraw-Hill', 'Routledge', 'Elsevier',
+    'Cambridge University Press', 'Oxford University Press', 'Sage', 'Packt', 'Apress', 'Manning',
+]
+# (name, relative frequency)
+EXPENSE_TYPES = [
+    ('Printing', 30), ('Distribution', 25), ('Royalties', 12), ('Marketing', 10), ('Shipping', 9),
+    ('Editing', 6), ('Cover Design', 4), ('Translation', 2), ('Licensing', 2),
+]
+TICKET_SUBJECTS = [
+    'Invoice total does not match', 'Cannot export report', 'Duplicate expense recorded',
+    'Book missing from catalogue', 'Wrong category on book', 'Password reset email not received',
+    'Dashboard totals look wrong', 'Request for new expense type', 'Import failed halfway',
+]
+# (status, share); lower priority numbers are more urgent.
+TICKET_STATUSES = [('resolved', 60), ('in_progress', 15), ('open', 25)]
+TICKET_PRIORITIES = [(1, 5), (2, 20), (3, 55), (4, 20)]
+
+
+def scale_sizes(expenses):
+    """Row counts per table for ``expenses`` expenses."""
+    return {
+        'users': max(50, expenses // 200),
+        'authors': max(100, expenses // 500),
+        'publishers': len(PUBLISHER_NAMES),
+        'categories': len(CATEGORIES),
+        'expense_types': len(EXPENSE_TYPES),
+        'books': max(500, expenses // 50),
+        'expenses': expenses,
+        'tickets': max(100, expenses // 20),
+    }
+
+
+def _rng(seed, table):
+    return random.Random(f"{seed}:{table}")
+
+
+def _weighted(choices):
+    """A ``pick(rng)`` that returns one value of ``(value, weight)`` pairs in proportion to its weight."""
+    values = [value for value, _ in choices]
+    cumulative = list(accumulate(weight for _, weight in choices))
+    total = cumulative[-1]
+    return lambda rng: values[bisect(cumulative, rng.random() * total)]
+
+
+def _skewed(rng, count, power=2):
+    """An index in ``range(count)`` where low indices are far more likely: heavy users, bestsellers."""
+    return int(count * rng.random() ** power)
+
+
+# --------------------------------------------------
+# 📚 Reference data
+# --------------------------------------------------
+
+def _person(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def _ids(model, **filters):
+    return list(model.objects.filter(**filters).order_by('id').values_list('id', flat=True))
+
+
+def seed_reference_data(sizes, seed):
+    """Create users, authors, publishers, categories, expense types and books; return their ids."""
+    from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+    from django.contrib.auth.models import User
+    from books.models import Author, Book, Category, ExpenseType, Publisher
+
+    rng = _rng(seed, 'users')
+    users = []
+    for i in range(sizes['users']):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        username = f"{USERNAME_PREFIX}{seed}-{i:07d}"
+        users.append(User(
+            username=username, first_name=first, last_name=last, email=f"{username}@example.com",
+            password=f"{UNUSABLE_PASSWORD_PREFIX}seed",
+        ))
+    User.objects.bulk_create(users, batch_size=5000)
+
+    # Names are unique for these, so a second seed into the same database reuses them.
+    Category.objects.bulk_create([Category(name=name) for name in CATEGORIES], ignore_conflicts=True)
+    ExpenseType.objects.bulk_create([ExpenseType(name=name) for name, _ in EXPENSE_TYPES], ignore_conflicts=True)
+    existing = set(Publisher.objects.filter(name__in=PUBLISHER_NAMES).values_list('name', flat=True))
+    Publisher.objects.bulk_create([Publisher(name=name) for name in PUBLISHER_NAMES if name not in existing])
+
+    rng = _rng(seed, 'authors')
+    first_author = Author.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    Author.objects.bulk_create([Author(name=_person(rng)) for _ in range(sizes['authors'])], batch_size=5000)
+
+    type_ids = dict(ExpenseType.objects.values_list('name', 'id'))
+    ids = {
+        'users': _ids(User, username__startswith=f"{USERNAME_PREFIX}{seed}-"),
+        'authors': _ids(Author, id__gt=first_author),
+        'publishers': _ids(Publisher, name__in=PUBLISHER_NAMES),
+        'categories': _ids(Category, name__in=CATEGORIES),
+        # Same order as EXPENSE_TYPES, so the weights line up.
+        'expense_types': [type_ids[name] for name, _ in EXPENSE_TYPES],
+    }
+
+    rng = _rng(seed, 'books')
+    first_book = Book.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    books = []
+    for _ in range(sizes['books']):
+        books.append(Book(
+            title=' '.join(rng.sample(TITLE_WORDS, rng.randint(2, 4))),
+            subtitle=rng.choice(SUBTITLES),
+            author_id=ids['authors'][_skewed(rng, len(ids['authors']), power=2)],
+            category_id=ids['categories'][_skewed(rng, len(ids['categories']), power=2)],
+            publisher_id=rng.choice(ids['publishers']),
+            published_date=date(1990, 1, 1) + timedelta(days=rng.randrange(35 * 365)),
+            distribution_expense=f"{rng.uniform(0.5, 25):.2f}",
+        ))
+        if len(books) == 5000:
+            Book.objects.bulk_create(books)
+            books = []
+    Book.objects.bulk_create(books)
+    ids['books'] = _ids(Book, id__gt=first_book)
+    return ids
+
+
+# --------------------------------------------------
+# 🧾 Expenses and tickets
+# --------------------------------------------------
+
+def _insert_rows(table, columns, rows):
+    """Write ``rows`` (tuples of strings or ``None``) with ``COPY`` on PostgreSQL, else ``executemany``."""
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        else:
+            placeholders = ', '.join(['%s'] * len(columns))
+            cursor.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+
+
+def _timestamp(day, rng):
+    """A naive UTC timestamp string during ``day``; Django's connections run in UTC."""
+    return str(datetime.combine(day, clock()) + timedelta(seconds=rng.randrange(86_400)))
+
+
+def _recent_day(rng, end_date):
+    # Skewed towards end_date, so the history grows over time like a real ledger.
+    return end_date - timedelta(days=int(HISTORY_DAYS * rng.random() ** 1.6))
+
+
+def generate_expenses(ids, count, seed, end_date):
+    """Yield ``count`` expense rows for ``books_expense``."""
+    rng = _rng(seed, 'expenses')
+    users, books = ids['users'], ids['books']
+    expense_type = _weighted(list(zip(ids['expense_types'], (weight for _, weight in EXPENSE_TYPES))))
+    for _ in range(count):
+        day = _recent_day(rng, end_date)
+        created = _timestamp(day, rng)
+        amount = min(rng.lognormvariate(3.4, 1.1), 99_999.0) + 1
+        yield (
+            users[_skewed(rng, len(users))],
+            books[_skewed(rng, len(books))],
+            expense_type(rng),
+            f"{amount:.2f}",
+            day.isoformat(),
+            created,
+            created,
+        )
+
+
+def generate_tickets(ids, count, seed, end_date):
+    """Yield ``count`` ticket rows for ``books_ticket``."""
+    rng = _rng(seed, 'tickets')
+    users = ids['users']
+    # The first 2% of users act as support agents.
+    agents = users[:max(1, len(users) // 50)]
+    status = _weighted(TICKET_STATUSES)
+    priority = _weighted(TICKET_PRIORITIES)
+    for _ in range(count):
+        day = _recent_day(rng, end_date)
+        created = _timestamp(day, rng)
+        ticket_status = status(rng)
+        assigned = claimed = None
+        if ticket_status != 'open':
+            assigned = rng.choice(agents)
+            claimed = max(created, _timestamp(min(day + timedelta(days=rng.randint(0, 3)), end_date), rng))
+        subject = rng.choice(TICKET_SUBJECTS)
+        yield (
+            users[_skewed(rng, len(users), power=2)],
+            subject,
+            f"{subject}. Reported from the expense tracker.",
+            ticket_status,
+            priority(rng),
+            assigned,
+            claimed,
+            created,
+            claimed or created,
         )
-    print(f"✅ {n} expenses created.")
+
+
+EXPENSE_COLUMNS = ['user_id', 'book_id', 'expense_type_id', 'amount', 'date', 'created_at', 'updated_at']
+TICKET_COLUMNS = [
+    'user_id', 'subject', 'description', 'status', 'priority', 'assigned_to_id', 'claimed_at', 'created_at',
+    'updated_at',
+]
+
+
+def _load(table, columns, rows, total, batch_size, log):
+    from django.db import transaction
+
+    written = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            with transaction.atomic():
+                _insert_rows(table, columns, batch)
+            written += len(batch)
+            batch = []
+            log(f"  {table}: {written:,}/{total:,}")
+    if batch:
+        with transaction.atomic():
+            _insert_rows(table, columns, batch)
+
+
+# --------------------------------------------------
+# 🌱 Entry points
+# --------------------------------------------------
+
+def seed(expenses, seed=DEFAULT_SEED, end_date=DEFAULT_END_DATE, batch_size=50_000, log=print):
+    """Load a full data set with ``expenses`` expenses; return the row counts per table."""
+    from django.contrib.auth.models import User
+    from books.report_cache import bump_data_version
+    from books.rollups import rebuild_monthly_rollups
+    from books.search import reindex_books
+
+    if User.objects.filter(username__startswith=f"{USERNAME_PREFIX}{seed}-").exists():
+        raise ValueError(f"This database already holds seed {seed}; use another --seed or a fresh database.")
+
+    sizes = scale_sizes(expenses)
+    started = time.perf_counter()
+    ids = seed_reference_data(sizes, seed)
+    log(f"  reference data: {sizes['users']:,} users, {sizes['books']:,} books")
+    _load('books_expense', EXPENSE_COLUMNS, generate_expenses(ids, expenses, seed, end_date),
+          expenses, batch_size, log)
+    _load('books_ticket', TICKET_COLUMNS, generate_tickets(ids, sizes['tickets'], seed, end_date),
+          sizes['tickets'], batch_size, log)
+
+    log("  rebuilding rollups, spending summaries, facets and the search index")
+    rebuild_monthly_rollups()
+    reindex_books()
+    bump_data_version()
+    sizes['seconds'] = round(time.perf_counter() - started, 2)
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument('--scale', choices=SCALES, default='10k')
+    size.add_argument('--expenses', type=int, help='Any number of expenses instead of a named scale')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--end-date', type=date.fromisoformat, default=DEFAULT_END_DATE,
+                        help='Date of the newest expense (default %(default)s)')
+    parser.add_argument('--batch-size', type=int, default=50_000, help='Rows per INSERT or COPY batch')
+    args = parser.parse_args()
+
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
+    django.setup()
+
+    expenses = args.expenses or SCALES[args.scale]
+    try:
+        sizes = seed(expenses, args.seed, args.end_date, args.batch_size)
+    except ValueError as exc:
+        raise SystemExit(f"❌ {exc}")
+    print(f"✅ Seeded {sizes['expenses']:,} expenses and {sizes['tickets']:,} tickets in {sizes['seconds']:.2f}s.")
+
 
 if __name__ == "__main__":
-    create_expenses()
+    main()
@@ -1,8 +1,9 @@
 from pathlib import Path
 import os
+import sys
 from dotenv import load_dotenv
 import dj_database_url
-from decouple import config
+from decouple import Csv, config
 
 # 📦 Load environment variables
 load_dotenv()
@@ -13,6 +14,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # 🔐 Security
 SECRET_KEY = config('SECRET_KEY')
 DEBUG = config('DEBUG', default=False, cast=bool)
+# "manage.py test"; used to keep per-request log lines out of the test output.
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
 
 ALLOWED_HOSTS = [
     'bookwise-expense-tracker-16.onrender.com',
@@ -39,6 +42,7 @@ INSTALLED_APPS = [
 
 # ⚙️ Middleware
 MIDDLEWARE = [
+    'myproject.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -47,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'myproject.middleware.ReplicaPinMiddleware',
 ]
 
 # 🌐 URL config
@@ -75,10 +80,107 @@ DATABASES = {
     'default': dj_database_url.config(
         default=f"postgres://{config('DATABASE_USER')}:{config('DATABASE_PASSWORD')}@{config('DATABASE_HOST')}:{config('DATABASE_PORT')}/{config('DATABASE_NAME')}",
         conn_max_age=600,
-        ssl_require=True
+        ssl_require=config('DATABASE_SSL_REQUIRE', default=True, cast=bool)
     )
 }
 
+# 🧩 Expense shards
+# Set SHARD_DATABASE_URLS (comma-separated) to spread expenses and tickets over default plus
+# these databases, one user per shard (books.sharding). Run "manage.py migrate --database shardN"
+# for each, and "manage.py rebalance_shards" to copy reference data and even out the shards.
+SHARD_DATABASE_URLS = config('SHARD_DATABASE_URLS', default='', cast=Csv())
+for number, url in enumerate(SHARD_DATABASE_URLS, start=1):
+    DATABASES[f'shard{number}'] = dj_database_url.parse(
+        url,
+        conn_max_age=600,
+        ssl_require=config('DATABASE_SSL_REQUIRE', default=True, cast=bool)
+    )
+EXPENSE_SHARDS = ['default', *(f'shard{number}' for number in range(1, len(SHARD_DATABASE_URLS) + 1))]
+
+# 📖 Read replica
+# Set REPLICA_DATABASE_URL to serve report and export reads from a replica (myproject.db_router).
+# Reads fall back to the primary while the replica is down or more than REPLICA_MAX_LAG_SECONDS
+# behind (checked every REPLICA_CHECK_SECONDS), and for REPLICA_PIN_SECONDS after a client's own write.
+REPLICA_DATABASE_URL = config('REPLICA_DATABASE_URL', default='')
+if REPLICA_DATABASE_URL:
+    DATABASES['replica'] = dj_database_url.parse(
+        REPLICA_DATABASE_URL,
+        conn_max_age=600,
+        ssl_require=config('DATABASE_SSL_REQUIRE', default=True, cast=bool)
+    )
+    # Tests run against the primary's test database only.
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+DATABASE_ROUTERS = ['books.sharding.ShardRouter', 'myproject.db_router.ReplicaRouter']
+REPLICA_MAX_LAG_SECONDS = config('REPLICA_MAX_LAG_SECONDS', default=10, cast=float)
+REPLICA_CHECK_SECONDS = config('REPLICA_CHECK_SECONDS', default=5, cast=float)
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=15, cast=int)
+
+
+# 🧠 Cache
+# Report results are cached per filter combination and data version. Point
+# REPORT_CACHE_BACKEND at a shared backend (e.g. Redis) to share hits across workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'default',
+    },
+    'reports': {
+        'BACKEND': config('REPORT_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('REPORT_CACHE_LOCATION', default='reports'),
+        'TIMEOUT': config('REPORT_CACHE_TIMEOUT', default=3600, cast=int),
+    },
+}
+REPORT_CACHE_ALIAS = 'reports'
+
+
+# ⚡ ASGI profile
+# myproject/asgi.py switches ASYNC_REPORTS on, routing the report and export URLs
+# to async views that run their queries concurrently on REPORT_QUERY_WORKERS threads.
+ASYNC_REPORTS = config('ASYNC_REPORTS', default=False, cast=bool)
+REPORT_QUERY_WORKERS = config('REPORT_QUERY_WORKERS', default=8, cast=int)
+
+
+# 📤 Background exports
+# With EXPORT_JOBS on, the row-level CSV/XLSX exports queue an ExportJob and send the browser
+# to a page that polls it, instead of writing the file inside the request. Run
+# "manage.py run_export_worker" (as many as you like) next to the web process; it writes
+# files to EXPORT_JOB_DIR, which the web process must be able to read. Workers that go
+# EXPORT_JOB_STALE_SECONDS without a heartbeat lose their job to another worker, up to
+# EXPORT_JOB_MAX_ATTEMPTS tries. Finished files are deleted after EXPORT_JOB_RETAIN_HOURS.
+EXPORT_JOBS = config('EXPORT_JOBS', default=False, cast=bool)
+EXPORT_JOB_DIR = config('EXPORT_JOB_DIR', default=str(BASE_DIR / 'exports'))
+EXPORT_JOB_STALE_SECONDS = config('EXPORT_JOB_STALE_SECONDS', default=300, cast=int)
+EXPORT_JOB_MAX_ATTEMPTS = config('EXPORT_JOB_MAX_ATTEMPTS', default=3, cast=int)
+EXPORT_JOB_RETAIN_HOURS = config('EXPORT_JOB_RETAIN_HOURS', default=24, cast=int)
+
+
+# 📏 Request metrics
+# myproject.middleware.RequestMetricsMiddleware logs query count, SQL time and wall time
+# as one JSON line per sampled request (logger "myproject.requests") and sets Server-Timing.
+# The default samples 1% of requests; set the rate to 0 to switch it off, or to 1 to measure
+# everything. SQL strings repeated at least the threshold number of times in one request are
+# reported as likely N+1 queries.
+REQUEST_METRICS_SAMPLE_RATE = config('REQUEST_METRICS_SAMPLE_RATE', default=0.01, cast=float)
+REQUEST_METRICS_N_PLUS_ONE_THRESHOLD = config('REQUEST_METRICS_N_PLUS_ONE_THRESHOLD', default=5, cast=int)
+
+
+# 📊 Prometheus metrics
+# /metrics serves request, query, export and report-cache metrics. Set
+# PROMETHEUS_MULTIPROC_DIR (gunicorn.conf.py does) to sum them across worker processes,
+# and METRICS_TOKEN to require "Authorization: Bearer <token>" from the scraper. Without a
+# token /metrics answers 404 unless DEBUG is on.
+PROMETHEUS_METRICS = config('PROMETHEUS_METRICS', default=True, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+
+# 🗓️ Expense partitioning (PostgreSQL)
+# "manage.py partition_expenses --convert" turns books_expense into monthly range partitions
+# on date (books.partitions). Run "manage.py partition_expenses" daily to create the next
+# EXPENSE_PARTITION_MONTHS_AHEAD months and, if EXPENSE_PARTITION_RETAIN_MONTHS is set, to
+# move older months to the expense_archive schema.
+EXPENSE_PARTITION_MONTHS_AHEAD = config('EXPENSE_PARTITION_MONTHS_AHEAD', default=3, cast=int)
+EXPENSE_PARTITION_RETAIN_MONTHS = config('EXPENSE_PARTITION_RETAIN_MONTHS', default=0, cast=int)
+
 
 # 📧 Email Configuration
 EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
@@ -127,9 +229,20 @@ LOGGING = {
         'console': {
             'class': 'logging.StreamHandler',
         },
+        'null': {
+            'class': 'logging.NullHandler',
+        },
     },
     'root': {
         'handlers': ['console'],
         'level': 'INFO', # Set a reasonable default level
     },
+    'loggers': {
+        # One JSON object per line from RequestMetricsMiddleware; kept out of the test output.
+        'myproject.requests': {
+            'handlers': ['null'] if TESTING else ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
 }
\ No newline at end of file